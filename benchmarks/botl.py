@@ -0,0 +1,59 @@
+"""Time to parse the two bottom lines of a frame with the full regular expressions (as update_attrs/update_stats used to,
+including the deepcopy of the previous values) vs. the bottom-line parser in gym_nethack/botl.py.
+
+The corpus is generated in the layout of the bottom lines sent by NetHack (every role title, 18/xx strengths,
+negative AC, and status effects in and out of the expected order), padded to the width of the screen.
+Both parsers are first checked to give the same result on every line.
+
+Usage (from the repo root): python3 -m benchmarks.botl [NUM_LINES]
+"""
+
+import sys, time, random
+from copy import deepcopy
+
+from gym_nethack.nhdata import NH_ROLE_TITLES, COLNO
+from gym_nethack.botl import parse_attributes, parse_stats, parse_attributes_regex, parse_stats_regex, STATUS_EFFECT_FIELDS
+
+def make_corpus(num_lines, seed=0):
+    rng = random.Random(seed)
+    titles = [title for role, titles in NH_ROLE_TITLES for title in titles]
+    effects = [word for key, words in STATUS_EFFECT_FIELDS for word in words]
+    corpus = []
+    for _ in range(num_lines):
+        st = str(rng.randint(3, 18)) if rng.random() < 0.8 else "18/" + str(rng.randint(1, 99)).zfill(2)
+        stats = [rng.randint(3, 25) for _ in range(5)]
+        attr_line = "Agent the {:<18}St:{} Dx:{} Co:{} In:{} Wi:{} Ch:{} S:{} I:{} {}".format(rng.choice(titles), st, *stats, rng.randint(0, 999), rng.randint(0, 9), rng.choice(["Neutral", "Chaotic", "Lawful"]))
+        hp_max, pw_max = rng.randint(10, 200), rng.randint(0, 100)
+        status = [word for key, words in STATUS_EFFECT_FIELDS if rng.random() < 0.15 for word in [rng.choice(words)]]
+        if rng.random() < 0.05:
+            status = rng.sample(effects, 2) # out of order
+        stat_line = "Dlvl:{} \\Au:{} HP:{}({}) Pw:{}({}) AC:{} R:{} SD:{} Exp:{} {}".format(rng.randint(1, 50), rng.randint(0, 5000), rng.randint(0, hp_max), hp_max, rng.randint(0, pw_max), pw_max, rng.randint(-20, 10), rng.randint(1, 9), rng.randint(0, 5), rng.randint(1, 30), " ".join(status))
+        corpus.append((attr_line.ljust(COLNO), stat_line.ljust(COLNO)))
+    return corpus
+
+def regex_step(lines, prev):
+    attributes, stats = prev
+    attr_line, stat_line = lines
+    return (dict(parse_attributes_regex(attr_line)), deepcopy(attributes)), (dict(parse_stats_regex(stat_line)), deepcopy(stats))
+
+def botl_step(lines, prev):
+    attributes, stats = prev
+    attr_line, stat_line = lines
+    return (parse_attributes(attr_line), attributes), (parse_stats(stat_line), stats)
+
+def measure(step, corpus):
+    prev = ({}, {})
+    start = time.perf_counter()
+    for lines in corpus:
+        (attributes, _), (stats, _) = step(lines, prev)
+        prev = (attributes, stats)
+    return (time.perf_counter() - start) / len(corpus) * 1e6
+
+if __name__ == '__main__':
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    corpus = make_corpus(num_lines)
+    for attr_line, stat_line in corpus:
+        assert parse_attributes(attr_line) == parse_attributes_regex(attr_line), attr_line
+        assert parse_stats(stat_line) == parse_stats_regex(stat_line), stat_line
+    for name, step in [('regex + deepcopy', regex_step), ('botl', botl_step)]:
+        print("{:16}: {:.1f}us per frame".format(name, measure(step, corpus)))
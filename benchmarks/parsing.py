@@ -0,0 +1,372 @@
+"""Throughput and allocations of the parsing layer: unpack_msg(), update_attrs(), update_stats(), get_inventory(), Room construction,
+and NetHackInfo.process_msg() end to end (fed through a stub socket that answers the inventory requests, so that no NetHack process is needed).
+
+The corpus in benchmarks/corpus/ has one file per scenario (combat, exploration, level, fog, hallucination, engulfed), each a gzipped
+sequence of (frame, inventory reply) records. The frames of <scenario>.frames.gz are recorded from real games of NetHack, played by
+the scripted agents of benchmarks/record.py, and converted to the layout of the frames sent by the modified NetHack (see that script
+for what the conversion cannot reproduce).
+
+As a supplement, <scenario>.synthetic.frames.gz has synthetic frames, generated by this script in the same layout from random levels
+of rooms and corridors walked through by the player, with the top lines, status effects and map features of each scenario (fog clouds,
+hallucinated monsters, the engulfing monster's box, runs of identical frames while searching, ...). Both are timed.
+
+Usage (from the repo root):
+    python3 -m benchmarks.parsing [NUM_REPEATS]    time each function on the corpus
+    python3 -m benchmarks.parsing make             regenerate the synthetic frames (python3 -m benchmarks.record records the others)
+"""
+
+import sys, os, gzip, struct, time, random, tracemalloc, contextlib
+from collections import deque
+
+from gym_nethack.nhdata import ROWNO, COLNO
+from gym_nethack.nhutil import unpack_msg, parse_status, update_attrs, update_stats, get_inventory, Room
+from gym_nethack.conn import decode_msg
+from gym_nethack.misc import VERBOSE
+from gym_nethack.envs.base import NetHackInfo
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+SCENARIOS = ['combat', 'exploration', 'level', 'fog', 'hallucination', 'engulfed']
+RECORD = struct.Struct("=II") # lengths of the frame and inventory reply that follow
+FRAMES_PER_SCENARIO = 300
+
+ROOM_GLYPH, DOORWAY_GLYPH, CORRIDOR_GLYPH = 2380, 2377, 2386
+PASSABLE = set('.+#<>{')
+MONSTERS = 'dxrFkjnGh'
+ITEMS = ')[%?!/=*('
+HALLU_NAMES = ['Oliphant', 'Totoro', 'grue', 'Smokey Bear', 'Luggage', 'Invid', 'pterodactyl', 'Wiggler']
+INVENTORY = ["a +1 long sword (weapon in hand)", "an uncursed +0 ring mail (being worn)", "a blessed +2 leather cloak (being worn)", "3 uncursed food rations",
+             "2 uncursed potions of healing", "12 +0 daggers (in quiver)", "an uncursed wand of striking (0:5)", "a +1 bow (alternate weapon; not wielded)"]
+
+class Level(object):
+    """Random level of rooms joined by corridors, in the characters of the NetHack map."""
+    def __init__(self, rng, max_rooms=6):
+        self.cells = [[' '] * COLNO for _ in range(ROWNO)]
+        self.rooms = []
+        slot_width = COLNO // max_rooms
+        for slot in range(max_rooms):
+            width, height = rng.randint(5, slot_width - 3), rng.randint(4, 7)
+            left = slot * slot_width + rng.randint(1, slot_width - width - 1)
+            top = rng.randint(1, ROWNO - height - 2)
+            self.rooms.append((top, left, top + height, left + width))
+            for i in range(top, top + height + 1):
+                for j in range(left, left + width + 1):
+                    self.cells[i][j] = '|' if j in (left, left + width) else '-' if i in (top, top + height) else '.'
+        for (top1, left1, bottom1, right1), (top2, left2, bottom2, right2) in zip(self.rooms, self.rooms[1:]):
+            row1, row2 = rng.randint(top1 + 1, bottom1 - 1), rng.randint(top2 + 1, bottom2 - 1)
+            self.cells[row1][right1] = rng.choice('+.')
+            self.cells[row2][left2] = rng.choice('+.')
+            turn = rng.randint(right1 + 1, left2 - 1)
+            for j in range(right1 + 1, turn + 1):
+                self.cells[row1][j] = '#'
+            for i in range(min(row1, row2), max(row1, row2) + 1):
+                self.cells[i][turn] = '#'
+            for j in range(turn, left2):
+                self.cells[row2][j] = '#'
+        self.upstairs = self.random_floor(rng, self.rooms[0])
+        self.downstairs = self.random_floor(rng, self.rooms[-1])
+        self.cells[self.upstairs[0]][self.upstairs[1]] = '<'
+        self.cells[self.downstairs[0]][self.downstairs[1]] = '>'
+        fountain = self.random_floor(rng, rng.choice(self.rooms[1:-1]))
+        self.cells[fountain[0]][fountain[1]] = '{'
+    
+    def random_floor(self, rng, room):
+        top, left, bottom, right = room
+        while True:
+            pos = (rng.randint(top + 1, bottom - 1), rng.randint(left + 1, right - 1))
+            if self.cells[pos[0]][pos[1]] == '.':
+                return pos
+    
+    def get_room(self, pos):
+        for room in self.rooms:
+            top, left, bottom, right = room
+            if top <= pos[0] <= bottom and left <= pos[1] <= right:
+                return room
+        return None
+    
+    def get_glyph(self, pos):
+        char = self.cells[pos[0]][pos[1]]
+        return CORRIDOR_GLYPH if char == '#' else DOORWAY_GLYPH if self.get_room(pos) is not None and char in '+.' and pos[1] in self.get_room(pos)[1::2] else ROOM_GLYPH
+    
+    def get_seen(self, pos):
+        # cells seen from the given position: the whole room if in one (lit rooms), and the adjacent cells.
+        seen = set()
+        room = self.get_room(pos)
+        if room is not None:
+            top, left, bottom, right = room
+            seen.update((i, j) for i in range(top, bottom + 1) for j in range(left, right + 1))
+        seen.update((pos[0] + dx, pos[1] + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if 0 <= pos[0] + dx < ROWNO and 0 <= pos[1] + dy < COLNO)
+        return seen
+    
+    def walk(self, start, goal):
+        # shortest path (4-connected) from start to goal through passable cells, not including start.
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            pos = queue.popleft()
+            if pos == goal:
+                break
+            for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                npos = (pos[0] + dx, pos[1] + dy)
+                if 0 <= npos[0] < ROWNO and 0 <= npos[1] < COLNO and npos not in parents and self.cells[npos[0]][npos[1]] in PASSABLE:
+                    parents[npos] = pos
+                    queue.append(npos)
+        path = []
+        while goal != start:
+            path.append(goal)
+            goal = parents[goal]
+        return path[::-1]
+    
+    def tour(self, rng):
+        # path visiting every room in turn, from the up staircase to the down staircase.
+        path, pos = [], self.upstairs
+        for room in self.rooms[1:-1] + [None]:
+            goal = self.downstairs if room is None else self.random_floor(rng, room)
+            path.extend(self.walk(pos, goal))
+            pos = goal
+        return path
+
+class Status(object):
+    """Bottom lines of the player, in the layout of botl.c."""
+    def __init__(self, rng):
+        self.hp_max = rng.randint(12, 60)
+        self.hp = self.hp_max
+        self.dlvl = rng.randint(1, 10)
+        self.effects = []
+    
+    def get_lines(self):
+        attr_line = "Agent the Stripling  St:18/50 Dx:13 Co:17 In:8 Wi:9 Ch:7 S:0 I:0 Neutral"
+        stat_line = "Dlvl:{} \\Au:{} HP:{}({}) Pw:2(2) AC:4 R:5 SD:1 Exp:3 {}".format(self.dlvl, 40, self.hp, self.hp_max, " ".join(self.effects))
+        return attr_line.ljust(COLNO) + stat_line.ljust(COLNO)
+
+def make_frame(rows, pos, status, top_line, glyph):
+    cells = [row[:] for row in rows]
+    cells[pos[0]][pos[1]] = '@'
+    map_str = ''.join(''.join(row) for row in cells)
+    tail = "{}-{}".format(pos[1], pos[0]).ljust(9, '\x00') + str(glyph) + '\x00\x00'
+    return (map_str + status.get_lines() + "--" + top_line + "**" + tail).encode("ISO-8859-1")
+
+def make_inventory(names):
+    return ("--" + "--".join("{},{}".format(name, chr(ord('a') + i)) for i, name in enumerate(names)) + "--").encode("ISO-8859-1")
+
+def render(level, seen, overlays):
+    rows = [[level.cells[i][j] if (i, j) in seen else ' ' for j in range(COLNO)] for i in range(ROWNO)]
+    for (i, j), char in overlays.items():
+        if (i, j) in seen:
+            rows[i][j] = char
+    return rows
+
+def make_walk(rng, num_frames, num_monsters, search_prob, hallucinating=False, fog=False):
+    # the player walks through the level; monsters and items are scattered in the rooms, and the player stops to search now and then.
+    level, status = Level(rng), Status(rng)
+    if hallucinating:
+        status.effects = ['Hallu']
+    items = {level.random_floor(rng, rng.choice(level.rooms)): rng.choice(ITEMS) for _ in range(rng.randint(4, 12))}
+    monsters = [level.random_floor(rng, rng.choice(level.rooms)) for _ in range(num_monsters)]
+    inventory = make_inventory(INVENTORY)
+    seen, records, path = set(), [], level.tour(rng)
+    for step, pos in enumerate(path):
+        seen |= level.get_seen(pos)
+        monsters = [m if rng.random() < 0.5 else rng.choice(level.walk(m, rng.choice(monsters)) or [m]) for m in monsters]
+        overlays = dict(items)
+        overlays.update((m, rng.choice(MONSTERS) if hallucinating else 'd') for m in monsters)
+        if hallucinating:
+            overlays.update((i, rng.choice(ITEMS)) for i in items)
+        rows = render(level, seen, overlays)
+        top_line = ""
+        if fog and rng.random() < 0.6:
+            for i in range(max(0, pos[0] - 2), min(ROWNO, pos[0] + 3)):
+                for j in range(max(0, pos[1] - 3), min(COLNO, pos[1] + 4)):
+                    rows[i][j] = '#'
+            top_line = "You are laden with moisture." if rng.random() < 0.5 else ""
+        elif pos in items:
+            top_line = "You see here a {}.".format("+0 dagger" if items[pos] == ')' else "food ration")
+        elif hallucinating and rng.random() < 0.2:
+            top_line = "You hear the {} howl.".format(rng.choice(HALLU_NAMES))
+        for _ in range(rng.randint(2, 8) if rng.random() < search_prob else 1):
+            records.append((make_frame(rows, pos, status, top_line, level.get_glyph(pos)), inventory))
+            top_line = ""
+    return records[:num_frames]
+
+def make_combat(rng, num_frames, hallucinating=False, engulfed=False):
+    # the player stands in a room and fights the monsters coming at it, throwing daggers now and then.
+    level, status = Level(rng), Status(rng)
+    if hallucinating:
+        status.effects = ['Hallu']
+    room = level.rooms[rng.randrange(len(level.rooms))]
+    pos = level.random_floor(rng, room)
+    seen = level.get_seen(pos)
+    items = {level.random_floor(rng, room): rng.choice(ITEMS) for _ in range(rng.randint(2, 6))}
+    monster, name = level.random_floor(rng, room), 'jackal'
+    num_daggers, swallowed, records = 12, 0, []
+    while len(records) < num_frames:
+        if monster is None:
+            monster, name = level.random_floor(rng, room), rng.choice(['jackal', 'newt', 'kobold', 'fog cloud'])
+        step = level.walk(monster, pos)
+        if len(step) > 1:
+            monster = step[0]
+            top_line = "You hear some noises." if rng.random() < 0.1 else ""
+        elif engulfed and name == 'fog cloud' and swallowed == 0:
+            swallowed = rng.randint(3, 8)
+            top_line = "The fog cloud engulfs you!"
+        elif rng.random() < 0.3:
+            monster = None
+            items[step[0] if step else pos] = '%'
+            top_line = "You kill the {}!".format(rng.choice(HALLU_NAMES) if hallucinating else name)
+        else:
+            if rng.random() < 0.3:
+                status.hp = max(1, status.hp - rng.randint(1, 4))
+            top_line = rng.choice(["You hit the {}!", "You miss the {}.", "The {} bites!", "The {} misses!"]).format(rng.choice(HALLU_NAMES) if hallucinating else name)
+        if rng.random() < 0.1 and num_daggers > 1:
+            num_daggers -= 1
+            items[level.random_floor(rng, room)] = ')'
+        overlays = dict(items)
+        if monster is not None:
+            overlays[monster] = rng.choice(MONSTERS) if hallucinating else name[0]
+        if hallucinating:
+            overlays.update((i, rng.choice(ITEMS)) for i in items)
+        if swallowed > 0:
+            swallowed -= 1
+            if swallowed == 0:
+                monster, top_line = None, "You get expelled from the fog cloud!"
+            rows = [[' '] * COLNO for _ in range(ROWNO)]
+            for (dx, dy), char in zip([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], '/-\\|@|\\-/'):
+                rows[pos[0] + dx][pos[1] + dy] = char
+            if swallowed > 0 and not top_line:
+                top_line = "You hit the fog cloud." if rng.random() < 0.7 else "You are laden with moisture."
+        else:
+            rows = render(level, seen, overlays)
+        names = INVENTORY[:5] + ["{} +0 daggers (in quiver)".format(num_daggers)] + INVENTORY[6:]
+        records.append((make_frame(rows, pos, status, top_line, level.get_glyph(pos)), make_inventory(names)))
+    return records
+
+def make_scenario(name, num_frames, seed=0):
+    rng = random.Random(seed)
+    records = []
+    while len(records) < num_frames:
+        if name == 'combat':
+            records.extend(make_combat(rng, num_frames // 4))
+        elif name == 'exploration':
+            records.extend(make_walk(rng, num_frames, 0, 0.15))
+        elif name == 'level':
+            records.extend(make_walk(rng, num_frames, 4, 0.05))
+        elif name == 'fog':
+            records.extend(make_walk(rng, num_frames, 1, 0.05, fog=True))
+        elif name == 'hallucination':
+            records.extend(make_walk(rng, num_frames // 2, 3, 0.05, hallucinating=True) + make_combat(rng, num_frames // 2, hallucinating=True))
+        elif name == 'engulfed':
+            records.extend(make_combat(rng, num_frames // 2, engulfed=True))
+    return records[:num_frames]
+
+def get_corpus_fname(name, synthetic=False):
+    return os.path.join(CORPUS_DIR, name + (".synthetic" if synthetic else "") + ".frames.gz")
+
+def save_corpus(name, records, synthetic=False):
+    with gzip.open(get_corpus_fname(name, synthetic), 'wb') as corpus_file:
+        for frame, inventory in records:
+            corpus_file.write(RECORD.pack(len(frame), len(inventory)) + frame + inventory)
+
+def load_corpus(name, synthetic=False):
+    with gzip.open(get_corpus_fname(name, synthetic), 'rb') as corpus_file:
+        data = corpus_file.read()
+    records, offset = [], 0
+    while offset < len(data):
+        frame_len, inventory_len = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        records.append((data[offset:offset+frame_len], data[offset+frame_len:offset+frame_len+inventory_len]))
+        offset += frame_len + inventory_len
+    return records
+
+class StubSocket(object):
+    """Stands in for the socket connected to NetHack: answers every request (the inventory command) with the current inventory reply."""
+    def __init__(self):
+        self.reply = b""
+    
+    def send(self, data, flags=0):
+        pass
+    
+    def recv(self, flags=0):
+        return self.reply
+
+def traced(func, *args):
+    # calls func, returning the memory allocated at its peak (bytes).
+    tracemalloc.reset_peak()
+    current = tracemalloc.get_traced_memory()[0]
+    func(*args)
+    return tracemalloc.get_traced_memory()[1] - current
+
+def measure(func, calls, num_repeats):
+    # returns the mean time (us) and memory allocated at peak (KB) per call.
+    start = time.perf_counter()
+    for _ in range(num_repeats):
+        for args in calls:
+            func(*args)
+    elapsed = (time.perf_counter() - start) / (num_repeats * len(calls)) * 1e6
+    
+    tracemalloc.start()
+    peak = sum(traced(func, *args) for args in calls)
+    tracemalloc.stop()
+    return elapsed, peak / len(calls) / 1024
+
+def measure_processing(records, num_repeats):
+    # NetHackInfo.process_msg() on every frame of a scenario, in order, and Room() on the frames after which the player is in a room
+    # (Room() reads the state of the info object). Returns the same as measure() for both.
+    socket = StubSocket()
+    times, peaks, counts = [0, 0], [0, 0], [0, 0]
+    for repeat in range(num_repeats + 1):
+        tracing = repeat == num_repeats # last pass: allocations only
+        if tracing:
+            tracemalloc.start()
+        nh = NetHackInfo(parse_items=True)
+        nh.reset()
+        for frame, inventory in records:
+            socket.reply = inventory
+            message = decode_msg(frame)
+            calls = [(0, lambda: nh.process_msg(socket, message, parse_ammo=True))]
+            for i, call in calls:
+                if tracing:
+                    peaks[i] += traced(call)
+                else:
+                    start = time.perf_counter()
+                    call()
+                    times[i] += time.perf_counter() - start
+                    counts[i] += 1
+                if i == 0 and nh.base_map is not None and nh.in_room():
+                    calls.append((1, lambda: Room(nh)))
+        if tracing:
+            tracemalloc.stop()
+    return [(times[i] / counts[i] * 1e6, peaks[i] / (counts[i] / num_repeats) / 1024) if counts[i] > 0 else None for i in range(2)]
+
+def time_scenario(name, num_repeats, synthetic=False):
+    records = load_corpus(name, synthetic)
+    frames = [decode_msg(frame) for frame, _ in records]
+    base_map = unpack_msg(frames[0], None)[0]
+    statuses = [parse_status(frame) for frame in frames]
+    process_msg_result, room_result = measure_processing(records, num_repeats)
+    results = [
+        ('unpack_msg', measure(unpack_msg, [(frame, base_map) for frame in frames], num_repeats)),
+        ('update_attrs', measure(update_attrs, [(status[0], None) for status in statuses], num_repeats)),
+        ('update_stats', measure(update_stats, [(status[1], None) for status in statuses], num_repeats)),
+        ('get_inventory', measure(get_inventory, [(None, decode_msg(inventory)) for _, inventory in records], num_repeats)),
+        ('process_msg', process_msg_result),
+        ('Room', room_result),
+    ]
+    return [(func_name, result) for func_name, result in results if result is not None]
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'make':
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        for seed, name in enumerate(SCENARIOS):
+            save_corpus(name, make_scenario(name, FRAMES_PER_SCENARIO, seed), synthetic=True)
+            print("Wrote", get_corpus_fname(name, synthetic=True))
+        sys.exit()
+    
+    num_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    if VERBOSE:
+        print("(VERBOSE is set in gym_nethack/misc.py: its output is discarded, but still counted in the process_msg times.)")
+    print("{:14} {:10} {:14} {:>10} {:>12} {:>14}".format("scenario", "frames", "function", "us/call", "calls/s", "peak KB/call"))
+    for synthetic in (False, True):
+        for name in SCENARIOS:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                results = time_scenario(name, num_repeats, synthetic)
+            for func_name, (elapsed, peak) in results:
+                print("{:14} {:10} {:14} {:10.1f} {:12.0f} {:14.1f}".format(name, "synthetic" if synthetic else "recorded", func_name, elapsed, 1e6 / elapsed, peak))
@@ -0,0 +1,133 @@
+"""Time of A* pathfinding (libs/astar.py) with the original implementation (astar_reference) vs. the array-based one (astar),
+on the pathfinding grids of the frames recorded in benchmarks/corpus (see benchmarks/parsing.py).
+
+For a sample of frames, paths are searched from the player to random passable cells and to random walls (made traversable, like
+pathfind_to(override_target_traversability=True) does), with and without the explored positions preference, and in 4-connected mode.
+Both implementations are first checked to return the same path for every query.
+
+Then, the distances from the player to all targets of a frame (like the distances to the frontiers computed every turn) are
+computed with one A* search per target vs. one distance field (libs.astar.DistanceField) per frame. NetHackInfo.get_path_length(),
+which the policies use for these distances, is first checked to give the step counts of A* with the default config, and the same
+costs with the distance field; how many of its step counts then differ from A*'s (the 'distance_field' option changes them) is reported.
+
+Usage (from the repo root): python3 -m benchmarks.pathfinding [NUM_QUERIES_PER_FRAME]
+"""
+
+import sys, os, time, random, contextlib
+
+import numpy as np
+
+from libs.astar import astar, astar_reference, DistanceField
+from gym_nethack.conn import decode_msg
+from gym_nethack.envs.base import NetHackInfo
+from benchmarks.parsing import load_corpus, StubSocket
+
+SCENARIOS = ['exploration', 'level', 'fog']
+
+def get_grids(name, frame_step=10):
+    # (grid, player position, explored positions) after every frame_step-th frame of the scenario, the player's positions being marked as explored.
+    nh, socket = NetHackInfo(parse_items=True), StubSocket()
+    nh.reset()
+    grids = []
+    for i, (frame, inventory) in enumerate(load_corpus(name)):
+        socket.reply = inventory
+        nh.process_msg(socket, decode_msg(frame))
+        nh.mark_explored(nh.cur_pos)
+        if i % frame_step == 0:
+            nh.update_pathfinding_grid()
+            grids.append((nh.grid.copy(), nh.cur_pos, set(nh.explored)))
+    return grids
+
+def make_queries(grids, num_queries, seed=0):
+    # (grid, start, goal, diag, explored_set) arguments of astar().
+    rng = random.Random(seed)
+    queries = []
+    for grid, pos, explored in grids:
+        free = list(zip(*np.nonzero(grid == 0)))
+        walls = list(zip(*np.nonzero(grid == 1)))
+        for _ in range(num_queries):
+            goal = tuple(int(c) for c in rng.choice(free))
+            queries.append((grid, pos, goal, True, explored))
+            queries.append((grid, pos, goal, True, None))
+            queries.append((grid, pos, goal, False, None))
+        wall = tuple(int(c) for c in rng.choice(walls))
+        wall_grid = grid.copy()
+        wall_grid[wall] = 0
+        queries.append((wall_grid, pos, wall, True, explored))
+    return queries
+
+def measure(search, queries):
+    start = time.perf_counter()
+    for grid, pos, goal, diag, explored in queries:
+        search(grid, pos, goal, diag=diag, explored_set=explored)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+def get_path_cost(path, start):
+    positions = [start] + path[::-1]
+    return sum(2 if a[0] != b[0] and a[1] != b[1] else 1 for a, b in zip(positions, positions[1:]))
+
+def astar_distances(grid, pos, goals):
+    dists = []
+    for goal in goals:
+        overridden = grid[goal]
+        grid[goal] = 0
+        dists.append(len(astar(grid, pos, goal)))
+        grid[goal] = overridden
+    return dists
+
+def field_distances(grid, pos, goals):
+    field = DistanceField(grid, pos)
+    return [field.get_num_steps(goal, override_goal=True) for goal in goals]
+
+def get_path_lengths(nh, grid, pos, goals):
+    # distances from the player as computed by the policies, with the pathfinding grid and player position of the given frame.
+    nh.grid, nh.cur_pos = grid, pos
+    nh.grid_version += 1
+    return [nh.get_path_length(goal, override_target_traversability=True) for goal in goals]
+
+def make_target_sets(grids, num_targets, seed=0):
+    # (grid, player position, targets) for each grid: reachable cells and walls next to them.
+    rng = random.Random(seed)
+    target_sets = []
+    for grid, pos, _ in grids:
+        field = DistanceField(grid, pos)
+        reachable = [goal for goal in zip(*np.nonzero(grid == 0)) if field.get_cost(goal) is not None]
+        walls = [goal for goal in zip(*np.nonzero(grid == 1)) if field.get_cost(goal, override_goal=True) is not None]
+        goals = rng.sample(reachable, min(num_targets, len(reachable))) + rng.sample(walls, min(num_targets, len(walls)))
+        target_sets.append((grid.copy(), pos, [(int(x), int(y)) for x, y in goals]))
+    return target_sets
+
+def measure_distances(distances, target_sets):
+    start = time.perf_counter()
+    for grid, pos, goals in target_sets:
+        distances(grid, pos, goals)
+    return (time.perf_counter() - start) / len(target_sets) * 1e6
+
+if __name__ == '__main__':
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name in SCENARIOS:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            grids = get_grids(name)
+        queries = make_queries(grids, num_queries)
+        for grid, pos, goal, diag, explored in queries:
+            assert astar(grid, pos, goal, diag=diag, explored_set=explored) == astar_reference(grid, pos, goal, diag=diag, explored_set=explored), (pos, goal, diag)
+        print("{:12}: {} queries, reference {:.0f}us, array-based {:.0f}us per query".format(name, len(queries), measure(astar_reference, queries), measure(astar, queries)))
+        
+        target_sets = make_target_sets(grids, 4 * num_queries)
+        nh, field_nh = NetHackInfo(parse_items=False), NetHackInfo(parse_items=False)
+        nh.reset()
+        field_nh.reset()
+        field_nh.use_distance_field = True
+        num_different = 0
+        for grid, pos, goals in target_sets:
+            assert get_path_lengths(nh, grid, pos, goals) == astar_distances(grid, pos, goals), pos
+            field = DistanceField(grid, pos)
+            for goal in goals:
+                overridden = grid[goal]
+                grid[goal] = 0
+                assert get_path_cost(astar(grid, pos, goal), pos) == get_path_cost(field.get_path(goal, override_goal=True), pos), (pos, goal)
+                grid[goal] = overridden
+            num_different += sum(a != b for a, b in zip(get_path_lengths(field_nh, grid, pos, goals), astar_distances(grid, pos, goals)))
+        num_targets = sum(len(goals) for _, _, goals in target_sets) / len(target_sets)
+        print("{:12}: {:.0f} targets per frame, one A* per target {:.0f}us, distance field {:.0f}us per frame".format(name, num_targets, measure_distances(astar_distances, target_sets), measure_distances(field_distances, target_sets)))
+        print("{:12}  distance field step counts different from A*'s: {} of {}".format("", num_different, sum(len(goals) for _, _, goals in target_sets)))
@@ -0,0 +1,58 @@
+"""Time to handle a frame received from NetHack when it is decoded to str (the default) vs. kept as bytes (the 'raw_frames' option):
+turning the received frame into a message, then the status checks done on every reply (get_step_status) and unpack_msg()
+(with a base map already built, as on every step but the first).
+
+The frames are generated by drawing rooms, corridors, monsters and items on the map part of benchmarks.transport.FRAME.
+Both modes are first checked to give the same result on every frame.
+
+Usage (from the repo root): python3 -m benchmarks.rawframes [NUM_FRAMES]
+"""
+
+import sys, time, random
+
+from gym_nethack.nhdata import ROWNO, COLNO
+from gym_nethack.nhutil import unpack_msg
+from gym_nethack.conn import RawFrame, decode_msg
+from benchmarks.transport import FRAME
+
+def make_frames(num_frames, seed=0):
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(num_frames):
+        cells = [' '] * (ROWNO*COLNO)
+        for _ in range(rng.randint(2, 6)):
+            top, left, height, width = rng.randint(1, ROWNO-8), rng.randint(1, COLNO-20), rng.randint(3, 6), rng.randint(5, 18)
+            for i in range(top, top+height):
+                for j in range(left, left+width):
+                    cells[i*COLNO+j] = '|' if j in (left, left+width-1) else '-' if i in (top, top+height-1) else '.'
+        for _ in range(rng.randint(20, 120)):
+            cells[rng.randrange(ROWNO*COLNO)] = '#'
+        for _ in range(rng.randint(0, 8)):
+            cells[rng.randrange(ROWNO*COLNO)] = rng.choice('d:F)[%!?+<>')
+        row, col = rng.randrange(ROWNO), rng.randrange(COLNO)
+        cells[row*COLNO+col] = '@'
+        status = FRAME[ROWNO*COLNO:].replace(b"40-10", "{}-{}".format(col, row).encode())
+        frames.append(''.join(cells).encode() + status)
+    return frames
+
+def handle(message, base_map):
+    if "paniclog" in message or "***dir***" in message or "***died***" in message or "***mondead***" in message:
+        raise Exception("Unexpected frame")
+    return unpack_msg(message, base_map, parse_ammo=True)
+
+def measure(receive, frames, base_map=None):
+    start = time.perf_counter()
+    for frame in frames:
+        message = receive(frame)
+        if base_map is not None:
+            handle(message, base_map)
+    return (time.perf_counter() - start) / len(frames) * 1e6
+
+if __name__ == '__main__':
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    frames = make_frames(num_frames)
+    for frame in frames[:200]:
+        assert handle(decode_msg(frame), None) == handle(RawFrame(frame), None)
+    base_map = handle(decode_msg(frames[0]), None)[0]
+    for name, receive in [('str', decode_msg), ('bytes', RawFrame)]:
+        print("{:5}: receive {:.2f}us, receive + parse {:.1f}us per frame".format(name, measure(receive, frames), measure(receive, frames, base_map)))
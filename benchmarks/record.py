@@ -0,0 +1,369 @@
+"""Records the frame corpus of benchmarks/parsing.py from real games of NetHack, played by simple scripted agents.
+
+The games are run with the NetHack Learning Environment (pip install nle), which plays NetHack 3.6 in process, in debug (wizard)
+mode so that the scenarios can be set up with wishes and created monsters. Every screen at which the game waits for a command is
+converted to the layout of the frames sent by the modified NetHack of this project (see NetHack changes in the README):
+    - the map is the map of the terminal, with the characters of the modified NetHack for open doors, graves, sinks and spellbooks,
+    - the bottom lines are rebuilt with the fields of the modified NetHack (score and inventory count in the attribute line, Exp: for
+      the experience level and the status effects in its order in the statistics line); the number of rooms and of secret doors are
+      not known outside of NetHack and are sent as 0,
+    - the top line is the message line, followed by the names of the visible monsters between '&'s,
+    - the glyph under the player is the last terrain glyph seen at the player's position, numbered like in the modified NetHack,
+and the inventory reply is built from the inventory of the game.
+
+The scenarios:
+    exploration     the player explores the first level, searching now and then and fighting the monsters met
+    level           the player explores, fighting the monsters met, and goes down the stairs
+    combat          the player fights monsters created next to it, one at a time
+    fog             the player explores with fog clouds created next to it, which engulf it
+    hallucination   the player quaffs wished-for potions of hallucination, and explores and fights
+    engulfed        the player fights engulfing monsters (fog clouds, vortices) created next to it, from inside them
+
+Usage (from the repo root): python3 -m benchmarks.record [SCENARIO...]
+"""
+
+import sys, re, random
+from collections import deque
+
+import numpy as np
+from nle import nethack
+
+from gym_nethack.nhdata import ROWNO, COLNO
+from benchmarks.parsing import SCENARIOS, FRAMES_PER_SCENARIO, save_corpus, get_corpus_fname
+
+OPTIONS = ('!autopickup', 'nobones', 'nolegacy', 'pushweapon', 'pettype:none', 'time', 'showscore', 'nocmdassist',
+           'role:valkyrie', 'race:human', 'gender:female', 'align:neutral')
+OBSERVATION_KEYS = ('tty_chars', 'glyphs', 'inv_strs', 'inv_letters', 'misc')
+GLYPH_OFFSET = 6 # glyphs of the modified NetHack (e.g. ROOM_OPENING_GLYPHS) minus those of NetHack 3.6, for map features
+
+# map features (indices of the cmap glyphs).
+S_NDOOR, S_VODOOR, S_HODOOR, S_VCDOOR, S_HCDOOR, S_ROOM, S_CORR, S_LITCORR, S_GRAVE, S_SINK, S_ARROW_TRAP = 12, 13, 14, 15, 16, 19, 21, 22, 28, 30, 42
+MAP_CHARS = {S_VODOOR: '.', S_HODOOR: '.', S_GRAVE: '_', S_SINK: '\\'}
+DOORS = (S_NDOOR, S_VODOOR, S_HODOOR, S_VCDOOR, S_HCDOOR)
+IMPASSABLE = set(' |-0`')
+
+ATTRIBUTE_LINE = re.compile(r'(.*?St:\S+ Dx:\d+ Co:\d+ In:\d+ Wi:\d+ Ch:\d+)\s+(\S+)(?:\s+S:(\d+))?')
+STAT_LINE = re.compile(r'(Dlvl:\S+) \$:(\d+) (HP:\S+ Pw:\S+ AC:\S+) Xp:(\d+)\S*(?: T:\d+)?(.*)')
+EFFECT_ORDER = ('Satiated', 'Hungry', 'Weak', 'Fainting', 'Stun', 'Conf', 'Blind', 'Burdened', 'Stressed', 'Strained', 'Overtaxed', 'Overloaded', 'Hallu')
+
+DIRECTIONS = {(0, -1): 'h', (1, 0): 'j', (-1, 0): 'k', (0, 1): 'l', (-1, -1): 'y', (-1, 1): 'u', (1, -1): 'b', (1, 1): 'n'}
+EASY_MONSTERS = ['jackal', 'newt', 'kobold', 'giant rat', 'gnome', 'hill orc', 'acid blob', 'homunculus', 'coyote', 'gecko', 'hobbit', 'large kobold']
+ENGULFERS = ['fog cloud', 'dust vortex', 'ice vortex', 'fog cloud']
+
+class Game(object):
+    """A game of NetHack in the NetHack Learning Environment, recording the frames at which the game waits for a command."""
+    def __init__(self, seed):
+        """Start the game.
+        
+        Args:
+            seed: seed of the game's random number generators
+        """
+        self.env = nethack.Nethack(observation_keys=OBSERVATION_KEYS, playername='Agent', options=OPTIONS, wizard=True, ttyrec=None)
+        self.env.set_initial_seeds(seed, seed, False)
+        self.obs, self.done = self.env.reset(), False
+        self.terrain = np.full((ROWNO, COLNO), nethack.GLYPH_CMAP_OFF + S_ROOM, dtype=np.int32) # last terrain glyph seen at each position
+        self.records, self.messages = [], []
+        self.resolve_prompts()
+    
+    def close(self):
+        self.env.close()
+    
+    @property
+    def tty(self):
+        return self.obs[0]
+    
+    @property
+    def glyphs(self):
+        return self.obs[1]
+    
+    def get_line(self, row):
+        return bytes(self.tty[row]).decode('ISO-8859-1')
+    
+    def get_pos(self):
+        # position (row, column) of the player on the map, or None if it cannot be seen.
+        positions = [tuple(pos) for pos in np.argwhere(self.tty[1:ROWNO+1] == ord('@')).tolist()]
+        if len(positions) == 1:
+            return positions[0]
+        return next((pos for pos in positions if self.get_monster_name(pos) == 'valkyrie'), None)
+    
+    def get_monster_name(self, pos):
+        glyph = self.get_glyph(pos)
+        return nethack.permonst(nethack.glyph_to_mon(glyph)).mname if nethack.glyph_is_monster(glyph) else None
+    
+    def get_glyph(self, pos):
+        return int(self.glyphs[pos[0], pos[1]]) if pos[1] < self.glyphs.shape[1] else nethack.GLYPH_CMAP_OFF
+    
+    def get_cmap(self, pos):
+        glyph = self.get_glyph(pos)
+        return nethack.glyph_to_cmap(glyph) if nethack.glyph_is_cmap(glyph) else None
+    
+    def get_char(self, pos):
+        return chr(self.tty[pos[0] + 1, pos[1]])
+    
+    def key(self, keys):
+        # send the given keys, one at a time, and answer the prompts that follow.
+        for key in keys:
+            if self.done:
+                return
+            self.obs, self.done = self.env.step(ord(key))
+    
+    def resolve_prompts(self):
+        # dismiss --More-- and menus, and answer yes/no questions (never dying, attacking peacefuls anyway); the game then waits for a command.
+        # The messages dismissed are kept, since the modified NetHack shows all messages of a turn on the top line.
+        for _ in range(50):
+            if self.done:
+                return
+            in_yn, in_getlin, waiting = self.obs[4]
+            top_line = self.get_line(0)
+            if waiting or '--More--' in self.tty.tobytes().decode('ISO-8859-1'):
+                if '--More--' in top_line:
+                    self.messages.append(top_line.replace('--More--', '').strip())
+                self.key('\r')
+            elif in_yn:
+                self.key('n' if 'Die?' in top_line or 'identified?' in top_line else 'y' if 'Really attack' in top_line else '\x1b')
+            elif in_getlin:
+                self.key('\x1b')
+            else:
+                return
+    
+    def command(self, keys):
+        # send a command (answering its prompts) and record the frame at which the game then waits for the next one.
+        self.messages = []
+        self.key(keys)
+        self.resolve_prompts()
+        if not self.done:
+            self.record()
+    
+    def get_inventory(self):
+        inv_strs, inv_letters = self.obs[2], self.obs[3]
+        return [(bytes(inv_strs[i]).decode('ISO-8859-1').rstrip('\x00'), chr(inv_letters[i])) for i in range(len(inv_letters)) if inv_letters[i] != 0]
+    
+    def get_monster_names(self, pos):
+        # names of the monsters seen, but the player.
+        positions = np.argwhere((self.glyphs >= nethack.GLYPH_MON_OFF) & (self.glyphs < nethack.GLYPH_OBJ_OFF)).tolist()
+        return [name for name in (self.get_monster_name(tuple(mpos)) for mpos in positions if tuple(mpos) != pos) if name is not None]
+    
+    def get_map(self):
+        # map rows of the terminal, with the characters of the modified NetHack; also updates the terrain seen.
+        rows = self.tty[1:ROWNO+1].copy()
+        for i, j in zip(*np.nonzero((self.glyphs > nethack.GLYPH_CMAP_OFF) & (self.glyphs < nethack.GLYPH_CMAP_OFF + S_ARROW_TRAP))): # terrain, but stone
+            cmap = nethack.glyph_to_cmap(int(self.glyphs[i, j]))
+            self.terrain[i, j] = self.glyphs[i, j]
+            if cmap in MAP_CHARS:
+                rows[i, j] = ord(MAP_CHARS[cmap])
+        for i, j in zip(*np.nonzero((self.glyphs >= nethack.GLYPH_OBJ_OFF) & (self.glyphs < nethack.GLYPH_CMAP_OFF))):
+            if rows[i, j] == ord('+'):
+                rows[i, j] = ord('&') # spellbook
+        return rows.tobytes().decode('ISO-8859-1')
+    
+    def get_status_lines(self, num_items):
+        attr_match, stat_match = ATTRIBUTE_LINE.match(self.get_line(ROWNO+1)), STAT_LINE.match(self.get_line(ROWNO+2))
+        assert attr_match and stat_match, (self.get_line(ROWNO+1), self.get_line(ROWNO+2))
+        attributes, align, score = attr_match.groups()
+        attr_line = "{} S:{} I:{} {}".format(attributes, score or 0, num_items, align)
+        dlvl, gold, points, exp, effects = stat_match.groups()
+        effects = [word for word in EFFECT_ORDER if word in effects.split()]
+        stat_line = "{} \\Au:{} {} R:0 SD:0 Exp:{} {}".format(dlvl, gold, points, exp, " ".join(effects))
+        return attr_line.ljust(COLNO) + stat_line.ljust(COLNO)
+    
+    def record(self):
+        pos = self.get_pos()
+        if pos is None:
+            return
+        inventory = self.get_inventory()
+        top_line = "  ".join(message for message in self.messages + [self.get_line(0).strip()] if message)
+        names = self.get_monster_names(pos)
+        if names:
+            top_line = (top_line + " " if top_line else "") + "&" + ", ".join(names) + "&"
+        map_str = self.get_map()
+        glyph = int(self.terrain[pos]) + GLYPH_OFFSET
+        tail = "{}-{}".format(pos[1], pos[0]).ljust(9, '\x00') + str(glyph) + '\x00\x00'
+        frame = (map_str + self.get_status_lines(len(inventory)) + "--" + top_line + "**" + tail).encode("ISO-8859-1")
+        inventory_msg = "--" + "--".join("{},{}".format(name, letter) for name, letter in inventory) + "--"
+        self.records.append((frame, inventory_msg.encode("ISO-8859-1")))
+    
+    def create_monster(self, name):
+        self.key('\x07')
+        self.key(name + '\r')
+        self.command('')
+    
+    def level_teleport(self, dlvl):
+        self.key('\x16')
+        self.key(str(dlvl) + '\r')
+        self.command('')
+    
+    def wish(self, name):
+        # returns the inventory letter of the wished-for item, or None.
+        self.key('\x17')
+        self.key(name + '\r')
+        m = re.match(r'([a-zA-Z]) - ', self.get_line(0))
+        self.command('')
+        return m.group(1) if m else None
+    
+    def is_passable(self, pos, unexplored=False):
+        char = self.get_char(pos)
+        if char == '#':
+            return self.get_cmap(pos) in (S_CORR, S_LITCORR, S_SINK) # not trees
+        return char not in IMPASSABLE or unexplored and char == ' '
+    
+    def get_steps(self, pos, unexplored=False):
+        # positions adjacent to the given one that the player can move to (no diagonal moves through doorways), including the
+        # unexplored ones if unexplored is True.
+        for (di, dj), key in DIRECTIONS.items():
+            npos = (pos[0] + di, pos[1] + dj)
+            if 0 <= npos[0] < ROWNO and 0 < npos[1] < COLNO and self.is_passable(npos, unexplored):
+                if di != 0 and dj != 0 and (self.get_cmap(pos) in DOORS or self.get_cmap(npos) in DOORS):
+                    continue
+                yield npos, key
+    
+    def get_adjacent_monster(self, pos):
+        # direction key of a monster next to the player (or of the monster engulfing it), or None.
+        for (di, dj), key in DIRECTIONS.items():
+            npos = (pos[0] + di, pos[1] + dj)
+            if 0 <= npos[0] < ROWNO and 0 <= npos[1] < COLNO - 1 and (nethack.glyph_is_monster(self.get_glyph(npos)) or nethack.glyph_is_swallow(self.get_glyph(npos))):
+                return key
+        return None
+
+class Explorer(object):
+    """Walks to the nearest passable position not visited yet that is next to an unexplored one, until there is none left."""
+    def __init__(self, game):
+        self.game = game
+        self.visited, self.blocked = set(), set()
+        self.last = None
+    
+    def reset(self):
+        self.visited, self.blocked = set(), set()
+    
+    def is_frontier(self, pos):
+        if pos in self.visited or pos in self.blocked:
+            return False
+        return any(self.game.get_char((pos[0] + di, pos[1] + dj)) == ' ' for di, dj in DIRECTIONS if 0 <= pos[0] + di < ROWNO and 0 < pos[1] + dj < COLNO)
+    
+    def get_first_step(self, pos, is_goal, unexplored=False):
+        # key of the first step of the shortest path to the nearest position for which is_goal() is true, or None.
+        first = {pos: None}
+        queue = deque([pos])
+        while queue:
+            cur = queue.popleft()
+            if cur != pos and is_goal(cur):
+                return first[cur]
+            for npos, key in self.game.get_steps(cur, unexplored):
+                if npos not in first and npos not in self.blocked:
+                    first[npos] = key if cur == pos else first[cur]
+                    queue.append(npos)
+        return None
+    
+    def step(self, pos):
+        # take one step towards the nearest frontier; returns False if there is none.
+        self.visited.add(pos)
+        return self.step_to(pos, self.is_frontier)
+    
+    def step_to(self, pos, is_goal, unexplored=False):
+        # take one step towards the nearest position for which is_goal() is true; returns False if there is none.
+        key = self.get_first_step(pos, is_goal, unexplored)
+        if key is None:
+            return False
+        self.move(pos, key)
+        return True
+    
+    def move(self, pos, key):
+        di, dj = next(d for d, k in DIRECTIONS.items() if k == key)
+        if self.last == (pos, key):
+            self.blocked.add((pos[0] + di, pos[1] + dj)) # did not move (locked door, boulder, solid rock, ...)
+        self.last = (pos, key)
+        self.game.command(key)
+
+def record_exploration(game, rng, fight=False, descend=False, fog=False):
+    # when there is nothing left to explore, the player searches for hidden passages, then goes to search at a dead end it visited,
+    # and every third time maps the level (debug mode). If it is to go down and cannot reach the down stairs after that, it teleports to the next level.
+    explorer = Explorer(game)
+    num_stuck, search_pos = 0, None
+    is_downstairs = lambda pos: game.get_char(pos) == '>'
+    while len(game.records) < FRAMES_PER_SCENARIO and not game.done:
+        pos = game.get_pos()
+        monster = game.get_adjacent_monster(pos) if pos is not None else None
+        if pos is None:
+            game.command('s')
+        elif fight and monster is not None:
+            game.command('F' + monster)
+        elif fog and rng.random() < 0.02:
+            game.create_monster('fog cloud')
+        elif rng.random() < 0.05:
+            for _ in range(rng.randint(2, 6)):
+                game.command('s')
+        elif explorer.step(pos):
+            pass
+        elif descend and is_downstairs(pos):
+            game.command('>')
+            explorer.reset()
+            num_stuck, search_pos = 0, None
+        elif descend and explorer.step_to(pos, is_downstairs, unexplored=True):
+            pass # through the unlit rooms of the mapped level
+        elif search_pos is not None and explorer.step_to(pos, lambda p: p == search_pos):
+            pass
+        else:
+            for _ in range(rng.randint(5, 10)):
+                game.command('s')
+            num_stuck += 1
+            if descend and num_stuck > 3:
+                game.level_teleport(int(game.get_line(ROWNO+2).split()[0].split(':')[1]) + 1)
+                explorer.reset()
+                num_stuck = 0
+            elif num_stuck % 3 == 0:
+                game.command('\x06')
+            dead_ends = sorted(p for p in explorer.visited if p != pos and len(list(game.get_steps(p))) <= 1)
+            search_pos = rng.choice(dead_ends) if dead_ends else None
+
+def record_combat(game, rng, monsters):
+    while len(game.records) < FRAMES_PER_SCENARIO and not game.done:
+        pos = game.get_pos()
+        monster = game.get_adjacent_monster(pos) if pos is not None else 'h'
+        if monster is None and 'Blind' in game.get_line(ROWNO+2):
+            game.command('s') # the monster can no longer be seen
+        elif monster is None:
+            game.create_monster(rng.choice(monsters))
+        elif rng.random() < 0.1:
+            game.command('s')
+        else:
+            game.command('F' + monster)
+
+def record_hallucination(game, rng):
+    explorer = Explorer(game)
+    while len(game.records) < FRAMES_PER_SCENARIO and not game.done:
+        if 'Hallu' not in game.get_line(ROWNO+2):
+            letter = game.wish('potion of hallucination')
+            game.command('q' + letter)
+            continue
+        pos = game.get_pos()
+        monster = game.get_adjacent_monster(pos) if pos is not None else None
+        if monster is not None:
+            game.command('F' + monster)
+        elif rng.random() < 0.03:
+            game.create_monster(rng.choice(EASY_MONSTERS))
+        elif pos is None or not explorer.step(pos):
+            game.command('s')
+            explorer.visited.clear()
+
+def record_scenario(name, seed):
+    rng = random.Random(seed)
+    game = Game(seed)
+    if name == 'exploration':
+        record_exploration(game, rng, fight=True)
+    elif name == 'level':
+        record_exploration(game, rng, fight=True, descend=True)
+    elif name == 'fog':
+        record_exploration(game, rng, fight=True, fog=True)
+    elif name == 'combat':
+        record_combat(game, rng, EASY_MONSTERS)
+    elif name == 'hallucination':
+        record_hallucination(game, rng)
+    elif name == 'engulfed':
+        record_combat(game, rng, ENGULFERS)
+    game.close()
+    return game.records[:FRAMES_PER_SCENARIO]
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or SCENARIOS:
+        records = record_scenario(name, SCENARIOS.index(name) + 1)
+        save_corpus(name, records)
+        print("Wrote", get_corpus_fname(name), "({} frames)".format(len(records)))
@@ -0,0 +1,52 @@
+"""Round-trip latency of the env <-> NetHack message pattern over the tcp and ipc transports.
+
+A REQ client thread plays the part of NetHack: it sends a screen-sized message and waits for a one-key reply,
+like the env and NetHack do for every keystroke.
+
+Usage (from the repo root): python3 -m benchmarks.transport [NUM_MESSAGES]
+"""
+
+import sys, time, threading
+
+import numpy as np
+import zmq
+
+from gym_nethack.conn import get_endpoint, TRANSPORTS, NH_BASE_PORT
+
+FRAME = ("." * (21*80) + "Dlvl:1 $:0 HP:14(14) Pw:2(2) AC:6 Xp:1/0 T:1--Hello Merlin.**" + "40-10\x00\x00\x00\x002359\x00\x00").encode()
+BENCH_PORT = NH_BASE_PORT + 900
+
+def fake_nethack(context, endpoint, num_messages):
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    for _ in range(num_messages):
+        socket.send(FRAME)
+        socket.recv()
+    socket.close()
+
+def measure(transport, num_messages):
+    context = zmq.Context()
+    socket = context.socket(zmq.REP)
+    socket.bind(get_endpoint(BENCH_PORT, transport, bind=True))
+    client = threading.Thread(target=fake_nethack, args=(context, get_endpoint(BENCH_PORT, transport), num_messages + 1))
+    client.start()
+
+    socket.recv() # first frame (connection setup) is not timed
+    times = []
+    for _ in range(num_messages):
+        start = time.perf_counter()
+        socket.send(b"h")
+        socket.recv()
+        times.append(time.perf_counter() - start)
+    socket.send(b"Q")
+
+    client.join()
+    socket.close()
+    context.term()
+    return np.array(times) * 1e6
+
+if __name__ == '__main__':
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for transport in TRANSPORTS:
+        times = measure(transport, num_messages)
+        print("{}: mean {:.1f}us, median {:.1f}us, p99 {:.1f}us, {:.0f} msgs/s".format(transport, times.mean(), np.median(times), np.percentile(times, 99), 1e6 / times.mean()))
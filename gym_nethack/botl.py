@@ -0,0 +1,149 @@
+import re
+from collections.abc import Mapping
+
+from gym_nethack.nhdata import NH_ROLE_TITLES, NH_ROLE_TITLES_FLAT
+
+# Parser for the two bottom lines of the NetHack screen (see botl.c in NetHack):
+#   attributes: "Agent the Stripling  St:16 Dx:12 Co:14 In:8 Wi:9 Ch:7 S:0 I:0 Neutral"
+#   statistics: "Dlvl:1 \Au:0 HP:14(14) Pw:2(2) AC:6 R:5 SD:1 Exp:1 Hungry Conf"
+#
+# The role title is found by scanning back from "St:" instead of matching an alternation of all role titles (the full
+# regular expression is only used if that fails), and the optional status effects are matched as tokens, in order.
+
+ROLE_TITLES = frozenset(title for role, titles in NH_ROLE_TITLES for title in titles)
+
+ATTRIBUTE_FIELDS = ('role_title', 'st', 'dx', 'co', 'in', 'wi', 'ch', 'sc', 'inv', 'align')
+ATTRIBUTES_TAIL = re.compile(r'\s*St:([/\d\*]+)\s*Dx:(\d+)\s*Co:(\d+)\s*In:(\d+)\s*Wi:(\d+)\s*Ch:(\d+)\s*S:(\d+)\s*I:(\d+)\s*(\S+)')
+ATTRIBUTES_PATTERN = re.compile(r'the (?P<role_title>'+NH_ROLE_TITLES_FLAT+')\s*'
+                                r'St:(?P<st>[/\d\*]+)\s*'
+                                r'Dx:(?P<dx>\d+)\s*'
+                                r'Co:(?P<co>\d+)\s*'
+                                r'In:(?P<in>\d+)\s*'
+                                r'Wi:(?P<wi>\d+)\s*'
+                                r'Ch:(?P<ch>\d+)\s*'
+                                r'S:(?P<sc>\d+)\s*'
+                                r'(I:(?P<inv>\d+)\s*)'
+                                r'(?P<align>\S+)')
+
+STATUS_EFFECT_FIELDS = (('hunger', ('Satiated', 'Hungry', 'Weak', 'Fainting')), ('stun', ('Stun',)), ('conf', ('Conf',)), ('blind', ('Blind',)),
+                        ('burden', ('Burdened', 'Stressed', 'Strained', 'Overtaxed', 'Overloaded')), ('hallu', ('Hallu',)))
+STAT_FIELDS = ('dlvl', 'money', 'hp', 'hp_max', 'pw', 'pw_max', 'ac', 'rooms', 'sdoor', 'exp') + tuple(key for key, words in STATUS_EFFECT_FIELDS)
+STATS_HEAD = re.compile(r'Dlvl:(\S+)\s*\\\w+:(\d+)\s*HP:(\d+)\((\d+)\)\s*Pw:(\d+)\((\d+)\)\s*AC:([+-]?\d+)\s*R:(\d+)\s*SD:(\d+)\s*Exp:(\d+)\s*')
+STATS_PATTERN = re.compile(r'Dlvl:(?P<dlvl>\S+)\s*'
+                           r'\\\w+:(?P<money>\d+)\s*'
+                           r'HP:(?P<hp>\d+)\((?P<hp_max>\d+)\)\s*'
+                           r'Pw:(?P<pw>\d+)\((?P<pw_max>\d+)\)\s*'
+                           r'AC:(?P<ac>[+-]?\d+)\s*'
+                           r'R:(?P<rooms>\d+)\s*'
+                           r'SD:(?P<sdoor>\d+)\s*'
+                           r'Exp:(?P<exp>\d+)\s*'
+                           r'(?P<hunger>Satiated|Hungry|Weak|Fainting)?\s*'
+                           r'(?P<stun>Stun)?\s*'
+                           r'(?P<conf>Conf)?\s*'
+                           r'(?P<blind>Blind)?\s*'
+                           r'(?P<burden>Burdened|Stressed|Strained|Overtaxed|Overloaded)?\s*'
+                           r'(?P<hallu>Hallu)?\s*')
+WHITESPACE = re.compile(r'\s*')
+
+class StatusRecord(Mapping):
+    """Read-only record of the fields of a bottom line, indexed like a dict (record['hp']).
+    Records are never modified once parsed, so the previous step's record can be kept as is instead of being copied."""
+    __slots__ = ('field_values',)
+    FIELDS = ()
+    INDEX = {}
+    
+    def __init__(self, values):
+        """Initialize the record.
+        
+        Args:
+            values: list of the values of the fields, in the order of FIELDS
+        """
+        self.field_values = values
+    
+    def __getitem__(self, key):
+        return self.field_values[self.INDEX[key]]
+    
+    def __iter__(self):
+        return iter(self.FIELDS)
+    
+    def __len__(self):
+        return len(self.FIELDS)
+    
+    def __repr__(self):
+        return repr(dict(zip(self.FIELDS, self.field_values)))
+    
+    def __getstate__(self):
+        return self.field_values
+    
+    def __setstate__(self, values):
+        self.field_values = values
+
+class Attributes(StatusRecord):
+    __slots__ = ()
+    FIELDS = ATTRIBUTE_FIELDS
+    INDEX = {key: i for i, key in enumerate(ATTRIBUTE_FIELDS)}
+
+class Stats(StatusRecord):
+    __slots__ = ()
+    FIELDS = STAT_FIELDS
+    INDEX = {key: i for i, key in enumerate(STAT_FIELDS)}
+
+def to_int(value):
+    return int(value) if value and value.isdigit() else value
+
+def get_strength(st):
+    # strengths 18/xx are mapped to 19-21.
+    if '/' not in st:
+        return to_int(st)
+    strength = [int(s) for s in st.split("/")]
+    assert strength[0] == 18
+    if 0 <= strength[1] <= 31:
+        return 19
+    elif 32 <= strength[1] <= 81:
+        return 20
+    return 21
+
+def parse_attributes(attr_line):
+    """Return the Attributes record of the given attribute line, or None if it could not be parsed."""
+    st_pos = attr_line.find('St:')
+    title_pos = attr_line.rfind('the ', 0, st_pos) + 4
+    role_title = attr_line[title_pos:st_pos].rstrip()
+    m = ATTRIBUTES_TAIL.match(attr_line, title_pos + len(role_title)) if st_pos >= 0 and title_pos >= 4 and role_title in ROLE_TITLES else None
+    if m:
+        st, dx, co, intel, wi, ch, sc, inv, align = m.groups()
+        return Attributes([role_title, get_strength(st), int(dx), int(co), int(intel), int(wi), int(ch), int(sc), int(inv), to_int(align)])
+    return parse_attributes_regex(attr_line)
+
+def parse_attributes_regex(attr_line):
+    """Same as parse_attributes(), using only the full regular expression."""
+    m = ATTRIBUTES_PATTERN.search(attr_line)
+    if not m:
+        return None
+    values = [to_int(m.group(key)) for key in ATTRIBUTE_FIELDS]
+    values[1] = get_strength(str(values[1]))
+    return Attributes(values)
+
+def parse_stats(stat_line):
+    """Return the Stats record of the given statistics line, or None if it could not be parsed."""
+    m = STATS_HEAD.search(stat_line)
+    if m:
+        dlvl, money, hp, hp_max, pw, pw_max, ac, rooms, sdoor, exp = m.groups()
+        values = [to_int(dlvl), int(money), int(hp), int(hp_max), int(pw), int(pw_max), to_int(ac), int(rooms), int(sdoor), int(exp)]
+        pos = m.end()
+        for key, words in STATUS_EFFECT_FIELDS:
+            value = None
+            for word in words:
+                if stat_line.startswith(word, pos):
+                    value = word
+                    pos = WHITESPACE.match(stat_line, pos + len(word)).end()
+                    break
+            values.append(value)
+        return Stats(values)
+    return None
+
+def parse_stats_regex(stat_line):
+    """Same as parse_stats(), using only the full regular expression."""
+    m = STATS_PATTERN.search(stat_line)
+    if not m:
+        return None
+    return Stats([to_int(m.group(key)) for key in STAT_FIELDS])
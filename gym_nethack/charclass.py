@@ -0,0 +1,52 @@
+import numpy as np
+
+from gym_nethack.nhdata import PASSABLE_CHARS, WALL_CHARS, DOOR_CHARS, ROOM_CHARS, CORRIDOR_CHARS, MONS_CHARS, TOPOGRAPHICAL_CHARS
+
+# Character classes of the NetHack map, built once at import:
+#   - as frozensets, for membership tests on single characters (e.g., basemap_char(x, y) in PASSABLE_SET);
+#   - as bits of a 256-entry table indexed by character code, to classify a whole map array at once (see classify()).
+
+MAP_ITEM_CHARS = '$[(%?/=!"*):' # item glyphs as shown on the map
+ROOM_FEATURE_CHARS = '_{\\}'    # altars, fountains, ...
+CRITICAL_CHARS = '+.'
+
+PASSABLE_SET = frozenset(PASSABLE_CHARS)
+WALL_SET = frozenset(WALL_CHARS)
+DOOR_SET = frozenset(DOOR_CHARS)
+WALL_OR_DOOR_SET = WALL_SET | DOOR_SET
+ROOM_SET = frozenset(ROOM_CHARS)
+CORRIDOR_SET = frozenset(CORRIDOR_CHARS)
+MONSTER_SET = frozenset(MONS_CHARS)
+TOPOGRAPHICAL_SET = frozenset(TOPOGRAPHICAL_CHARS)
+MAP_ITEM_SET = frozenset(MAP_ITEM_CHARS)
+ROOM_FEATURE_SET = frozenset(ROOM_FEATURE_CHARS)
+CRITICAL_SET = frozenset(CRITICAL_CHARS)
+
+# bits of the class table.
+PASSABLE, WALL, DOOR, ROOM, CORRIDOR, MONSTER, TOPOGRAPHICAL, MAP_ITEM, ROOM_FEATURE, CRITICAL = [1 << i for i in range(10)]
+CLASSES = [(PASSABLE, PASSABLE_SET), (WALL, WALL_SET), (DOOR, DOOR_SET), (ROOM, ROOM_SET), (CORRIDOR, CORRIDOR_SET), (MONSTER, MONSTER_SET),
+           (TOPOGRAPHICAL, TOPOGRAPHICAL_SET), (MAP_ITEM, MAP_ITEM_SET), (ROOM_FEATURE, ROOM_FEATURE_SET), (CRITICAL, CRITICAL_SET)]
+
+CLASS_TABLE = np.zeros(256, dtype=np.uint16)
+for bit, chars in CLASSES:
+    CLASS_TABLE[[ord(c) for c in chars]] |= bit
+
+def is_passable(ch):
+    return ch in PASSABLE_SET
+
+def is_wall(ch):
+    return ch in WALL_SET
+
+def is_door(ch):
+    return ch in DOOR_SET
+
+def is_monster(ch):
+    return ch in MONSTER_SET
+
+def classify(map_array):
+    """Return the class bits (PASSABLE | WALL | ...) of every character code in the given uint8 array, as an array of the same shape."""
+    return CLASS_TABLE[map_array]
+
+def class_mask(classes, char_class):
+    """Boolean mask of the cells of a classify() result that belong to any of the given classes (bits or'd together)."""
+    return (classes & char_class) != 0
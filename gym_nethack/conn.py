@@ -1,8 +1,10 @@
-import os, subprocess, signal
+import os, math, time, shutil, atexit, tempfile
 from sys import platform
 
 import zmq
 
+from gym_nethack.fileio import DIR_CHAR
+
 ###############
 # Directories #
 ###############
@@ -17,25 +19,96 @@ elif platform == "win32":
     nethack_path = "nethack\\binary\\nethack.exe"
     nethack_dir = "C:\\msys64\\home\\Jonathan\\nethackrl\\nethack\\binary"
 
-def launch_nh(socket):
-    socket.send("launch".encode())
-    socket.recv()
+NH_BASE_PORT = 5555
+TRANSPORTS = ['tcp', 'ipc']
+INVENTORY_FLAG = "***inv***" # last part of a batched command, asking NetHack to append the inventory listing to its reply
+
+raw_frame_sockets = set() # sockets whose frames are returned by rcv_msg() as RawFrame (bytes) instead of being decoded to str
+
+# directory holding the daemon's ipc socket file, which the daemon and the envs must agree on. Set NH_IPC_DIR to use another one (e.g., for a second daemon).
+daemon_ipc_dir = os.environ.get("NH_IPC_DIR", tempfile.gettempdir() + DIR_CHAR + "gym_nethack")
+ipc_dir = None # directory holding the ipc socket files of this process's games (see get_ipc_dir())
+
+def get_ipc_dir():
+    # a new directory inside daemon_ipc_dir, made on first use and removed when the process exits, so that concurrent runs never share
+    # socket files. The envs send it to the daemon (in their "test" message), which passes it on to the NetHack processes.
+    global ipc_dir
+    if ipc_dir is None:
+        os.makedirs(daemon_ipc_dir, exist_ok=True)
+        ipc_dir = tempfile.mkdtemp(prefix="run", dir=daemon_ipc_dir)
+        atexit.register(shutil.rmtree, ipc_dir, True)
+    return ipc_dir
+
+def get_endpoint(port, transport='tcp', bind=False, directory=None):
+    # zmq endpoint for the given port number: a loopback TCP port, or a Unix domain socket file named after the port, in the given
+    # directory (by default, this process's ipc directory).
+    if transport == 'tcp':
+        return ("tcp://*:" if bind else "tcp://localhost:") + str(port)
+    elif transport == 'ipc':
+        if platform == "win32":
+            raise Exception("ipc transport is not supported on Windows.")
+        if directory is None:
+            directory = get_ipc_dir()
+        os.makedirs(directory, exist_ok=True)
+        return "ipc://" + directory + DIR_CHAR + "nh" + str(port)
+    raise Exception("Unknown transport: " + str(transport))
+
+def get_daemon_port():
+    # a single daemon serves all environments; the ports of the NetHack processes are handed out by the daemon.
+    return NH_BASE_PORT - 1
+
+def get_daemon_endpoint(transport, bind=False):
+    return get_endpoint(get_daemon_port(), transport, bind, daemon_ipc_dir)
+
+def get_sysconf_fname(conf_id):
+    # NetHack reads its options from the sysconf file matching the port it was launched on (port NH_BASE_PORT+N reads sysconfN).
+    if platform == "win32":
+        return nethack_dir + DIR_CHAR + "defaults.nh"
+    return nethack_dir + DIR_CHAR + "sysconf" + str(conf_id)
+
+def get_launch_msg(proc_id, live_ports):
+    # live_ports are the ports of the games still open, which the daemon must not hand out again.
+    return " ".join(["launch", str(proc_id)] + [str(port) for port in live_ports]).encode()
+
+def get_daemon_reply(reply):
+    # the daemon answers the requests it could not handle with "error" followed by the reason.
+    reply = reply.decode()
+    if reply.startswith("error"):
+        raise Exception("NetHack daemon replied with an " + reply)
+    return reply
+
+def launch_nh(socket, proc_id, live_ports=[]):
+    # the daemon replies with the port that the launched NetHack process will connect to, and the pid of that process.
+    socket.send(get_launch_msg(proc_id, live_ports))
+    port, pid = get_daemon_reply(socket.recv()).split()
+    return int(port), int(pid)
+
+async def launch_nh_async(socket, proc_id, live_ports=[]):
+    # launch_nh() for a zmq.asyncio daemon socket.
+    await socket.send(get_launch_msg(proc_id, live_ports))
+    port, pid = get_daemon_reply(await socket.recv()).split()
+    return int(port), int(pid)
+
+def kill_nh(socket, daemon_socket=None, port=None):
+    try:
+        socket.send("Q".encode())
+    except zmq.error.ZMQError:
+        # force quit: have the daemon kill the process it launched on this port.
+        if daemon_socket is not None:
+            daemon_socket.send(("kill " + str(port)).encode())
+            daemon_socket.recv()
 
-def kill_nh(socket):
+async def kill_nh_async(socket, daemon_socket=None, port=None):
+    # kill_nh() for a zmq.asyncio daemon socket (the game socket itself is not waited on).
     try:
         socket.send("Q".encode())
-    except:
-        # force quit
-        # src : https://stackoverflow.com/questions/2940858/kill-process-by-name
-        if platform in ['linux', 'linux2', 'darwin']:
-            p = subprocess.Popen(['ps', '-A'], stdout=subprocess.PIPE)
-            out, err = p.communicate()
-            for line in out.splitlines():
-                if nethack_path in str(line):
-                    pid = int(line.split(None, 1)[0])
-                    os.kill(pid, signal.SIGKILL)
-
-def send_msg(socket, msg):
+    except zmq.error.ZMQError:
+        if daemon_socket is not None:
+            await daemon_socket.send(("kill " + str(port)).encode())
+            await daemon_socket.recv()
+
+def send_msg(socket, msg, rcv_intermediate=None):
+    # rcv_intermediate (no arguments) receives the screens following the intermediate keys, instead of rcv_msg(socket).
     assert socket is not None
     if type(msg) is not list:
         msg = [msg]
@@ -45,11 +118,178 @@ def send_msg(socket, msg):
         assert a is not None
         socket.send(a.encode(), zmq.NOBLOCK)
         if i < len(msg) - 1: # discard states until last action sent
-            message = rcv_msg(socket)
+            message = rcv_msg(socket) if rcv_intermediate is None else rcv_intermediate()
+            if "***dir***" not in message:
+                return message
+    return None
+
+async def send_msg_async(socket, msg, frame_socket=None):
+    # send_msg() for zmq.asyncio sockets (see rcv_msg_async() for frame_socket). Raises zmq.error.Again if the screen following
+    # an intermediate key does not arrive within the socket's RCVTIMEO, like send_msg().
+    assert socket is not None
+    if type(msg) is not list:
+        msg = [msg]
+    
+    for i, a in enumerate(msg):
+        assert a is not None
+        await socket.send(a.encode(), zmq.NOBLOCK)
+        if i < len(msg) - 1:
+            message = await rcv_msg_async(socket, frame_socket)
+            if message is None:
+                raise zmq.error.Again()
             if "***dir***" not in message:
                 return message
     return None
 
+def get_batch_parts(msg, with_inventory):
+    # parts of the multipart message of a batched command (see send_batch_msg()).
+    if type(msg) is not list:
+        msg = [msg]
+    parts = [a.encode() for a in msg]
+    if with_inventory:
+        parts.append(INVENTORY_FLAG.encode())
+    return parts
+
+def get_batch_reply(socket, reply):
+    # (screen, inventory) of a reply to send_batch_msg().
+    return to_msg(socket, reply[0]), decode_msg(reply[1]) if len(reply) > 1 else None
+
+def send_batch_msg(socket, msg, with_inventory=False, wait=None):
+    # sends all keys of the command in one multipart message; NetHack plays them in order (stopping early, like send_msg,
+    # if a key does not bring up a prompt) and replies with the final screen, followed by the inventory listing if requested.
+    # returns (screen, inventory), where inventory is None if it was not requested or the reply did not include it.
+    # wait (no arguments) is called before receiving the reply, e.g. to wait for it with ConnectionMonitor.wait().
+    assert socket is not None
+    socket.send_multipart(get_batch_parts(msg, with_inventory), zmq.NOBLOCK)
+    if wait is not None:
+        wait()
+    return get_batch_reply(socket, socket.recv_multipart())
+
+async def send_batch_msg_async(socket, msg, with_inventory=False, frame_socket=None):
+    # send_batch_msg() for zmq.asyncio sockets (see rcv_msg_async() for frame_socket). Raises zmq.error.Again if the reply does not arrive within the socket's RCVTIMEO.
+    assert socket is not None
+    await socket.send_multipart(get_batch_parts(msg, with_inventory), zmq.NOBLOCK)
+    if not await socket.poll(socket.RCVTIMEO):
+        raise zmq.error.Again()
+    return get_batch_reply(frame_socket if frame_socket is not None else socket, await socket.recv_multipart())
+
+def decode_msg(message):
+    return str(message, "cp437" if os.name == "nt" else "ISO-8859-1")
+
+class RawFrame(bytes):
+    """Frame received from NetHack, kept as bytes instead of being decoded to str (see raw_frame_sockets).
+    Substring tests also take str (e.g., "paniclog" in frame), and str(frame) decodes it, so that frames of both kinds can be handled alike."""
+    def __contains__(self, sub):
+        if isinstance(sub, str):
+            sub = sub.encode("ISO-8859-1")
+        return bytes.__contains__(self, sub)
+    
+    def __str__(self):
+        return decode_msg(self)
+
+def to_msg(socket, frame):
+    # the frame as returned by rcv_msg(): a RawFrame if the socket's frames are kept raw, else decoded to str.
+    if socket in raw_frame_sockets:
+        return RawFrame(frame)
+    return decode_msg(frame)
+
 def rcv_msg(socket):
-    message = socket.recv()
-    return message.decode("cp437" if os.name == "nt" else "ISO-8859-1")
+    return to_msg(socket, socket.recv())
+
+async def rcv_msg_async(socket, frame_socket=None):
+    # for zmq.asyncio sockets. returns None if nothing is received within the socket's RCVTIMEO, instead of raising zmq.error.Again.
+    # frame_socket is the socket the asyncio one was made from (zmq.asyncio.Socket.from_socket()), under which its raw frame mode is registered.
+    if not await socket.poll(socket.RCVTIMEO):
+        return None
+    frame_socket = frame_socket if frame_socket is not None else socket
+    return to_msg(frame_socket, await socket.recv())
+
+def process_alive(pid):
+    # True if the process with the given pid is still running (a zombie waiting to be reaped by the daemon counts as dead).
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    if platform in ['linux', 'linux2']:
+        try:
+            with open("/proc/" + str(pid) + "/stat") as stat:
+                return stat.read().rsplit(")", 1)[1].split()[0] != 'Z'
+        except IOError:
+            return False
+    return True
+
+class ReplyTimes(object):
+    """Running mean and variance of the reply times of one kind of reply (Welford's online algorithm)."""
+    def __init__(self):
+        self.num_samples = 0
+        self.mean = 0.0
+        self.sum_sq_diffs = 0.0
+    
+    def record(self, elapsed):
+        self.num_samples += 1
+        delta = elapsed - self.mean
+        self.mean += delta / self.num_samples
+        self.sum_sq_diffs += delta * (elapsed - self.mean)
+    
+    def get_std(self):
+        return math.sqrt(self.sum_sq_diffs / (self.num_samples - 1)) if self.num_samples > 1 else 0.0
+
+class ConnectionMonitor(object):
+    """Keeps statistics of how long a NetHack process takes to reply, and waits for its replies with a timeout derived from them.
+    While waiting, the process is checked at regular intervals, so that a crash is noticed right away instead of at the timeout.
+    
+    The kinds of replies have very different latencies, so each is timed separately: 'step' (the screen following a command), 'intermediate'
+    (the screen following a key of a command that brings up a prompt), 'inventory' (the inventory listing) and 'batch' (the reply to a batched
+    command, see send_batch_msg()). The learned timeout is never lower than the initial one, so that a slow game (e.g., generating a level)
+    is not given less time than with a fixed timeout."""
+    def __init__(self, initial_timeout=2000, min_timeout=2000, max_timeout=30000, num_stds=8, min_samples=20, check_interval=50):
+        """Initialize the monitor. (All times are in milliseconds.)
+        
+        Args:
+            initial_timeout: timeout used for a kind of reply until min_samples reply times of that kind have been recorded
+            min_timeout, max_timeout: bounds on the learned timeout
+            num_stds: the learned timeout is the mean reply time plus this many standard deviations
+            check_interval: how often to check that the NetHack process is still alive while waiting
+        """
+        assert min_timeout >= initial_timeout
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.num_stds = num_stds
+        self.min_samples = min_samples
+        self.check_interval = check_interval
+        
+        self.reply_times = {} # kind of reply -> ReplyTimes
+    
+    def record(self, elapsed, kind='step'):
+        """Add a reply time to the statistics of the given kind of reply."""
+        if kind not in self.reply_times:
+            self.reply_times[kind] = ReplyTimes()
+        self.reply_times[kind].record(elapsed)
+    
+    def get_timeout(self, kind='step'):
+        """Current timeout for the given kind of reply, in milliseconds."""
+        times = self.reply_times.get(kind)
+        if times is None or times.num_samples < self.min_samples:
+            return self.initial_timeout
+        return int(min(max(times.mean + self.num_stds * times.get_std(), self.min_timeout), self.max_timeout))
+    
+    def is_overdue(self, start, pid=None, kind='step'):
+        """Whether a reply of the given kind, waited for since start (time.perf_counter()), is past its timeout, or the process with the given pid died."""
+        return time.perf_counter() > start + self.get_timeout(kind) / 1000 or (pid is not None and not process_alive(pid))
+    
+    def wait(self, socket, pid=None, kind='step'):
+        """Wait until a message can be received on the socket, recording how long it took.
+        Raises zmq.error.Again if the timeout passes, or the process with the given pid dies, before a message arrives."""
+        start = time.perf_counter()
+        while not socket.poll(self.check_interval):
+            if self.is_overdue(start, pid, kind) and not socket.poll(0):
+                raise zmq.error.Again()
+        self.record((time.perf_counter() - start) * 1000, kind)
+    
+    def rcv_msg(self, socket, pid=None, kind='step'):
+        """Receive the next message on the socket (see wait())."""
+        self.wait(socket, pid, kind)
+        return rcv_msg(socket)
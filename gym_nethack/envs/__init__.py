@@ -1,3 +1,5 @@
 from gym_nethack.envs.combat import NetHackCombatEnv
 from gym_nethack.envs.exploration import NetHackExplEnv #GreedyEnv, NetHackExplOccMapsEnv
 from gym_nethack.envs.level import NetHackLevelEnv
+from gym_nethack.envs.vec import NetHackVecEnv
+from gym_nethack.envs.aio import AsyncNetHackEnv
@@ -0,0 +1,145 @@
+import zmq
+import zmq.asyncio
+
+from gym_nethack.conn import rcv_msg_async, send_msg_async, send_batch_msg_async, launch_nh_async, kill_nh_async
+from gym_nethack.nhdata import CMD
+from gym_nethack.nhutil import save_nh_conf
+from gym_nethack.envs.base import Terminals
+
+class AsyncNetHackEnv(object):
+    """asyncio interface to a NetHack RL environment.
+    
+    All waiting on other processes is done with zmq.asyncio sockets, so that a single event loop can drive many games at once, e.g.:
+        
+        envs = [AsyncNetHackEnv(env) for env in configured_envs]
+        results = await asyncio.gather(*[env.step(action) for env, action in zip(envs, actions)])
+    
+    This covers the daemon's replies when launching (or force quitting) a game, the first frame of a game, the screens following
+    the intermediate keys of a command, the frame following an action, and the inventory listing (sent along with the action if the
+    env batches its commands). The state of each game is kept and processed by the wrapped environment; only the waiting is asynchronous.
+    Not covered: replaying a crashed game (retry_on_crash) is done by the wrapped environment, and blocks the loop."""
+    def __init__(self, env):
+        """Initialize the wrapper.
+        
+        Args:
+            env: NetHackRLEnv object, already configured with set_config()
+        """
+        assert env.single
+        self.env = env
+        self.async_socket = None # (socket, asyncio socket sharing it)
+        self.daemon_socket = zmq.asyncio.Socket.from_socket(env.daemon_socket)
+    
+    def get_async_socket(self, socket=None):
+        """Return an asyncio socket sharing the given NetHack socket (by default the env's current one, which changes every episode)."""
+        if socket is None:
+            socket = self.env.socket
+        if self.async_socket is None or self.async_socket[0] is not socket:
+            self.release_async_socket()
+            self.async_socket = (socket, zmq.asyncio.Socket.from_socket(socket))
+        return self.async_socket[1]
+    
+    def release_async_socket(self):
+        """Stop watching the socket shared by the current asyncio socket from the event loop. Must be done before that socket is closed,
+        since its file descriptor can then be reused by the next game's socket, which the stale watch would keep from being woken up."""
+        if self.async_socket is not None:
+            self.async_socket[1]._clear_io_state()
+            self.async_socket = None
+    
+    async def get_inventory_msg(self, socket=None):
+        """Ask NetHack for the inventory listing and return it."""
+        async_socket = self.get_async_socket(socket)
+        if socket is None:
+            self.env.set_reply_timeout('inventory')
+        await async_socket.send(CMD.INVENTORY.encode())
+        inventory_msg = await rcv_msg_async(async_socket, socket if socket is not None else self.env.socket)
+        if inventory_msg is None:
+            raise Exception("Error occurred communicating with NetHack to get inventory.")
+        return inventory_msg
+    
+    async def launch_game(self):
+        """Same as the env's launch_game()."""
+        env = self.env
+        return env.connect_game(*await launch_nh_async(self.daemon_socket, env.proc_id, env.get_live_ports()))
+    
+    async def kill_game(self):
+        """Same as the env's kill_game()."""
+        env = self.env
+        if env.socket is not None:
+            await kill_nh_async(env.socket, self.daemon_socket, env.game_processes[env.socket][0])
+            self.release_async_socket()
+            env.close_game(env.socket)
+            env.socket = None
+    
+    async def start_game(self, game_num):
+        """Write the options file of the given game and launch its NetHack process. Returns the env's next_game entry for it."""
+        params, attributes = self.env.get_game_params(game_num, self.env.game_rng)
+        save_nh_conf(**params)
+        return (await self.launch_game(), params, attributes)
+    
+    async def rcv_first_reply(self, socket):
+        """Wait for the first frame of the game on the given socket, and get the inventory listing if the env parses items (see the env's first_reply)."""
+        message = await rcv_msg_async(self.get_async_socket(socket), socket)
+        if message is None:
+            raise zmq.error.Again()
+        return message, await self.get_inventory_msg(socket) if self.env.nh.parse_items else None
+    
+    async def reset(self):
+        """Launch a new game, wait for its first frame and start the episode. Returns the same as the env's reset()."""
+        env = self.env
+        if not env.new_game_on_reset():
+            return env.reset()
+        
+        await self.kill_game()
+        if env.next_game is None:
+            env.next_game = await self.start_game(env.total_num_games)
+        env.first_reply = await self.rcv_first_reply(env.next_game[0])
+        
+        # the env's own reset() then has nothing left to wait for, except for the game it would prefetch, which is launched here instead.
+        prefetch_games, env.prefetch_games = env.prefetch_games, False
+        try:
+            result = env.reset()
+        finally:
+            env.prefetch_games = prefetch_games
+        if prefetch_games:
+            env.next_game = await self.start_game(env.total_num_games + 1)
+        return result
+    
+    async def take_action(self, action):
+        """Same as the env's take_action()."""
+        env = self.env
+        action = env.prepare_action(action)
+        socket = self.get_async_socket()
+        if env.batch_commands:
+            env.set_reply_timeout('batch')
+            message, env.nh.inventory_msg = await send_batch_msg_async(socket, action, with_inventory=env.nh.inventory_needed(), frame_socket=env.socket)
+        else:
+            env.set_reply_timeout('intermediate')
+            message = await send_msg_async(socket, action, frame_socket=env.socket)
+        env.total_actions_this_episode += 1
+        return message
+    
+    async def step(self, action):
+        """Take the given action and return the new state, as in the env's step()."""
+        env = self.env
+        env.start_turn()
+        try:
+            message = await self.take_action(action)
+            if message is None:
+                env.set_reply_timeout('step')
+                message = await rcv_msg_async(self.get_async_socket(), env.socket)
+        except zmq.error.Again:
+            message = None
+        
+        if message is None and env.retry_on_crash:
+            self.release_async_socket()
+            message = env.replay_game()
+        
+        status = env.get_step_status(message)
+        if status is Terminals.OK and env.nh.inventory_needed() and env.nh.inventory_msg is None:
+            env.nh.inventory_msg = await self.get_inventory_msg()
+        return env.complete_step(message, status)
+    
+    def close(self):
+        """Close the wrapped environment."""
+        self.release_async_socket()
+        self.env.close()
@@ -1,4 +1,4 @@
-import os #, time
+import os, random, time
 from copy import deepcopy
 
 import numpy as np
@@ -10,7 +10,9 @@ from libs import astar
 from gym_nethack.conn import *
 from gym_nethack.nhutil import *
 from gym_nethack.nhdata import *
+from gym_nethack.charclass import *
 from gym_nethack.misc import VERBOSE
+from gym_nethack.pathcache import PathCache
 #from gym_nethack.nhdaemon import spawn_daemon
 
 class Terminals: OK, PLAYER_DIED, MONSTER_DIED, IMPOSSIBLE_ACTION, TIME_EXCEEDED, CONN_ERROR, SUCCESS = range(0, 7)
@@ -26,6 +28,16 @@ class NetHackInfo(object):
         """
         super().__init__()
         self.parse_items = parse_items
+        self.cache_inventory = False
+        self.inventory_check_interval = 0
+        self.num_inventory_mismatches = 0 # number of times the cached inventory was found to be out of date (see set_inventory_caching())
+        self.field_usage = None # number of frames in which each observation field was used, if profiling (see set_field_profiling())
+        self.num_profiled_frames = 0
+        self.reuse_identical_frames = True # see process_msg()
+        self.use_distance_field = False # see pathfind_to()
+        self.path_cache = PathCache() # paths found by pathfind_to()
+        self.num_reused_frames = 0
+        self.rcv_inventory = None # receives the inventory listing after it is asked for (the env's, to time it), instead of rcv_msg()
     
     def reset(self):
         """Reset all map- and level-dependent variables."""
@@ -37,11 +49,28 @@ class NetHackInfo(object):
         self.map = None
         self.base_map = None
         self.top_line = ""
-        self.num_explored_squares = 0
-        self.pathfind_distances = {}
+        self.inventory_msg = None # inventory listing sent along with the next message to be processed, if any
+        self.path_cache.clear()
+        self.distance_field = None # shortest paths from the player over self.grid (see get_distance_field())
+        self.distance_field_key = None
         
         self.explored = set()
         self.grid = np.array([[1 for j in range(COLNO)] for i in range(ROWNO)]) # 1 -> impassable
+        # version numbers of self.grid, self.explored and self.base_map, increased whenever they change: cached paths are only valid for the versions they were found with.
+        self.grid_version = 0
+        self.explored_version = 0
+        self.base_map_version = 0
+        
+        # cells that changed between consecutive frames, and the state kept up to date from them.
+        self.map_codes = None # character codes of self.map
+        self.base_codes = None # character codes of self.base_map as of the last call to sync_base_map()
+        self.changed_cells = set() # cells of self.map that differ from the previous frame
+        self.changed_base_cells = set() # cells of self.base_map that changed in the last call to process_msg()
+        self.num_floor_squares = 0 # number of '.' on self.map
+        self.base_grid = np.ones((ROWNO, COLNO), dtype=self.grid.dtype) # pathfinding grid of the base map (self.grid may be temporarily overwritten)
+        self.uncovered_doors = set()
+        self.frame_key = None # map section of the last frame parsed, with the options it was parsed with
+        self.parsed_base_codes = None # character codes of self.base_map right after the last frame was parsed
         
         self.initial_player_pos = None
         self.prev_prev_pos = None
@@ -52,15 +81,20 @@ class NetHackInfo(object):
         self.player_has_lycanthropy = False
         self.in_fog = False
         
-        self.monster_positions = []
-        self.critical_positions = []
-        self.concrete_positions = []
+        # positions of interest on the map are computed from the current observation when first read (see nhutil.MapObservation).
+        self.obs = None
+        self.prev_obs = None
+        self.fields_used = set() # fields of the current observation used so far, if profiling
         
         if self.parse_items:
             self.inventory = []
-            self.ammo_positions = []
-            self.item_positions = set()
-            self.food_positions = set()
+            self.inventory_stale = True # whether the inventory must be asked for again instead of reusing the last one
+            self.steps_since_inventory = 0
+            # items and food seen so far on the level: the masks of the frames processed since they were last read are merged in on access.
+            self.seen_item_positions = set()
+            self.seen_food_positions = set()
+            self.new_items = None
+            self.new_food = None
     
     def process_msg(self, socket, message, update_base=True, parse_monsters=True, parse_ammo=False):
         """Processes the map screen outputted by NetHack.
@@ -73,20 +107,43 @@ class NetHackInfo(object):
             parse_ammo: whether to keep or discard ammo in the parsed NetHack map
         """
         self.prev_prev_pos = self.prev_pos
-        self.prev_monster_positions = deepcopy(self.monster_positions)
+        self.prev_obs = self.obs
         self.prev_map = self.map
         self.prev_pos = self.cur_pos
+        prev_changed_cells = self.changed_cells
+        if self.field_usage is not None:
+            self.num_profiled_frames += 1
+            self.fields_used = set()
+        
+        status = parse_status(message)
+        attmsg, sttmsg, self.top_line, self.cur_pos, self.back_glyph, obscured = status
         
-        self.base_map, self.map, attmsg, sttmsg, self.top_line, self.cur_pos, self.monster_positions, self.ammo_positions, new_items, new_food, self.back_glyph, self.critical_positions, self.concrete_positions, self.num_explored_squares = unpack_msg(message, self.base_map, parse_ammo=parse_ammo, update_base=update_base, parse_monsters=parse_monsters)
+        # if the map section is identical to the last frame's (e.g., when searching or waiting), parsing it again would give the same maps and
+        # positions, as long as the base map was not modified since then: the previous results are kept, and only the status lines are parsed.
+        frame_key = (message[:ROWNO*COLNO], self.cur_pos, update_base and not obscured, parse_monsters, parse_ammo)
+        reuse = self.reuse_identical_frames and frame_key == self.frame_key and self.base_map is not None and np.array_equal(map_rows_to_array(self.base_map), self.parsed_base_codes)
+        self.frame_key = frame_key
+        if reuse:
+            self.obs = self.obs.reuse(self.field_usage)
+            self.num_reused_frames += 1
+        else:
+            self.base_map, self.map, _, _, _, _, _, self.obs = parse_msg(message, self.base_map, parse_ammo=parse_ammo, update_base=update_base, parse_monsters=parse_monsters, field_counts=self.field_usage, status=status)
         if VERBOSE:
             # only call verboseprint if VERBOSE specified to omit computation time of join() call
             verboseprint(''.join(item for innerlist in self.base_map for item in innerlist))
             verboseprint(''.join(item for innerlist in self.map for item in innerlist))
             verboseprint("Top: " + self.top_line)
         
+        if reuse:
+            self.changed_cells = set()
+        else:
+            self.update_changed_cells()
+        self.changed_base_cells = self.sync_base_map(prev_changed_cells)
+        self.parsed_base_codes = self.base_codes
+        
         if self.parse_items:
             self.len_prev_inventory = len(self.inventory)
-            self.inventory = get_inventory(socket)
+            self.update_inventory(socket)
             self.equipped_armor_types = []
             self.num_equipped_rings = 0
             for inven_item, _, _, matched_item, _ in self.inventory:
@@ -95,9 +152,10 @@ class NetHackInfo(object):
                 if 'hand' in inven_item and 'ring' in inven_item:
                     self.num_equipped_rings += 1
             
-            self.item_positions.update(new_items)
-            self.food_positions.update(new_food)
-
+            food = self.obs.codes == ord('%')
+            self.new_items = self.obs.items if self.new_items is None else self.new_items | self.obs.items
+            self.new_food = food if self.new_food is None else self.new_food | food
+        
         if self.back_glyph in ROOM_OPENING_GLYPHS:
             self.room_openings.add((self.cur_pos))
         elif self.back_glyph in CORRIDOR_GLYPHS:
@@ -110,17 +168,162 @@ class NetHackInfo(object):
         
         self.prev_attributes, self.attributes = update_attrs(attmsg, self.attributes)
         self.prev_stats, self.stats = update_stats(sttmsg, self.stats)
-                
+        
         if 'Were' in self.attributes['role_title'] or 'feel feverish' in self.top_line:
             self.player_has_lycanthropy = True
         elif self.player_has_lycanthropy and 'feel purified' in self.top_line:
             self.player_has_lycanthropy = False # TODO: other methods of removing
         
-        if 'laden with moisture' in self.top_line or self.count_char_on_map('.') == 0:
+        if 'laden with moisture' in self.top_line or self.num_floor_squares == 0:
             self.in_fog = True
-        if self.in_fog and ('destroy the fog' in self.top_line or self.count_char_on_map('.') > 3):
+        if self.in_fog and ('destroy the fog' in self.top_line or self.num_floor_squares > 3):
             self.in_fog = False
     
+    @property
+    def monster_positions(self):
+        return self.obs.monster_positions if self.obs is not None else []
+    
+    @property
+    def prev_monster_positions(self):
+        return self.prev_obs.monster_positions if self.prev_obs is not None else []
+    
+    @property
+    def ammo_positions(self):
+        return self.obs.ammo_positions if self.obs is not None else []
+    
+    @property
+    def critical_positions(self):
+        return self.obs.critical_positions if self.obs is not None else []
+    
+    @property
+    def concrete_positions(self):
+        return self.obs.concrete_positions if self.obs is not None else set()
+    
+    @property
+    def num_explored_squares(self):
+        return self.obs.num_explored_squares if self.obs is not None else 0
+    
+    @property
+    def item_positions(self):
+        """Positions where items were seen on the level (positions can be removed by the caller, e.g. once the item is picked up)."""
+        self.count_field_use('item_positions')
+        if self.new_items is not None:
+            self.seen_item_positions.update(get_positions(self.new_items))
+            self.new_items = None
+        return self.seen_item_positions
+    
+    @property
+    def food_positions(self):
+        """Positions where food was seen on the level (positions can be removed by the caller, e.g. once the food is picked up)."""
+        self.count_field_use('food_positions')
+        if self.new_food is not None:
+            self.seen_food_positions.update(get_positions(self.new_food))
+            self.new_food = None
+        return self.seen_food_positions
+    
+    def count_field_use(self, name):
+        # fields accumulated over the level are not computed by the observation itself, so their use is counted here, once per frame.
+        if self.field_usage is not None and name not in self.fields_used:
+            self.fields_used.add(name)
+            self.field_usage[name] = self.field_usage.get(name, 0) + 1
+    
+    def set_field_profiling(self, profile):
+        """Set whether to count, for each observation field (monster_positions, item_positions, ...), the number of frames in which it is used."""
+        self.field_usage = {} if profile else None
+        self.num_profiled_frames = 0
+    
+    def get_field_usage(self):
+        """Return the fraction of the frames processed in which each observation field was used, if profiling."""
+        if not self.field_usage or self.num_profiled_frames == 0:
+            return {}
+        return {name: count / self.num_profiled_frames for name, count in self.field_usage.items()}
+    
+    def set_inventory_caching(self, cache_inventory, check_interval=0):
+        """Set whether the inventory is asked for after every command, or only after commands and messages that can change it.
+        
+        Args:
+            cache_inventory: if True, the last inventory is reused until a command in INVENTORY_CMDS is sent or a message in INVENTORY_MESSAGES is shown
+            check_interval: if > 0, the inventory is also asked for every check_interval steps, and compared to the cached one (a difference is counted in num_inventory_mismatches)
+        """
+        self.cache_inventory = cache_inventory
+        self.inventory_check_interval = check_interval
+    
+    def note_command(self, command):
+        """Mark the cached inventory as stale if the given command (sent to NetHack) can change the inventory."""
+        key = command[0] if type(command) is list else command
+        if key in INVENTORY_CMDS:
+            self.inventory_stale = True
+    
+    def inventory_needed(self):
+        """Return true if the inventory must be asked for after the current command (always, unless the inventory is cached).
+        Messages that signal an inventory change are only known once the reply is processed; process_msg() then asks for the inventory itself."""
+        if not self.parse_items:
+            return False
+        check_due = self.inventory_check_interval > 0 and self.steps_since_inventory + 1 >= self.inventory_check_interval
+        return not self.cache_inventory or self.inventory_stale or check_due
+    
+    def update_inventory(self, socket):
+        """Ask NetHack for the inventory (or use the listing sent along with the message) if needed, otherwise keep the cached one."""
+        message_changed_inventory = self.cache_inventory and message_changes_inventory(self.top_line)
+        if self.inventory_msg is None and not self.inventory_needed() and not message_changed_inventory:
+            self.steps_since_inventory += 1
+            return
+        
+        inventory = get_inventory(socket, self.inventory_msg, self.rcv_inventory)
+        self.inventory_msg = None
+        if self.cache_inventory and not self.inventory_stale and not message_changed_inventory and inventory != self.inventory:
+            self.num_inventory_mismatches += 1
+            verboseprint("Cached inventory was out of date:", self.inventory, "vs.", inventory)
+        self.inventory = inventory
+        self.inventory_stale = False
+        self.steps_since_inventory = 0
+    
+    def update_changed_cells(self):
+        """Find the cells of the map that differ from the previous frame (all of them on the first frame), and update the number of floor squares from them."""
+        prev_codes = self.map_codes
+        self.map_codes = map_rows_to_array(self.map)
+        if prev_codes is None:
+            self.changed_cells = set(get_positions(np.ones((ROWNO, COLNO), dtype=bool)))
+            self.num_floor_squares = 0
+        else:
+            self.changed_cells = set(get_positions(self.map_codes != prev_codes))
+        
+        for i, j in self.changed_cells:
+            if prev_codes is not None and self.prev_map[i][j] == '.':
+                self.num_floor_squares -= 1
+            if self.map[i][j] == '.':
+                self.num_floor_squares += 1
+    
+    def sync_base_map(self, cells=()):
+        """Bring the pathfinding grid of the base map and the uncovered doors up to date, visiting only the base map cells that changed since the last call
+        (whether by a new frame or by a policy writing to the base map). Returns the set of those cells.
+        
+        Args:
+            cells: additional cells whose uncovered door status must be re-examined (those where the previous frame changed)
+        """
+        if self.base_map is None:
+            return set()
+        codes = map_rows_to_array(self.base_map)
+        if self.base_codes is None:
+            changed = set(get_positions(np.ones((ROWNO, COLNO), dtype=bool)))
+        else:
+            changed = set(get_positions(codes != self.base_codes))
+        self.base_codes = codes
+        if changed:
+            self.base_map_version += 1
+        
+        for i, j in changed:
+            self.base_grid[i][j] = 0 if self.base_map[i][j] in PASSABLE_SET else 1
+        
+        if self.prev_map is not None:
+            for i, j in changed.union(cells):
+                cur_char, old_char = self.base_map[i][j], self.prev_map[i][j]
+                if cur_char != old_char and cur_char in DOOR_SET and old_char != '@':
+                    self.uncovered_doors.add((i, j))
+                else:
+                    self.uncovered_doors.discard((i, j))
+        return changed
+    
     def get_cur_weapon(self):
         """Returns the current weapon object wielded by the player, and whether it is cursed or not."""
         for inven_item, _, _, weap_obj, _ in self.inventory:
@@ -135,7 +338,7 @@ class NetHackInfo(object):
             if item_match(item.full_name, stripped_inven_item):
                 return inven_char
         raise Exception("Couldn't match" + str(item) + "to anything in inventory: \n" + str(self.inventory))
-        
+    
     def in_range(self, x, y):
         """Returns true if the given x,y coordinate is within the map bounds."""
         return x >= 0 and x < ROWNO and y >= 0 and y < COLNO
@@ -162,13 +365,8 @@ class NetHackInfo(object):
     def get_uncovered_doors(self):
         """Return the coordinates which in the last turn were revealed to be doors."""
         if self.prev_map is None: return []
-        walls = []
-        for i, row in enumerate(self.base_map):
-            for j, cur_char in enumerate(row):
-                old_char = self.prev_map[i][j]
-                if cur_char != old_char and cur_char in DOOR_CHARS and old_char != '@':
-                    walls.append((i, j))
-        return walls
+        self.sync_base_map()
+        return sorted(self.uncovered_doors)
     
     def get_corridor_exits(self, pos=None, diag=True):
         """Return the corridors adjacent to the given position.
@@ -184,7 +382,7 @@ class NetHackInfo(object):
         exits = []
         for dx, dy in dirs:
             if dx == 0 and dy == 0: continue
-            if self.basemap_char(x+dx, y+dy) in PASSABLE_CHARS:
+            if self.basemap_char(x+dx, y+dy) in PASSABLE_SET:
                 exits.append((x+dx, y+dy))
         return exits
     
@@ -193,7 +391,7 @@ class NetHackInfo(object):
         adjacent = [self.basemap_char(x-1, y), self.basemap_char(x+1, y), self.basemap_char(x, y-1), self.basemap_char(x, y+1)]
         if diag:
             adjacent.extend([self.basemap_char(x-1, y-1), self.basemap_char(x-1, y+1), self.basemap_char(x+1, y-1), self.basemap_char(x+1, y+1)])
-            
+        
         adjacent = list(filter(((-1, -1)).__ne__, adjacent))
         return adjacent
     
@@ -227,13 +425,13 @@ class NetHackInfo(object):
         """Return true if the player is in a room."""
         x, y = self.cur_pos
         adjacent = self.get_chars_adjacent_to(x, y)
-        return True if (self.char_under_player() in ROOM_CHARS and (adjacent.count('.') + adjacent.count('>') + adjacent.count('<') + adjacent.count('^')) >= 2 and self.back_glyph not in ROOM_OPENING_GLYPHS) or adjacent.count('.') == 4 else False
+        return True if (self.char_under_player() in ROOM_SET and (adjacent.count('.') + adjacent.count('>') + adjacent.count('<') + adjacent.count('^')) >= 2 and self.back_glyph not in ROOM_OPENING_GLYPHS) or adjacent.count('.') == 4 else False
     
     def in_corridor(self):
         """Return true if the player is in a corridor."""
         x, y = self.cur_pos
         adjacent = self.get_chars_adjacent_to(x, y)
-        return True if self.cur_pos in self.corridors or (self.char_under_player() in CORRIDOR_CHARS and (adjacent.count('#') + adjacent.count('`') + adjacent.count(' ') + adjacent.count('^')) >= 1) or (adjacent.count('#') + adjacent.count(' ') == 4) else False # or (self.char_under_player() == '.' and (adjacent.count('#') + adjacent.count('`') + adjacent.count(' ') + adjacent.count('^')) >= 2) else False
+        return True if self.cur_pos in self.corridors or (self.char_under_player() in CORRIDOR_SET and (adjacent.count('#') + adjacent.count('`') + adjacent.count(' ') + adjacent.count('^')) >= 1) or (adjacent.count('#') + adjacent.count(' ') == 4) else False # or (self.char_under_player() == '.' and (adjacent.count('#') + adjacent.count('`') + adjacent.count(' ') + adjacent.count('^')) >= 2) else False
     
     def at_intersection(self):
         """Return true if the player is at the intersection of two or more corridors."""
@@ -276,6 +474,7 @@ class NetHackInfo(object):
     
     def pathfind_to(self, target, initial=None, full_path=True, explored_set=None, override_target_traversability=False, override_targets=[]):
         """A* pathfinding from initial to target, where A* can visit any position that has been explored.
+        Paths from the player that do not use explored_set or override_targets are read from the distance field instead, if it is enabled (see get_distance_field()).
         
         Args:
             target: target position to pathfind to.
@@ -287,8 +486,24 @@ class NetHackInfo(object):
         """
         if initial == None:
             initial = self.cur_pos
-
-        if (initial, target) not in self.pathfind_distances:
+        
+        if self.use_distance_field and initial == self.cur_pos and explored_set is None and len(override_targets) == 0:
+            path = self.get_distance_field().get_path(target, override_target_traversability)
+            if type(path) is bool:
+                verboseprint("Error: could not pathfind from", initial, "to", target, "! (target on map:", self.map[target[0]][target[1]], " and basemap:", self.base_map[target[0]][target[1]], ")")
+                raise Exception
+            path.reverse() # path[0] should be next to start node.
+            return path if full_path else path[0]
+        
+        if explored_set is None:
+            explored_key = None
+        elif explored_set is self.explored:
+            explored_key = self.explored_version
+        else:
+            explored_key = frozenset(explored_set)
+        key = (self.grid_version, initial, target, explored_key, override_target_traversability, tuple(override_targets))
+        found, path = self.path_cache.lookup(key)
+        if not found:
             overwritten_chars = {}
             for x, y in override_targets:
                 overwritten_chars[(x, y)] = self.grid[x][y]
@@ -306,31 +521,61 @@ class NetHackInfo(object):
                 raise Exception
             path.reverse() # path[0] should be next to start node.
             
-            self.pathfind_distances[(initial, target)] = path
+            self.path_cache.store(key, path)
         
-        path = self.pathfind_distances[(initial, target)]
         return path if full_path else path[0]
     
+    def get_distance_field(self):
+        """Return the shortest paths from the player to every reachable position (libs.astar.DistanceField), computed once for a given player position and pathfinding grid."""
+        if self.distance_field is None or self.distance_field_key != (self.cur_pos, self.grid_version):
+            self.distance_field = astar.DistanceField(self.grid, self.cur_pos)
+            self.distance_field_key = (self.cur_pos, self.grid_version)
+        return self.distance_field
+    
+    def get_path_length(self, target, override_target_traversability=False):
+        """Return the number of steps of the path from the player to the target, i.e., len(pathfind_to(target, override_target_traversability=...)), without building the path if the distance field is used.
+        
+        Args:
+            target: target position to pathfind to.
+            override_target_traversability: pathfind to target even if it is not traversable by the player (e.g., solid wall).
+        """
+        if not self.use_distance_field:
+            return len(self.pathfind_to(target, override_target_traversability=override_target_traversability))
+        num_steps = self.get_distance_field().get_num_steps(target, override_target_traversability)
+        if num_steps is None:
+            verboseprint("Error: could not pathfind from", self.cur_pos, "to", target, "!")
+            raise Exception
+        return num_steps
+    
     def update_pathfinding_grid(self):
-        """Update the pathfinding grid, setting a 0 if the position is traversable and 1 otherwise."""
-        for i in range(ROWNO):
-            for j in range(COLNO):
-                self.grid[i][j] = 0 if self.base_map[i][j] in PASSABLE_CHARS else 1
+        """Update the pathfinding grid, setting a 0 if the position is traversable and 1 otherwise. Only the base map cells that changed since the last update are re-examined."""
+        self.sync_base_map()
+        if not np.array_equal(self.grid, self.base_grid):
+            np.copyto(self.grid, self.base_grid)
+            self.grid_version += 1
+    
+    def set_traversable(self, pos):
+        """Mark the given position as traversable in the pathfinding grid (until the next update_pathfinding_grid())."""
+        if self.grid[pos[0]][pos[1]] != 0:
+            self.grid[pos[0]][pos[1]] = 0
+            self.grid_version += 1
     
     def mark_explored(self, pos):
         """Add the given position to the explored positions list.
         
         Args:
             pos: position that we want to mark as explored"""
-        self.explored.add((pos))
+        if pos not in self.explored:
+            self.explored.add((pos))
+            self.explored_version += 1
     
     def mark_all_explored(self):
         """Mark all traversable positions in the map observed so far as explored, then update the pathfinding grid."""
-        for i in range(ROWNO):
-            for j in range(COLNO):
-                if self.base_map[i][j] in PASSABLE_CHARS:
-                    self.explored.add((i, j))
         self.update_pathfinding_grid()
+        num_explored = len(self.explored)
+        self.explored.update(get_positions(self.base_grid == 0))
+        if len(self.explored) != num_explored:
+            self.explored_version += 1
 
 class NetHackEnv(gym.Env, utils.EzPickle):
     """Basic NetHack environment. Must be subclassed. Contains statistics saving/loading methods and NetHack process management."""
@@ -343,14 +588,28 @@ class NetHackEnv(gym.Env, utils.EzPickle):
         """
         
         super().__init__()
-
+        
         self.socket = None
         self.context = zmq.Context()
-
+        self.nh_pool_size = 0
+        self.prefetch_games = False
+        self.batch_commands = False
+        self.next_game = None # (socket, params, attributes) of the game started ahead of time for the next episode, if any (see get_game_params())
+        self.first_reply = None # (first frame, inventory listing or None) of the next game, if already received (see reset())
+        self.game_processes = {} # socket -> (port, pid) of each NetHack process launched and not yet quit
+        self.game_params = {} # parameters the current game was launched with
+        self.game_rng = random.Random() # random choices of get_game_params() (seeded in set_config())
+        self.game_commands = [] # commands sent to the current game so far
+        self.monitor = None
+        self.pending_keys = [] # keys of the command sent by send_action() still to be sent, one per prompt
+        self.pending_reply = None # (kind, time.perf_counter() when it was asked for) of the reply awaited after send_action()
+        self.retry_on_crash = False
+        self.raw_frames = False
+        
         self.records = {}
         #self.fname_infos = []
         self.total_num_games = 0
-                
+        
         self.single = nhinfo is None # if only this environment will be running, i.e., not Level.
         self.nh = nhinfo
     
@@ -376,8 +635,20 @@ class NetHackEnv(gym.Env, utils.EzPickle):
                 dill.dump(self.records[record_type], output)
     
     def close(self):
-        """Save records."""
+        """Save records, and quit the game started for the next episode, if any."""
         self.save_records()
+        if self.nh is not None:
+            verboseprint("Path cache:", self.nh.path_cache.get_stats())
+        if self.nh is not None and self.nh.field_usage is not None:
+            print("Observation fields used (fraction of frames):", ', '.join("{}: {:.2f}".format(name, frac) for name, frac in sorted(self.nh.get_field_usage().items())))
+        if self.next_game is not None:
+            socket = self.next_game[0]
+            try:
+                rcv_msg(socket) # the REP socket has to receive the first frame before it can send the quit command.
+            except zmq.error.Again:
+                pass
+            self.quit_game(socket)
+            self.next_game = None
         #if self.daemon_socket is not None:
         #    self.daemon_socket.send("exit".encode())
         super().close()
@@ -390,7 +661,7 @@ class NetHackEnv(gym.Env, utils.EzPickle):
             #self.policy.name
         ]
     
-    def set_config(self, proc_id, num_procs, name, parse_items, **args):
+    def set_config(self, proc_id, num_procs, name, parse_items, prefetch_games=False, transport='tcp', batch_commands=False, adaptive_timeout=True, retry_on_crash=False, cache_inventory=False, inventory_check_interval=0, raw_frames=False, profile_fields=False, reuse_identical_frames=True, distance_field=False, path_cache_size=4096, game_seed=1337, **args):
         """Set config and connect to the NetHack launcher daemon.
         
         Args:
@@ -398,11 +669,32 @@ class NetHackEnv(gym.Env, utils.EzPickle):
             num_procs: number of processes to run in parallel - used if grid search is running
             name: to be used for the record folder name
             parse_items: whether to handle items in the environment or not
+            prefetch_games: if True, the NetHack process for the next episode is started at the beginning of the current one, so that reset() does not have to wait for it to boot
+            transport: 'tcp' or 'ipc' (Unix domain sockets) for the links to the daemon and to the NetHack processes. The daemon must be started with the same transport; with 'ipc', the socket files of the games are put in a directory made for this run (conn.get_ipc_dir()), and NetHack is given the endpoint to connect to with its -endpoint option.
+            batch_commands: if True, all keys of a command (and the request for the inventory listing) are sent to NetHack in one message, and come back in one reply; otherwise each key is a separate round trip. Requires a NetHack build that handles multipart messages.
+            adaptive_timeout: if True, the timeout for each kind of reply of NetHack (see ConnectionMonitor) is learned from its previous reply times, never going below the fixed 2s timeout used otherwise, and a crashed NetHack process is detected while waiting instead of at the timeout
+            retry_on_crash: if True and the game was started with a fixed seed, a game that crashes or stops responding is relaunched and the commands sent so far are replayed on it, so that the episode can go on
+            cache_inventory: if True (and parse_items is set), the inventory is only asked for after commands and top-line messages that can change it, instead of after every command
+            inventory_check_interval: if > 0 (and cache_inventory is set), the inventory is also asked for every inventory_check_interval steps, to check that the cached one is still up to date
+            raw_frames: if True, frames received from NetHack are kept as bytes (conn.RawFrame) instead of being decoded to str; only the parts parsed as text are decoded. Not a speedup: building the character grid of the map takes as long as decoding the frame (see benchmarks/rawframes.py), so both modes handle a frame in about the same time
+            profile_fields: if True, the number of frames in which each observation field (monster_positions, item_positions, ...) is used is counted, and printed when the env is closed
+            reuse_identical_frames: if True, a frame whose map section is identical to the previous frame's (e.g., when searching or waiting) reuses the previous parse of the map, and only its status lines are parsed
+            distance_field: if True, paths from the player that do not prefer explored positions (e.g., the distances to frontiers) are all read from one shortest-path search per turn, instead of one A* search each. The paths have the same cost, but among the paths of least cost the distance field keeps the one with the fewest steps, where A* may return another: the step counts of these distances (used by the exploration policies to pick their targets and by the level policy to pick its exit) can then differ from A*'s, and so can the agents' choices
+            path_cache_size: maximum number of paths kept by pathfind_to() (and by the exploration env's search through unexplored positions); the least recently used ones are evicted
+            game_seed: seed of the random choices made for each game by get_game_params() (role, items, monster, ...), combined with proc_id so that the environments of a run make different choices; None for unseeded choices
         """
         
         self.name = name
         self.proc_id = proc_id
         self.num_procs = num_procs
+        self.prefetch_games = prefetch_games
+        assert transport in TRANSPORTS
+        self.transport = transport
+        self.batch_commands = batch_commands
+        self.monitor = ConnectionMonitor() if adaptive_timeout else None
+        self.retry_on_crash = retry_on_crash
+        self.raw_frames = raw_frames
+        self.game_rng = random.Random(None if game_seed is None else "{}-{}".format(game_seed, proc_id))
         
         self.savedir = '_'.join(self.get_savedir_info_list()) + '/'
         self.basedir = deepcopy(self.savedir)
@@ -413,43 +705,85 @@ class NetHackEnv(gym.Env, utils.EzPickle):
         self.parse_items = parse_items
         if self.nh is None:
             self.nh = NetHackInfo(parse_items)
+        self.nh.set_inventory_caching(cache_inventory, inventory_check_interval)
+        self.nh.set_field_profiling(profile_fields)
+        self.nh.reuse_identical_frames = reuse_identical_frames
+        self.nh.use_distance_field = distance_field
+        self.nh.path_cache.max_size = path_cache_size
+        if self.single and self.monitor is not None:
+            self.nh.rcv_inventory = lambda: self.rcv_reply('inventory')
         
         #spawn_daemon(self.proc_id)
         #time.sleep(2)
         if self.single:
             verboseprint("Connecting to daemon...")
             self.daemon_socket = self.context.socket(zmq.REQ)
-            self.daemon_socket.connect("tcp://localhost:" + str(5555-self.proc_id-1))
-            self.daemon_socket.send("test".encode())
-            self.daemon_socket.recv()
+            self.daemon_socket.connect(get_daemon_endpoint(self.transport))
+            # the daemon's NetHack processes for this env connect with the same transport, and find their sockets in this run's directory.
+            test_msg = ["test", str(self.proc_id), self.transport] + ([get_ipc_dir()] if self.transport == 'ipc' else [])
+            self.daemon_socket.send(" ".join(test_msg).encode())
+            self.nh_pool_size = int(get_daemon_reply(self.daemon_socket.recv())) # number of NetHack processes the daemon keeps booted ahead of time
             verboseprint("Connected")
     
-    def reset(self):
+    def launch_game(self):
+        """Have the daemon launch a NetHack process, and return a socket bound to the port that process will connect to."""
+        return self.connect_game(*launch_nh(self.daemon_socket, self.proc_id, self.get_live_ports()))
+    
+    def get_live_ports(self):
+        """Ports of the NetHack processes launched and not yet quit, which the daemon must not hand out again."""
+        return [port for port, _ in self.game_processes.values()]
+    
+    def connect_game(self, nh_port, nh_pid):
+        """Return a socket bound to the port that the NetHack process launched by the daemon (with the given port and pid) will connect to."""
+        socket = self.context.socket(zmq.REP)
+        socket.RCVTIMEO = 2000
+        socket.bind(get_endpoint(nh_port, self.transport, bind=True))
+        if self.raw_frames:
+            raw_frame_sockets.add(socket)
+        self.game_processes[socket] = (nh_port, nh_pid)
+        return socket
+    
+    def quit_game(self, socket):
+        """Quit the NetHack process connected to the given socket (having the daemon kill it if it does not respond), and close the socket."""
+        kill_nh(socket, self.daemon_socket, self.game_processes[socket][0])
+        self.close_game(socket)
+    
+    def close_game(self, socket):
+        """Close the socket of a NetHack process that was quit, and forget the process."""
+        self.game_processes.pop(socket)
+        socket.close()
+        raw_frame_sockets.discard(socket)
+    
+    def kill_game(self):
+        """Quit the current NetHack process, if any."""
+        if self.socket is not None:
+            self.quit_game(self.socket)
+            self.socket = None
+    
+    def reset(self, socket=None):
         """Prepare the environment for a new map.
-        Kills the current NetHack process and launches a new one."""
-
+        Kills the current NetHack process and launches a new one.
+        
+        Args:
+            socket: socket of a NetHack process already launched with launch_game(), to be used instead of launching a new one
+        """
+        
         while True:
             global log_str
             log_str = ""
             
             self.nh.reset()
             
-            if self.socket is not None:
-                kill_nh(self.socket)
-                self.socket.close()
-                self.socket = None
+            self.kill_game()
+            self.socket = socket if socket is not None else self.launch_game()
+            self.game_commands = []
             
-            if self.num_procs == 1:
-                os.system("killall nethack > /dev/null 2>&1")
-                os.system("rm nethack-3.6.0/game/*lock* > /dev/null 2>&1")
-            
-            launch_nh(self.daemon_socket)
-            self.socket = self.context.socket(zmq.REP)
-            self.socket.RCVTIMEO = 2000
-            self.socket.bind("tcp://*:" + str(5555 + self.proc_id))
-        
-            # get observation
-            message = rcv_msg(self.socket)
+            # get observation (unless it was already received along with the inventory listing, e.g. by AsyncNetHackEnv.reset()).
+            if self.first_reply is not None:
+                message, self.nh.inventory_msg = self.first_reply
+                self.first_reply = None
+            else:
+                message = rcv_msg(self.socket)
             self.process_msg(message)
             
             break
@@ -512,20 +846,45 @@ class NetHackRLEnv(NetHackEnv):
         
         if self.total_num_games == self.max_num_episodes:
             self.save_records()
+    
+    def get_game_params(self, game_num, rng):
+        """Parameters to pass to NetHack on the creation of a new game (saved in the options file), and the attributes of the environment that go with that game.
+        Must not modify the environment, since the game may be launched before the current episode ends (see prefetch_game()): the attributes are set by apply_game_params() when the game starts.
+        
+        Args:
+            game_num: number of the game (the value of total_num_games during its episode)
+            rng: random.Random to make any random choices with
         
-    def get_game_params(self):
-        """Parameters to pass to NetHack on the creation of a new game. (Will be saved in the options file.)"""
+        Returns the dict of parameters and the dict of attributes.
+        """
         return {
             'proc_id': self.proc_id
-        }
+        }, {}
+    
+    def apply_game_params(self, params, attributes):
+        """Set the attributes that go with the game being started, as returned by get_game_params() along with its parameters."""
+        self.game_params = params
+        for name, value in attributes.items():
+            setattr(self, name, value)
     
     def reset(self):
         """Prepare the environment for a new episode."""
         self.total_actions_this_episode = 0
         self.last_action = None
         if self.single:
-            save_nh_conf(**self.get_game_params())
-            super().reset() # launch nh
+            if self.next_game is None:
+                params, attributes = self.get_game_params(self.total_num_games, self.game_rng)
+                save_nh_conf(**params)
+                self.apply_game_params(params, attributes)
+                super().reset() # launch nh
+            else:
+                socket, params, attributes = self.next_game
+                self.next_game = None
+                self.apply_game_params(params, attributes)
+                super().reset(socket)
+            
+            if self.prefetch_games:
+                self.prefetch_game()
             
             status = self.start_episode()
             assert status
@@ -533,24 +892,92 @@ class NetHackRLEnv(NetHackEnv):
             self.state = self.get_state()
             return self.state, self.get_valid_action_indices()
     
+    def new_game_on_reset(self):
+        """Whether the next call to reset() will launch a new NetHack game."""
+        return self.single
+    
+    def prefetch_game(self):
+        """Write the options file for the next episode and launch its NetHack process now, while the current episode runs."""
+        params, attributes = self.get_game_params(self.total_num_games + 1, self.game_rng)
+        save_nh_conf(**params)
+        self.next_game = (self.launch_game(), params, attributes)
+    
     def step(self, action):
         """Take the given action, receive the message output from NetHack and return the new state."""
         self.start_turn()
-        status = Terminals.OK
         try:
             # Try to take the action.
             message = self.take_action(action)
             #assert not self.last_action_impossible
             if message is None:
-                message = rcv_msg(self.socket)
+                message = self.rcv_reply()
         except zmq.error.Again:
+            message = self.replay_game() if self.retry_on_crash else None
+        
+        return self.finish_step(message)
+    
+    def rcv_reply(self, kind='step'):
+        """Receive NetHack's reply to the command just sent, of the given kind (see ConnectionMonitor)."""
+        if self.monitor is None:
+            return rcv_msg(self.socket)
+        return self.monitor.rcv_msg(self.socket, self.game_processes[self.socket][1], kind)
+    
+    def wait_reply(self, kind='step'):
+        """Wait until NetHack's reply to the command just sent can be received (see rcv_reply())."""
+        if self.monitor is not None:
+            self.monitor.wait(self.socket, self.game_processes[self.socket][1], kind)
+    
+    def set_reply_timeout(self, kind='step'):
+        """Set the socket's timeout to the current one of the given kind of reply, for the waits that do not go through rcv_reply() (see AsyncNetHackEnv)."""
+        if self.monitor is not None:
+            self.socket.RCVTIMEO = self.monitor.get_timeout(kind)
+    
+    def replay_game(self):
+        """Replace the current NetHack process (which crashed or stopped responding) with a new one launched with the same parameters,
+        and send it all commands sent to the old one. Only possible if the game was launched with a fixed seed.
+        
+        Returns NetHack's reply to the last command (the one that got no reply), or None if the game could not be replayed.
+        """
+        if self.game_params.get('seed', -1) < 0:
+            return None
+        
+        print("Replaying", len(self.game_commands), "commands on a new NetHack process, process", self.proc_id)
+        game_commands = self.game_commands
+        self.kill_game()
+        save_nh_conf(**self.game_params)
+        self.socket = self.launch_game()
+        self.game_commands = game_commands
+        try:
+            message = rcv_msg(self.socket)
+            for command in self.game_commands:
+                message = send_msg(self.socket, command)
+                if message is None:
+                    message = rcv_msg(self.socket)
+        except zmq.error.Again:
+            return None
+        if self.nh.parse_items:
+            self.nh.inventory_stale = True
+        return message
+    
+    def finish_step(self, message):
+        """Process the message outputted by NetHack in response to the action sent by take_action(), and return the new state (as in step()).
+        
+        Args:
+            message: the message received from NetHack, or None if communication with NetHack failed
+        """
+        return self.complete_step(message, self.get_step_status(message))
+    
+    def get_step_status(self, message):
+        """Check whether the message outputted by NetHack after an action (None if communication failed) ends the episode, and return the terminal status."""
+        status = Terminals.OK
+        if message is None:
             print("Error when sending action, process", self.proc_id)
             message = ""
             status = Terminals.CONN_ERROR
             self.goal_reached = Goals.CONN_ERROR
         
         if "paniclog" in message or "***dir***" in message:
-            raise Exception("Unexpected message received from NetHack: " + message)
+            raise Exception("Unexpected message received from NetHack: " + str(message))
         
         if self.should_end_episode():
             verboseprint("Game went too long, terminating...")
@@ -559,7 +986,11 @@ class NetHackRLEnv(NetHackEnv):
         
         if status is Terminals.OK:
             status, self.goal_reached = self.get_status(message)
-                
+        
+        return status
+    
+    def complete_step(self, message, status):
+        """Process the message outputted by NetHack (if the episode goes on), and return the new state, reward, etc. as in step()."""
         if status is Terminals.OK:
             self.process_msg(message)
             self.state = self.get_state()
@@ -591,17 +1022,72 @@ class NetHackRLEnv(NetHackEnv):
     
     def take_action(self, action):
         """Send the action to NetHack."""
+        action = self.prepare_action(action)
+        if self.batch_commands:
+            message, self.nh.inventory_msg = send_batch_msg(self.socket, action, with_inventory=self.nh.inventory_needed(), wait=lambda: self.wait_reply('batch'))
+        else:
+            message = send_msg(self.socket, action, lambda: self.rcv_reply('intermediate'))
+        #self.last_action_impossible = False
+        self.total_actions_this_episode += 1
+        return message
+    
+    def send_action(self, action):
+        """Send the action to NetHack without waiting for any reply, for stepping several games at once (see NetHackVecEnv): the whole command
+        if batching commands, else its first key, the other keys being sent by rcv_pending_reply() as their prompts come up."""
+        action = self.prepare_action(action)
+        if self.batch_commands:
+            self.pending_keys = []
+            self.socket.send_multipart(get_batch_parts(action, self.nh.inventory_needed()), zmq.NOBLOCK)
+            self.pending_reply = ('batch', time.perf_counter())
+        else:
+            keys = action if type(action) is list else [action]
+            self.pending_keys = keys[1:]
+            self.send_key(keys[0], 'intermediate' if len(self.pending_keys) > 0 else 'step')
+        self.total_actions_this_episode += 1
+    
+    def send_key(self, key, kind):
+        """Send a key to NetHack without waiting for its reply, which is of the given kind (see ConnectionMonitor)."""
+        self.socket.send(key.encode(), zmq.NOBLOCK)
+        self.pending_reply = (kind, time.perf_counter())
+    
+    def rcv_pending_reply(self):
+        """Receive the reply awaited after send_action() or send_key(), once it has arrived. Returns it (the inventory listing for an
+        inventory request, else the screen following the action), or None if it is the prompt of the next key of the command, which is then sent."""
+        kind, start = self.pending_reply
+        self.pending_reply = None
+        if self.monitor is not None:
+            self.monitor.record((time.perf_counter() - start) * 1000, kind)
+        if kind == 'batch':
+            message, self.nh.inventory_msg = get_batch_reply(self.socket, self.socket.recv_multipart())
+            return message
         
+        message = rcv_msg(self.socket)
+        if kind == 'intermediate' and "***dir***" in message:
+            key = self.pending_keys.pop(0)
+            self.send_key(key, 'intermediate' if len(self.pending_keys) > 0 else 'step')
+            return None
+        self.pending_keys = []
+        return message
+    
+    def pending_reply_overdue(self):
+        """Whether the reply awaited after send_action() or send_key() is past its timeout, or the NetHack process died (if adaptive_timeout is set, see ConnectionMonitor)."""
+        kind, start = self.pending_reply
+        if self.monitor is None:
+            return time.perf_counter() > start + self.socket.RCVTIMEO / 1000
+        return self.monitor.is_overdue(start, self.game_processes[self.socket][1], kind)
+    
+    def prepare_action(self, action):
+        """Record the action about to be sent by take_action(), and return the command to send for it."""
         self.last_action = action
         
         action = self.process_action(action)
         assert action is not None #self.last_action_impossible = True
         
         verboseprint("Sending", action)
-        message = send_msg(self.socket, action)
-        #self.last_action_impossible = False
-        self.total_actions_this_episode += 1
-        return message
+        self.game_commands.append(action)
+        if self.nh.parse_items:
+            self.nh.note_command(action)
+        return action
     
     def process_action(self, action):
         """Do any preprocessing required on the action selected, e.g., get the CMD object from the abilities list."""
@@ -81,7 +81,7 @@ class NetHackCombatEnv(NetHackRLEnv):
                     else:
                         normal_combats.append(combat)
         
-            random.seed(1337)
+            sample_rng = np.random.RandomState(1337) # the same records are sampled on every run
             sampled_combats = []
             
             stateff_combats = [x for sublist in combats_per_stateff for x in sublist]
@@ -92,7 +92,7 @@ class NetHackCombatEnv(NetHackRLEnv):
                     recs = stateff_combats
                 else:
                     dist = stats.planck(0.01).pmf(range(len(stateff_combats)))
-                    chosen_indices = np.random.choice(list(reversed(range(len(stateff_combats)))), size=num_recs_to_sample, replace=False, p=dist)
+                    chosen_indices = sample_rng.choice(list(reversed(range(len(stateff_combats)))), size=num_recs_to_sample, replace=False, p=dist)
                     recs = [stateff_combats[i] for i in chosen_indices]
                 sampled_combats.extend(recs)
                 effective_stateff_ratio = len(recs) / len(combats)
@@ -104,7 +104,7 @@ class NetHackCombatEnv(NetHackRLEnv):
                     recs = were_combats
                 else:
                     dist = stats.planck(0.01).pmf(range(len(were_combats)))
-                    chosen_indices = np.random.choice(list(reversed(range(len(were_combats)))), size=num_recs_to_sample, replace=False, p=dist)
+                    chosen_indices = sample_rng.choice(list(reversed(range(len(were_combats)))), size=num_recs_to_sample, replace=False, p=dist)
                     recs = [were_combats[i] for i in chosen_indices]
                 sampled_combats.extend(recs)
                 effective_were_ratio = len(recs) / len(combats)
@@ -116,7 +116,7 @@ class NetHackCombatEnv(NetHackRLEnv):
                     recs = normal_combats
                 else:
                     dist = stats.planck(0.1).pmf(range(len(normal_combats)))
-                    chosen_indices = np.random.choice(list(reversed(range(len(normal_combats)))), size=num_recs_to_sample, replace=False, p=dist)
+                    chosen_indices = sample_rng.choice(list(reversed(range(len(normal_combats)))), size=num_recs_to_sample, replace=False, p=dist)
                     recs = [normal_combats[i] for i in chosen_indices]
                 sampled_combats.extend(recs)
             
@@ -255,83 +255,95 @@ class NetHackCombatEnv(NetHackRLEnv):
         #    ]
         
         super().set_config(proc_id, action_size=len(self.abilities), state_size=self.input_size, parse_items=True, max_num_actions=num_actions, max_num_episodes=num_episodes, max_num_actions_per_episode=200, **args)
-    
-    def get_game_params(self):
-        """Parameters to pass to NetHack on the creation of a new game. (Will be saved in the NetHack options file.)"""
         
-        self.switch_encounter()
-        role = self.get_initial_role()
-        self.starting_items, self.starting_item_names = self.get_initial_inventory()
-        self.cur_monster = random.choice(self.get_initial_monsters()).lower()
-        self.initial_monster = self.cur_monster
+    def get_game_params(self, game_num, rng):
+        """Parameters to pass to NetHack on the creation of a new game (saved in the NetHack options file), and the attributes of the environment for that game (see NetHackRLEnv.get_game_params())."""
+        
+        enc_counter = self.cur_enc_counter if self.from_file else None
+        while True:
+            attributes = self.get_encounter(enc_counter) if self.from_file else {}
+            role = self.get_initial_role(rng)
+            attributes['starting_items'], attributes['starting_item_names'] = self.get_initial_inventory(rng, attributes)
+            attributes['cur_monster'] = rng.choice(self.get_initial_monsters(attributes)).lower()
+            attributes['initial_monster'] = attributes['cur_monster']
+            if not self.from_file or attributes['cur_monster'] in NH_MONS:
+                break
+            
+            # skip to the next encounter.
+            append("Couldn't combat with " + attributes['cur_monster'], self.savedir+"/errors")
+            enc_counter += 1
+            if enc_counter - self.cur_enc_counter >= self.num_combat_encounters:
+                raise Exception("None of the monsters of the combat encounters can be fought.")
         
         if not self.from_file:
-            self.clvl = MONSTERS[MONSTER_NAMES.index(self.cur_monster)][1] + self.clvl_to_mlvl_diff
+            attributes['clvl'] = MONSTERS[MONSTER_NAMES.index(attributes['cur_monster'])][1] + self.clvl_to_mlvl_diff
             num_armor_classes = 11 - -40 # 51
             num_levels = 31 - 1 # 30
             ac_lvl_ratio = num_armor_classes / num_levels # 1.7
             if self.fixed_ac < 999:
-                self.ac = self.fixed_ac
+                attributes['ac'] = self.fixed_ac
             else:
-                self.ac = 11 - ((self.clvl) * ac_lvl_ratio)
-        else:
-            if self.cur_monster not in NH_MONS:
-                append("Couldn't combat with " + self.cur_monster, self.savedir+"/errors")
-                self.reset()
-                
+                attributes['ac'] = 11 - ((attributes['clvl']) * ac_lvl_ratio)
+        dlvl = attributes['dlvl'] if self.from_file else self.dlvl
+        
         return {
             'proc_id': self.proc_id,
             'character': role,
-            'clvl': self.clvl,
-            'inven': self.starting_item_names,
-            'mtype': NH_MONS.index(self.cur_monster),
-            'ac': self.ac,
-            'dlvl': self.dlvl,
-            'adj_mlvl': True if self.from_file or self.dlvl > 1 else False,
-            'st': self.st if self.from_file else 0,
-            'dx': self.dx if self.from_file else 0,
-            'lyc': self.lyc_type if self.from_file else None,
-            'stateffs': self.stateff_flags if self.from_file else 1
-        }
+            'clvl': attributes['clvl'],
+            'inven': attributes['starting_item_names'],
+            'mtype': NH_MONS.index(attributes['cur_monster']),
+            'ac': attributes['ac'],
+            'dlvl': dlvl,
+            'adj_mlvl': True if self.from_file or dlvl > 1 else False,
+            'st': attributes['st'] if self.from_file else 0,
+            'dx': attributes['dx'] if self.from_file else 0,
+            'lyc': attributes['lyc_type'] if self.from_file else None,
+            'stateffs': attributes['stateff_flags'] if self.from_file else 1
+        }, attributes
     
-    def switch_encounter(self):
-        """Called at the start of a new episode. If training on combats from file, switches to the next combat in the list."""
+    def apply_game_params(self, params, attributes):
+        """Set the attributes that go with the game being started. If training on combats from file, also set the player's lycanthropy from the encounter, and save the encounter counter."""
+        super().apply_game_params(params, attributes)
         if not self.from_file:
             return
         
-        cur_enc = self.combat_records[self.cur_enc_counter%self.num_combat_encounters]
-        self.cur_enc_counter += 1
-        
-        self.enc_start_items = cur_enc.start_items
-        self.monsters = [cur_enc.monster]
-        self.clvl = cur_enc.start_stats['exp']
-        self.st = cur_enc.start_attributes['st']
-        self.dx = cur_enc.start_attributes['dx']
-        self.ac = cur_enc.start_stats['ac']
-        self.dlvl = cur_enc.start_stats['dlvl']
-        self.start_state = cur_enc.start_state
-        self.start_stateffs = cur_enc.start_stateffs
+        self.nh.player_has_lycanthropy = self.lyc_type is not None
+        if self.cur_enc_counter % 1000:
+            with open(self.savedir+"enccount.dll", 'wb') as output:
+                dill.dump(self.cur_enc_counter, output)            
     
-        self.stateff_flags = 1
-        for s_eff, prime in zip(self.start_stateffs, [1, 1, 1, 1, 2, 3, 5, 1, 1, 1, 1, 1, 7]):
+    def get_encounter(self, enc_counter):
+        """If training on combats from file, return the attributes of the environment for the combat at the given position in the list (and the position of the next one, as cur_enc_counter)."""
+        cur_enc = self.combat_records[enc_counter%self.num_combat_encounters]
+        attributes = {
+            'cur_enc_counter': enc_counter + 1,
+            'enc_start_items': cur_enc.start_items,
+            'monsters': [cur_enc.monster],
+            'clvl': cur_enc.start_stats['exp'],
+            'st': cur_enc.start_attributes['st'],
+            'dx': cur_enc.start_attributes['dx'],
+            'ac': cur_enc.start_stats['ac'],
+            'dlvl': cur_enc.start_stats['dlvl'],
+            'start_state': cur_enc.start_state,
+            'start_stateffs': cur_enc.start_stateffs
+        }
+    
+        attributes['stateff_flags'] = 1
+        for s_eff, prime in zip(cur_enc.start_stateffs, [1, 1, 1, 1, 2, 3, 5, 1, 1, 1, 1, 1, 7]):
             if s_eff == 1:
-                self.stateff_flags *= prime
+                attributes['stateff_flags'] *= prime
     
-        self.nh.player_has_lycanthropy = 'Were' in cur_enc.start_attributes['role_title']
-        self.lyc_type = None
-        if self.nh.player_has_lycanthropy:
+        attributes['lyc_type'] = None
+        if 'Were' in cur_enc.start_attributes['role_title']:
             if 'rat' in cur_enc.start_attributes['role_title']:
-                self.lyc_type = 0
+                attributes['lyc_type'] = 0
             elif 'jackal' in cur_enc.start_attributes['role_title']:
-                self.lyc_type = 1
+                attributes['lyc_type'] = 1
             elif 'wolf' in cur_enc.start_attributes['role_title']:
-                self.lyc_type = 2
+                attributes['lyc_type'] = 2
             else:
                 raise Exception("Unknown lycanthropic type..!")
-    
-        if self.cur_enc_counter % 1000:
-            with open(self.savedir+"enccount.dll", 'wb') as output:
-                dill.dump(self.cur_enc_counter, output)            
+        return attributes
     
     def reset(self):
         """Prepare the environment for a new episode."""
@@ -594,21 +606,25 @@ class NetHackCombatEnv(NetHackRLEnv):
                 items.append(item)
         return items
         
-    def get_initial_role(self):
+    def get_initial_role(self, rng):
         """Get player's initial role for each episode."""
-        return random.choice(self.starting_roles)
+        return rng.choice(self.starting_roles)
     
-    def get_initial_inventory(self):
-        """Get player's starting inventory for each episode."""
+    def get_initial_inventory(self, rng, encounter):
+        """Get player's starting inventory for each episode.
+        
+        Args:
+            rng: random.Random to sample the items with
+            encounter: if training on combats from file, the attributes of the encounter (see get_encounter())
+        """
         if self.from_file:
-            item_names = []
-            for j, (inven_item, x, stripped_name, matched_item, qty) in enumerate(self.enc_start_items):
+            items, item_names = [], []
+            for inven_item, x, stripped_name, matched_item, qty in encounter['enc_start_items']:
                 matchname = matched_item.full_name
                 new_matched_item = matched_item
                 if 'ring mail' in matchname and '+' not in matchname and '-' not in matchname:
                     matchname = matchname.replace("cursed ", "cursed +0 ").replace("blessed ", "blessed +0 ")
                     new_matched_item = matched_item._replace(full_name = matchname)
-                    self.enc_start_items[j] = (inven_item, x, stripped_name, new_matched_item, qty)
                 if stripped_name in IGNORED_ITEMS:
                     continue
                 if equipped(inven_item):
@@ -618,63 +634,63 @@ class NetHackCombatEnv(NetHackRLEnv):
                 items.append(new_matched_item)
             return items, item_names
         elif self.item_sampling == 'all':
-            items = self.items
+            items = list(self.items)
         elif self.item_sampling == 'uniform':
             if len(self.items) == 0:
                 return [], []
-            items = random.sample(self.items, self.num_start_items)
+            items = rng.sample(self.items, self.num_start_items)
         elif self.item_sampling == 'type':
             items = []
             
             # one melee weapon per selected materials (4 total)
             #melee_weapons = [weap for weap in self.items if weap.type == 'melee' and weap.buc == 'uncursed' and weap.enchantment == '+0' and weap.condition == '']
             for material in ['iron', 'silver', 'wood']:
-                items.append(random.choice([weap for weap in self.items if weap.type == 'melee' and weap.material == material and weap.buc == 'uncursed' and weap.enchantment == '+0' and weap.condition == '']))
-            #items.extend(random.sample(melee_weapons, 3))
+                items.append(rng.choice([weap for weap in self.items if weap.type == 'melee' and weap.material == material and weap.buc == 'uncursed' and weap.enchantment == '+0' and weap.condition == '']))
+            #items.extend(rng.sample(melee_weapons, 3))
             
             # add ranged weap
-            items.append(random.choice([weap for weap in self.items if weap.type == 'ranged']))
+            items.append(rng.choice([weap for weap in self.items if weap.type == 'ranged']))
             
             # add 10 of two random ammo types per ranged weap.
             num_ranged = len([weap for weap in items if weap.type == 'ranged' and weap.buc == 'uncursed' and weap.enchantment == '+0' and weap.condition == ''])
             for i in range(num_ranged):
-                ammo_types = random.sample([proj for proj in PROJECTILES if proj.buc == 'uncursed' and proj.enchantment == '+0' and proj.condition == ''], 2)
+                ammo_types = rng.sample([proj for proj in PROJECTILES if proj.buc == 'uncursed' and proj.enchantment == '+0' and proj.condition == ''], 2)
                 for ammo in ammo_types:
                     #for i in range(10):
                     items.append(ammo)
             
             # ensure at least one weap for small/large damage bias (skip 'equal' bias type)
             #if not any(weap.dsize == 'small' for weap in items):
-            #    items.append(random.choice([weap for weap in self.items if weap.type in ['melee', 'ranged'] and weap.dsize == 'small']))
+            #    items.append(rng.choice([weap for weap in self.items if weap.type in ['melee', 'ranged'] and weap.dsize == 'small']))
             #if not any(weap.dsize == 'large' for weap in items):
-            #    items.append(random.choice([weap for weap in self.items if weap.type in ['melee', 'ranged'] and weap.dsize == 'large']))
+            #    items.append(rng.choice([weap for weap in self.items if weap.type in ['melee', 'ranged'] and weap.dsize == 'large']))
             
             if self.action_list != 'weapons_only':
                 # 2 random potions
                 potions = [pot for pot in self.items if pot.type == 'potion']
                 if len(potions) > 0:
-                    items.extend(random.sample(potions, 3))
+                    items.extend(rng.sample(potions, 3))
             
                 # 2 random scrolls
                 scrolls = [pot for pot in self.items if pot.type == 'scroll']
                 if len(scrolls) > 0:
-                    items.extend(random.sample(scrolls, 3))
+                    items.extend(rng.sample(scrolls, 3))
             
                 # 2 random wands
                 wands = [item for item in self.items if item.type == 'wand']
                 if len(wands) > 0:
-                    items.extend(random.sample(wands, 3))
+                    items.extend(rng.sample(wands, 3))
                 
                 rings = [item for item in self.items if item.type == 'ring']
                 if len(rings) > 0:
-                    items.extend(random.sample(rings, 5))
+                    items.extend(rng.sample(rings, 5))
             
                 # five diff. armors
-                #selected_armor_type = random.choice(ARMOR_TYPES)
+                #selected_armor_type = rng.choice(ARMOR_TYPES)
                 armors = [item for item in self.items if item.type in ARMOR_TYPES and 'dragon scale mail' in item.full_name and 'gray' not in item.full_name]
                 items.extend(armors)
                 #if len(armors) > 0:
-                #    items.extend(random.sample(armors, 4))
+                #    items.extend(rng.sample(armors, 4))
                 
                 # 5 weaps + 2*10 ammo + 3 items + 5 armors = 15 items in inven.
         else:
@@ -695,9 +711,9 @@ class NetHackCombatEnv(NetHackRLEnv):
         
         return items, item_names
     
-    def get_initial_monsters(self):
-        """Get the possible monsters for each episode."""
-        return self.monsters if not self.from_file else self.monsters[0]
+    def get_initial_monsters(self, encounter):
+        """Get the possible monsters for each episode (those of the encounter, if training on combats from file)."""
+        return self.monsters if not self.from_file else encounter['monsters'][0]
     
     def set_test(self):
         """Change environment from training to test mode."""
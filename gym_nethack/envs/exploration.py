@@ -7,6 +7,7 @@ from libs import astar
 
 from gym_nethack.nhdata import *
 from gym_nethack.misc import verboseprint
+from gym_nethack.pathcache import PathCache
 from gym_nethack.envs.base import Terminals, Goals, NetHackRLEnv
 
 TurnRec = namedtuple('ExplFoodRec', 'turn_num num_squares_explored calculated_food_level entered_new_room')
@@ -53,11 +54,11 @@ class NetHackExplEnv(NetHackRLEnv):
         
         super().set_config(proc_id, name=name, max_num_episodes=num_episodes, max_num_actions_per_episode=max_num_actions_per_episode, **args)
         
-    def get_game_params(self):
-        """Parameters to pass to NetHack on the creation of a new game. (Will be saved in the NH options file.)"""
+    def get_game_params(self, game_num, rng):
+        """Parameters to pass to NetHack on the creation of a new game (saved in the NH options file), and the attributes of the environment for that game (none here; see NetHackRLEnv.get_game_params())."""
         
         if self.dataset is 'fixed':
-            seed = 1525485787+self.total_num_games
+            seed = 1525485787+game_num
             #if self.dataset == 'test':
             #    seed += self.num_episodes
         elif self.dataset is 'random':
@@ -68,7 +69,7 @@ class NetHackExplEnv(NetHackRLEnv):
             'create_items': self.parse_items,
             'secret_rooms': self.secret_rooms,
             'seed': seed
-        }
+        }, {}
     
     def reset(self):
         """Prepare the environment for a new episode."""
@@ -90,7 +91,7 @@ class NetHackExplEnv(NetHackRLEnv):
         self.total_sdoors_scorrs = -1
         self.total_secret_rooms = -1 # this one is calculated at episode end in secret greedy policy::end_episode
         
-        self.pathfind2_distances = {}
+        self.path2_cache = PathCache(self.nh.path_cache.max_size) # paths found by pathfind_through_unexplored_to()
         
         return super().reset()
         
@@ -158,32 +159,23 @@ class NetHackExplEnv(NetHackRLEnv):
             initial: position to start pathfinding from. If None, use current player position.
         """
         
-        if (initial, target) not in self.pathfind2_distances:
-            overwritten_chars = {}
-            #for x, y in override_targets:
-            #    overwritten_chars[(x, y)] = self.grid[x][y]
-            #if override_target_traversability:
-            
-            inverse_grid = np.array([[1 for j in range(COLNO)] for i in range(ROWNO)])
-            for x in range(ROWNO): #self.GRIDWIDTH):
-                for y in range(COLNO): #self.GRIDHEIGHT):
-                    if self.nh.basemap_char(x, y) == ' ':
-                        inverse_grid[x][y] = 0
-            
-            overwritten_chars[target] = inverse_grid[target[0]][target[1]]
-            inverse_grid[target[0]][target[1]] = 0
-            #for x, y in override_targets:
-            #    self.grid[x][y] = 0
-            path = astar.astar(inverse_grid, initial, target, diag=False)
-            
-            if type(path) is bool:
-                #verboseprint("Error: could not pathfind from", initial, "to", target, "! (target on map:", self.nh.map[target[0]][target[1]], " and basemap:", self.nh.base_map[target[0]][target[1]], ")")
-                self.pathfind2_distances[(initial, target)] = None
-                return None
-            path.reverse() # path[0] should be next to start node.
-            self.pathfind2_distances[(initial, target)] = path
+        self.nh.sync_base_map()
+        key = (self.nh.base_map_version, initial, target)
+        found, path = self.path2_cache.lookup(key)
+        if found:
+            return path
+        
+        inverse_grid = np.where(self.nh.base_codes == ord(' '), 0, 1) # unexplored positions are traversable
+        inverse_grid[target[0]][target[1]] = 0
+        path = astar.astar(inverse_grid, initial, target, diag=False)
         
-        return self.pathfind2_distances[(initial, target)]
+        if type(path) is bool:
+            #verboseprint("Error: could not pathfind from", initial, "to", target, "! (target on map:", self.nh.map[target[0]][target[1]], " and basemap:", self.nh.base_map[target[0]][target[1]], ")")
+            path = None
+        else:
+            path.reverse() # path[0] should be next to start node.
+        self.path2_cache.store(key, path)
+        return path
     
     def mark_room_explored(self):
         """Mark the current room as explored by adding its top left corner position to the explored rooms list."""
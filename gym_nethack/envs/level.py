@@ -57,11 +57,11 @@ class NetHackLevelEnv(NetHackRLEnv):
         self.expl.daemon_socket = self.daemon_socket
         self.combat.daemon_socket = self.daemon_socket
     
-    def get_game_params(self):
-        """Parameters to pass to NetHack on the creation of a new game. (Will be saved in the NH options file.)"""
+    def get_game_params(self, game_num, rng):
+        """Parameters to pass to NetHack on the creation of a new game (saved in the NH options file), and the attributes of the environment for that game (none here; see NetHackRLEnv.get_game_params())."""
         
         if self.dataset is 'fixed':
-            seed = 1525485787+self.total_num_games
+            seed = 1525485787+game_num
         elif self.dataset is 'random':
             seed = -1
         
@@ -71,7 +71,11 @@ class NetHackLevelEnv(NetHackRLEnv):
             'create_mons':  True,
             'secret_rooms': self.secret_rooms,
             'seed': seed
-        }
+        }, {}
+    
+    def new_game_on_reset(self):
+        """Whether the next call to reset() will launch a new NetHack game (only after the player died or the game was otherwise terminated)."""
+        return self.terminate
     
     def reset(self):
         """Prepare the environment for a new episode. (Call reset() on combat and exploration envs.)"""
@@ -0,0 +1,114 @@
+import numpy as np
+import zmq
+
+from gym_nethack.nhdata import CMD
+from gym_nethack.envs.base import Terminals
+
+CHECK_INTERVAL = 50 # ms between checks of the replies that are overdue or whose NetHack process died
+
+class NetHackVecEnv(object):
+    """Steps several NetHack RL environments in one process.
+    
+    The action for every environment is sent first, without waiting for any reply, and the replies are then collected with a zmq Poller in
+    whatever order the NetHack processes produce them, so one slow game does not hold up the others. The keys of a command that come after
+    a prompt, and the inventory requests, are sent from the same loop as the replies come in. A game whose reply is overdue, or whose process
+    died, is replayed if its env has retry_on_crash set (blocking the other games meanwhile), and otherwise ends with CONN_ERROR, as in the
+    env's step(). States are returned stacked into one array, along with a boolean mask of the valid actions of each environment. An environment
+    whose episode ended is reset right away; the last state of the finished episode is put in its info dict under 'terminal_state'."""
+    def __init__(self, envs):
+        """Initialize the vectorized environment.
+        
+        Args:
+            envs: list of NetHackRLEnv objects, each already configured with set_config() (with a different proc_id), all served by the same daemon.
+        """
+        assert len(envs) > 0
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.action_space = envs[0].action_space
+        self.observation_space = envs[0].observation_space
+        self.poller = zmq.Poller()
+    
+    def get_action_masks(self, valid_action_indices):
+        """Convert each environment's list of valid action indices into a boolean mask over the action space."""
+        masks = np.zeros((self.num_envs, self.action_space.n), dtype=bool)
+        for i, indices in enumerate(valid_action_indices):
+            masks[i, np.asarray(indices, dtype=int)] = True
+        return masks
+    
+    def reset(self):
+        """Start a new episode in every environment. Returns the stacked states and the valid action masks."""
+        states, valid_action_indices = zip(*[env.reset() for env in self.envs])
+        return np.stack(states), self.get_action_masks(valid_action_indices)
+    
+    def step(self, actions):
+        """Take one action in each environment.
+        
+        Args:
+            actions: sequence of actions, one per environment
+        
+        Returns the stacked states, rewards, done flags, info dicts and valid action masks.
+        """
+        assert len(actions) == self.num_envs
+        results = [None] * self.num_envs
+        waiting = {} # socket -> index of env waiting for a reply on it
+        steps = {} # index of env -> (screen, status) of the action, once its reply came in and the inventory was asked for
+        
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            env.start_turn()
+            try:
+                env.send_action(action)
+            except zmq.error.Again:
+                results[i] = env.finish_step(env.replay_game() if env.retry_on_crash else None)
+                continue
+            waiting[env.socket] = i
+            self.poller.register(env.socket, zmq.POLLIN)
+        
+        while len(waiting) > 0:
+            ready = dict(self.poller.poll(CHECK_INTERVAL))
+            for socket, i in list(waiting.items()):
+                env = self.envs[i]
+                if socket in ready:
+                    try:
+                        message = env.rcv_pending_reply()
+                        if message is None:
+                            continue # the next key of the command was sent
+                    except zmq.error.Again:
+                        message = None
+                elif not env.pending_reply_overdue() or socket.poll(0):
+                    continue
+                else:
+                    message = None
+                
+                waiting.pop(socket)
+                self.poller.unregister(socket)
+                if i in steps:
+                    # reply to the inventory request.
+                    if message is None:
+                        raise Exception("Error occurred communicating with NetHack to get inventory.")
+                    env.nh.inventory_msg = message
+                    results[i] = env.complete_step(*steps.pop(i))
+                    continue
+                
+                if message is None and env.retry_on_crash:
+                    message = env.replay_game()
+                status = env.get_step_status(message)
+                if status is Terminals.OK and env.nh.inventory_needed() and env.nh.inventory_msg is None:
+                    env.send_key(CMD.INVENTORY, 'inventory')
+                    steps[i] = (message, status)
+                    waiting[env.socket] = i
+                    self.poller.register(env.socket, zmq.POLLIN)
+                else:
+                    results[i] = env.complete_step(message, status)
+        
+        states, rewards, dones, infos, valid_action_indices = [list(field) for field in zip(*results)]
+        for i, env in enumerate(self.envs):
+            if dones[i]:
+                infos[i] = dict(infos[i], terminal_state=states[i])
+                states[i], valid_action_indices[i] = env.reset()
+        
+        return np.stack(states), np.array(rewards, dtype=np.float32), np.array(dones), infos, self.get_action_masks(valid_action_indices)
+    
+    def close(self):
+        """Close every environment."""
+        for env in self.envs:
+            env.close()
@@ -1,19 +1,27 @@
 
+import numpy as np
+
 VERBOSE = True
 LOGGING = False
 
-distances = {}
 def distance_pt(A, B): #, metric='manhattan'):
-    if (A, B) not in distances:
-        val = abs(B[0]-A[0]) + abs(B[1]-A[1])
-        distances[(A, B)] = val
-        distances[(B, A)] = val
-        return val
-    return distances[(A, B)]
+    # Manhattan distance. Not memoized: the subtraction is cheaper than a dict lookup, and a memo of every pair of positions seen
+    # (e.g., by the A* heuristic) grows without bound over episodes.
+    return abs(B[0]-A[0]) + abs(B[1]-A[1])
     #if metric is 'manhattan':
     #elif metric is 'euclidean':
     #    return math.hypot(B[0]-A[0], B[1]-A[1])
 
+def distances_to_pt(points, B):
+    # Manhattan distances from each of the given points (list of tuples or (N, 2) array) to B, as an array of length N.
+    points = np.asarray(points).reshape(-1, 2)
+    return np.abs(points[:, 0] - B[0]) + np.abs(points[:, 1] - B[1])
+
+def pairwise_distances(points_a, points_b):
+    # Manhattan distances between each of points_a (N points) and each of points_b (M points), as an (N, M) array.
+    points_a, points_b = np.asarray(points_a).reshape(-1, 2), np.asarray(points_b).reshape(-1, 2)
+    return np.abs(points_a[:, None, 0] - points_b[None, :, 0]) + np.abs(points_a[:, None, 1] - points_b[None, :, 1])
+
 def dfs(start, passable_func, neighbor_func, min_neighbors=2, diag=False):
     # src: http://codereview.stackexchange.com/questions/78577/depth-first-search-in-python
     visited, stack = set(), [start]
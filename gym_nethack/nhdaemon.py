@@ -1,8 +1,10 @@
-import os, sys, subprocess
+import os, sys, glob, struct, socket, subprocess
+from collections import deque
 
 import zmq
 
-from gym_nethack.conn import nethack_path, nethack_dir
+from gym_nethack.fileio import DIR_CHAR
+from gym_nethack.conn import nethack_path, nethack_dir, get_sysconf_fname, get_endpoint, get_daemon_endpoint, NH_BASE_PORT, TRANSPORTS
 
 '''
 def spawn_daemon(proc_id):
@@ -56,29 +58,257 @@ def spawn_daemon(proc_id):
       # oops, we're cut off from the world, let's just give up
       os._exit(255)
 '''
+
+GAME_PORT_OFFSET = 1000 # game ports start at NH_BASE_PORT + GAME_PORT_OFFSET, so their sysconf files never clash with the ones written by the envs (sysconf<proc_id>)
+
+def spawn_nh(port, transport='tcp', ipc_dir=None):
+    """Start a NetHack process that will connect to the given port, and return its process handle.
+    
+    Args:
+        transport: 'tcp' (NetHack connects to the port on localhost), or 'ipc' (NetHack connects to the socket file named after the port in ipc_dir, given with -endpoint)
+        ipc_dir: directory of the env's socket files
+    """
+    if sys.platform == "win32":
+        return subprocess.Popen([nethack_dir + DIR_CHAR + "NetHack.exe", "-port", str(port)], cwd=nethack_dir)
+    args = [nethack_path, "-port", str(port)]
+    if transport != 'tcp':
+        args += ["-endpoint", get_endpoint(port, transport, directory=ipc_dir)]
+    return subprocess.Popen(args)
+
+def remove_level_files(pid):
+    """Remove the lock and level files of the game played by the NetHack process with the given pid, if it left any behind.
+    (The level 0 file of a game doubles as its lock file, and starts with the pid of the process that created it.)"""
+    for lock_fname in glob.glob(nethack_dir + DIR_CHAR + "*.0"):
+        try:
+            with open(lock_fname, 'rb') as lock_file:
+                owner = struct.unpack('i', lock_file.read(struct.calcsize('i')))[0]
+        except (IOError, struct.error):
+            continue
+        if owner == pid:
+            for level_fname in glob.glob(lock_fname[:-len(".0")] + ".*"):
+                os.remove(level_fname)
+
+class NetHackSupervisor(object):
+    """Keeps track of the NetHack processes launched by the daemon, so that only those processes are ever killed, and only their files are removed."""
+    def __init__(self):
+        """Initialize the supervisor."""
+        self.processes = {} # pid -> (port, process) of every process launched and not yet reaped
+    
+    def launch(self, port, transport='tcp', ipc_dir=None):
+        """Start a NetHack process that will connect to the given port, and return its process handle. (See spawn_nh() for the arguments.)"""
+        process = spawn_nh(port, transport, ipc_dir)
+        self.processes[process.pid] = (port, process)
+        return process
+    
+    def reap(self):
+        """Collect the exit status of finished processes (so they do not linger as zombies), and clean up after them."""
+        for pid, (port, process) in list(self.processes.items()):
+            if process.poll() is not None:
+                del self.processes[pid]
+                remove_level_files(pid)
+    
+    def kill(self, port):
+        """Kill the running processes launched on the given port."""
+        for pid, (proc_port, process) in list(self.processes.items()):
+            if proc_port == port:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                del self.processes[pid]
+                remove_level_files(pid)
+    
+    def close(self):
+        """Kill every process launched."""
+        for port in set(port for port, _ in self.processes.values()):
+            self.kill(port)
+
+class PortAllocator(object):
+    """Hands out ports for NetHack processes to connect to, shared by all the environments served by the daemon."""
+    def __init__(self, first_port=NH_BASE_PORT+GAME_PORT_OFFSET):
+        """Initialize the allocator.
+        
+        Args:
+            first_port: lowest port to hand out
+        """
+        self.next_port = first_port
+        self.free_ports = deque()
+    
+    def get(self):
+        """Return a port not handed out yet (or released since), skipping ports already bound by other programs."""
+        for _ in range(len(self.free_ports)):
+            port = self.free_ports.popleft()
+            if port_available(port):
+                return port
+            self.free_ports.append(port) # (still being released; try again later)
+        while not port_available(self.next_port):
+            self.next_port += 1
+        self.next_port += 1
+        return self.next_port - 1
+    
+    def release(self, port):
+        """Make the given port available again."""
+        self.free_ports.append(port)
+
+def port_available(port):
+    """Check that nothing is bound to the given TCP port."""
+    test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # as zmq does, so ports in TIME_WAIT count as available
+    try:
+        test_socket.bind(("", port))
+        return True
+    except OSError:
+        return False
+    finally:
+        test_socket.close()
+
+class NetHackPool(object):
+    """Set of NetHack processes for one proc_id, booted ahead of time so that a launch request does not have to wait for NetHack to start up.
+    
+    Each process waits on its own port, and reads its own copy of the proc_id's sysconf and wizkit files, made when it was spawned.
+    A warm process is only handed out if those files still hold the same options when the launch request comes in; otherwise it is
+    killed and a fresh process is started with the current options. The pool thus only saves the boot time when consecutive games
+    use the same options (for configs that draw new options every episode, use the env's prefetch_games instead); with a pool size
+    of 0, every launch starts a fresh process as before.
+    
+    Likewise, warm processes are only handed out if they connect with the transport, and to the ipc directory, last given by the env."""
+    def __init__(self, proc_id, supervisor, ports, size=0, transport='tcp', ipc_dir=None):
+        """Initialize the pool.
+        
+        Args:
+            proc_id: process ID of the environment served by this pool
+            supervisor: NetHackSupervisor used to launch the processes
+            ports: PortAllocator giving the ports for the processes to connect to
+            size: number of NetHack processes to keep booted in addition to the one currently in use
+            transport, ipc_dir: how the processes connect to the env (see spawn_nh())
+        """
+        self.proc_id = proc_id
+        self.supervisor = supervisor
+        self.ports = ports
+        self.size = size
+        self.transport = transport
+        self.ipc_dir = ipc_dir
+        self.warm = deque() # (port, process, options) of the processes waiting to be handed out, options being what read_options() gave when they were spawned
+        self.in_use = [] # (port, process, options) of the processes handed out to the environment
+    
+    def read_options(self):
+        """Return the current contents of the sysconf and wizkit files for this proc_id (None for a missing file), and the transport and ipc directory."""
+        contents = [self.transport, self.ipc_dir]
+        for fname in [get_sysconf_fname(self.proc_id), nethack_dir + DIR_CHAR + "wizkit" + str(self.proc_id) + ".txt"]:
+            if os.path.exists(fname):
+                with open(fname, 'r') as options_file:
+                    contents.append(options_file.read())
+            else:
+                contents.append(None)
+        return tuple(contents)
+    
+    def spawn(self, port, options):
+        """Start a NetHack process on the given port, giving it its own copy of the options and wizkit files for this proc_id.
+        
+        Args:
+            options: contents of the files, as returned by read_options()
+        """
+        conf_id = port - NH_BASE_PORT
+        transport, ipc_dir, sysconf, wizkit = options
+        if get_sysconf_fname(self.proc_id) != get_sysconf_fname(conf_id) and sysconf is not None:
+            with open(get_sysconf_fname(conf_id), 'w') as sysconf_file:
+                sysconf_file.write(sysconf.replace("WIZKIT=wizkit" + str(self.proc_id) + ".txt", "WIZKIT=wizkit" + str(conf_id) + ".txt"))
+            if wizkit is not None:
+                with open(nethack_dir + DIR_CHAR + "wizkit" + str(conf_id) + ".txt", 'w') as wizkit_file:
+                    wizkit_file.write(wizkit)
+        return (port, self.supervisor.launch(port, transport, ipc_dir), options)
+    
+    def discard(self, game):
+        """Kill a process that was never handed out, and make its port available again."""
+        self.supervisor.kill(game[0])
+        self.ports.release(game[0])
+    
+    def fill(self, options):
+        """Boot processes with the given options until the pool is full."""
+        while len(self.warm) < self.size:
+            self.warm.append(self.spawn(self.ports.get(), options))
+    
+    def launch(self, live_ports=[]):
+        """Hand out a booted NetHack process started with the current options (or start one if none are ready), then refill the pool.
+        Returns the port the process will connect to, and its pid.
+        
+        Args:
+            live_ports: ports of the games the environment still has open; the ports of the other games handed out can be reused.
+        """
+        for game in list(self.in_use):
+            if game[0] not in live_ports:
+                self.in_use.remove(game)
+                self.ports.release(game[0])
+        
+        options = self.read_options()
+        while len(self.warm) > 0 and self.warm[0][2] != options:
+            self.discard(self.warm.popleft()) # booted with the options of an earlier game
+        self.in_use.append(self.warm.popleft() if len(self.warm) > 0 else self.spawn(self.ports.get(), options))
+        self.fill(options)
+        port, process, _ = self.in_use[-1]
+        return port, process.pid
+
+def get_pool(pools, proc_id, supervisor, ports, size):
+    # pool of the given proc_id, made on its first request (with the default tcp transport, if that request is not a test message).
+    if proc_id not in pools:
+        pools[proc_id] = NetHackPool(proc_id, supervisor, ports, size)
+    return pools[proc_id]
+
 def nh_daemon():
-    proc_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
-    nh_port  = 5555 + proc_id
-    gym_port = 5555 - proc_id - 1
-    print("Daemon launched for NH port", nh_port, "; listening on port", gym_port)
+    """Serve the launch requests of any number of environments, on a single endpoint.
+    
+    Messages (each environment sends its proc_id, which names its sysconf/wizkit files):
+        test PROCID [TRANSPORT [IPCDIR]] -> pool size (the env's NetHack processes connect with the given transport, default tcp,
+                                    and find their socket files in the env's IPCDIR)
+        launch PROCID [PORT...]   -> "PORT PID" of a NetHack process for the env (the listed ports are those of games the env still has open)
+        kill PORT                 -> "done", after killing the NetHack processes launched on the port
+        exit
+    A request that cannot be handled is answered with "error" followed by the reason.
+    """
+    pool_size = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    transport = sys.argv[2] if len(sys.argv) > 2 else 'tcp'
+    assert transport in TRANSPORTS
+    gym_endpoint = get_daemon_endpoint(transport, bind=True)
+    print("Daemon listening on", gym_endpoint, "; pool size", pool_size)
+    supervisor = NetHackSupervisor()
+    ports = PortAllocator()
+    pools = {} # proc_id -> NetHackPool
     context = zmq.Context()
-    daemon_socket = context.socket(zmq.REP)
-    daemon_socket.bind("tcp://*:" + str(gym_port))
+    daemon_socket = context.socket(zmq.ROUTER)
+    daemon_socket.bind(gym_endpoint)
     while True:
-        message = daemon_socket.recv().decode("cp437" if os.name == "nt" else "utf-8")
-        if 'exit' in message:
-            break
-        if 'test' in message:
-            daemon_socket.send("done".encode())
+        if not daemon_socket.poll(1000):
+            supervisor.reap()
             continue
-        
-        assert 'launch' in message
-        daemon_socket.send("done".encode())
-        if sys.platform == "win32":
-            os.system("cd " + nethack_dir + " & NetHack.exe -port " + str(nh_port) + "\"")
-        else:
-            subprocess.call(nethack_path + " -port " + str(nh_port) + " &", shell=True)
-    print("Received:", message)
+        frames = daemon_socket.recv_multipart() # routing envelope, then the request
+        try:
+            args = frames[-1].decode("cp437" if os.name == "nt" else "utf-8").split()
+            command = args[0] if len(args) > 0 else None
+            if command == 'exit':
+                break
+            if command == 'test':
+                pool = get_pool(pools, int(args[1]), supervisor, ports, pool_size)
+                nh_transport = args[2] if len(args) > 2 else 'tcp'
+                assert nh_transport in TRANSPORTS
+                pool.transport = nh_transport
+                pool.ipc_dir = args[3] if len(args) > 3 else None
+                reply = str(pool_size)
+            elif command == 'kill':
+                # the environment could not quit the game on the given port itself.
+                supervisor.kill(int(args[1]))
+                reply = "done"
+            elif command == 'launch':
+                port, pid = get_pool(pools, int(args[1]), supervisor, ports, pool_size).launch([int(port) for port in args[2:]])
+                reply = str(port) + " " + str(pid)
+                supervisor.reap()
+            else:
+                raise Exception("Unknown request")
+        except Exception as e:
+            # a bad request (or a launch that failed) only gets an error reply, so that the daemon keeps serving the other environments.
+            print("Error handling request", frames[-1], ":", repr(e))
+            reply = "error " + repr(e)
+        daemon_socket.send_multipart(frames[:-1] + [reply.encode()])
+    supervisor.close()
+    print("Received:", frames[-1])
 
 if __name__ == '__main__':
     nh_daemon()
@@ -14,8 +14,8 @@ ROWNO = 21
 ITEM_CHAR = ['*']
 WALL_CHARS = ['|', '-', ' ']
 DOOR_CHARS = ['+', '#']
-PASSABLE_CHARS = ['+', '#', '.', '^', '>', '<', '_', ITEM_CHAR] #, '@']
-ROOM_CHARS = ['.', '>', '<', '^', ITEM_CHAR]
+PASSABLE_CHARS = ['+', '#', '.', '^', '>', '<', '_'] + ITEM_CHAR #, '@']
+ROOM_CHARS = ['.', '>', '<', '^'] + ITEM_CHAR
 CORRIDOR_CHARS = ['#', '`', '^']
 MONS_CHARS = list(ascii_letters) + [':', '&', ']', ';', '\'', '@']
 TOPOGRAPHICAL_CHARS = ['|', '-', '+', '#', '.', '>', '<']
@@ -269,6 +269,10 @@ for item in WEAPONS + PROJECTILES + ARMOR + POTIONS + SCROLLS + WANDS + RINGS +
 ALL_ITEMS = ITEMS_BY_PRIORITY[0] + ITEMS_BY_PRIORITY[1] + ITEMS_BY_PRIORITY[2]
 assert len(ALL_ITEMS) == len(WEAPONS + PROJECTILES + ARMOR + POTIONS + SCROLLS + WANDS + RINGS + MISC)
 
+ITEMS_BY_FULL_NAME = {} # full name -> first item of ALL_ITEMS with that name (the one a linear search would find)
+for item in ALL_ITEMS:
+    ITEMS_BY_FULL_NAME.setdefault(item.full_name, item)
+
 PLURALS = [("potions", "potion"), ("wands", "wand"), ("rings", "ring"), ("scrolls", "scroll"), ("spears", "spear"), ("daggers", "dagger"), ("scalpels", "scalpel"), ("javelins", "javelin"), ("athames", "athame"), ("teeth", "tooth"), ("stilettos", "stiletto"), ("knives", "knife"), ("arrows", "arrow"), ("bolts", "bolt"), ("rocks", "rock"), ("darts", "dart"), ("rations", "ration")]
 
 IGNORED_ITEMS = ['uncursed small glob of brown pudding', '+0 shuriken', '+0 bill-guisarme', '+0 halberd', '+0 partisan', '+0 fauchard', '+0 glaive', '+0 bec-de-corbin', '+0 spetum', '+0 lucern hammer', '+0 guisarme', '+0 ranseur', '+0 voulge', '+0 bardiche', '+0 dart', '-1 dart', '+1 dart', 'cursed -1 dart', 'blessed -1 dart', 'blessed +0 dart', 'cursed +0 dart', 'cursed +1 dart', 'blessed +1 dart', 'gold pieces']
@@ -362,6 +366,18 @@ class CMD:
         TURN = '#turn'
         WIPE = '#wipe'
 
+# commands that can change the inventory (first key sent).
+INVENTORY_CMDS = frozenset([CMD.PICKUP, CMD.APPLY, CMD.DROP, CMD.EAT, CMD.ENGRAVE, CMD.FIRE, CMD.PUTON, CMD.QUAFF, CMD.QUIVER, CMD.READ, CMD.REMOVE, CMD.THROW, CMD.TAKEOFF, CMD.WIELD, CMD.WEAR, CMD.EXCHANGE, CMD.ZAP, CMD.CAST,
+                            CMD.SPECIAL.DIP, CMD.SPECIAL.FORCE, CMD.SPECIAL.INVOKE, CMD.SPECIAL.LOOT, CMD.SPECIAL.OFFER, CMD.SPECIAL.PRAY, CMD.SPECIAL.RUB])
+# phrases of top-line messages after which the inventory may have changed, whatever the command (items stolen, dropped, destroyed or eroded).
+# whole phrases, so that ordinary combat and movement messages do not match (autopickup is off, so picking up only follows CMD.PICKUP).
+INVENTORY_MESSAGES = ['stole ', 'steals ', 'snatches ', 'seduces you', 'purse feels lighter', 'You drop', 'slips from your', 'is destroyed', 'are destroyed', 'turns to dust',
+                      'catches fire and burns', 'catch fire and burn', 'boils and explodes', 'boil and explode', 'freezes and shatters', 'freeze and shatter',
+                      ' rusts', ' rust!', ' rots', ' rot!', ' corrodes', ' corrode!', ' smoulders', ' smoulder!', ' fades.', ' dilutes.']
+
+def message_changes_inventory(top_line):
+    return any(msg in top_line for msg in INVENTORY_MESSAGES)
+
 DIR_MAPPING = [((-1, 0), CMD.DIR.N), ((1, 0), CMD.DIR.S), ((0, -1), CMD.DIR.W), ((0, 1), CMD.DIR.E), ((-1, -1), CMD.DIR.NW), ((1, 1), CMD.DIR.SE), ((-1, 1), CMD.DIR.NE), ((1, -1), CMD.DIR.SW)]
 
 DIRS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
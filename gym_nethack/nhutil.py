@@ -1,16 +1,131 @@
 import re, sys
 from copy import deepcopy
+from functools import lru_cache
+
+import zmq
+import numpy as np
 
 from gym_nethack.nhdata import *
+from gym_nethack.charclass import *
+from gym_nethack.botl import parse_attributes, parse_stats
 from gym_nethack.fileio import DIR_CHAR
-from gym_nethack.conn import send_msg, rcv_msg, nethack_dir
+from gym_nethack.conn import send_msg, rcv_msg, decode_msg, nethack_dir, get_sysconf_fname
 from gym_nethack.misc import to_matrix, VERBOSE, verboseprint
 
+def map_to_array(map_str):
+    # (ROWNO, COLNO) uint8 array of the character codes of the map.
+    try:
+        return np.frombuffer(map_str.encode("ISO-8859-1"), dtype=np.uint8).reshape(ROWNO, COLNO)
+    except UnicodeEncodeError: # message decoded as cp437 (Windows); characters outside Latin-1 are not in any table anyway.
+        return np.array([min(ord(c), 255) for c in map_str], dtype=np.uint8).reshape(ROWNO, COLNO)
+
+def map_rows_to_array(map_rows):
+    # same as map_to_array, for a map stored as a list of rows of characters (like the base map).
+    return map_to_array(''.join(map(''.join, map_rows)))
+
+def array_to_map_rows(codes):
+    # inverse of map_rows_to_array: list of rows of characters of a (ROWNO, COLNO) array of character codes, decoded in one call.
+    return to_matrix(list(decode_msg(codes.tobytes())), COLNO)
+
+def get_positions(mask):
+    # (row, col) tuples of the True cells of the mask, in row-major order.
+    rows, cols = np.nonzero(mask)
+    return list(zip(rows.tolist(), cols.tolist()))
+
+class lazy_field(object):
+    """Field of a MapObservation, computed by the decorated method the first time it is read and then stored on the observation.
+    If the observation has a field_counts dict (profiling), the computation is counted there under the field's name."""
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+    
+    def __get__(self, obs, owner=None):
+        if obs is None:
+            return self
+        if obs.field_counts is not None:
+            obs.field_counts[self.name] = obs.field_counts.get(self.name, 0) + 1
+        value = obs.__dict__[self.name] = self.func(obs)
+        return value
+
+class MapObservation(object):
+    """Positions of interest on the map of one frame. Each is computed from the character codes of the map the first time it is read,
+    so that a frame only costs what its consumers actually use."""
+    def __init__(self, codes, classes, monsters, items, parse_ammo, field_counts=None):
+        """Initialize the observation.
+        
+        Args:
+            codes: (ROWNO, COLNO) array of the character codes of the map
+            classes: character classes of the codes (see charclass.classify())
+            monsters, items: boolean masks of the monsters (other than the player) and items on the map
+            parse_ammo: whether to find the ammo positions, or leave them empty
+            field_counts: dict in which to count the fields computed, or None
+        """
+        self.codes = codes
+        self.classes = classes
+        self.monsters = monsters
+        self.items = items
+        self.parse_ammo = parse_ammo
+        self.field_counts = field_counts
+    
+    def get_uncounted(self, name):
+        """Return the given field without counting it as used (for bookkeeping done on behalf of consumers)."""
+        if name not in self.__dict__:
+            self.__dict__[name] = getattr(type(self), name).func(self)
+        return self.__dict__[name]
+    
+    def reuse(self, field_counts=None):
+        """Return an observation of an identical frame, sharing the arrays of this one.
+        Fields already computed are carried over (except mutable sets, and none at all when profiling, so that uses are counted per frame)."""
+        obs = MapObservation(self.codes, self.classes, self.monsters, self.items, self.parse_ammo, field_counts)
+        if field_counts is None:
+            for name in ('num_explored_squares', 'critical_positions', 'ammo_positions', 'monster_positions'):
+                if name in self.__dict__:
+                    obs.__dict__[name] = self.__dict__[name]
+        return obs
+    
+    @lazy_field
+    def num_explored_squares(self):
+        return int(np.count_nonzero(self.codes != ord(' ')))
+    
+    @lazy_field
+    def critical_positions(self):
+        return get_positions(class_mask(self.classes, CRITICAL))
+    
+    @lazy_field
+    def ammo_positions(self):
+        return get_positions(self.codes == ord(')')) if self.parse_ammo else []
+    
+    @lazy_field
+    def monster_positions(self):
+        return get_positions(self.monsters)
+    
+    @lazy_field
+    def item_positions(self):
+        return set(get_positions(self.items))
+    
+    @lazy_field
+    def food_positions(self):
+        return set(get_positions(self.codes == ord('%')))
+    
+    @lazy_field
+    def concrete_positions(self):
+        return set() #TODO
+
 def unpack_msg(msg, base_map, ignore_monsters=False, parse_ammo=True, update_base=True, parse_monsters=True):
-    attrstat = msg[(21*COLNO):]
+    base_map, full_map, attmsg, sttmsg, topmsg, cur_pos, back_glyph, obs = parse_msg(msg, base_map, parse_ammo=parse_ammo, update_base=update_base, parse_monsters=parse_monsters)
+    return base_map, full_map, attmsg, sttmsg, topmsg, cur_pos, obs.monster_positions, obs.ammo_positions, obs.item_positions, obs.food_positions, back_glyph, obs.critical_positions, obs.concrete_positions, obs.num_explored_squares
+
+def parse_status(msg):
+    # parse the part of the frame after the map: returns the attribute, stats and top lines, the player position, the glyph under the player,
+    # and whether the map is obscured (fog, engulfed).
+    if isinstance(msg, bytes):
+        attrstat = decode_msg(msg[(21*COLNO):])
+    else:
+        attrstat = msg[(21*COLNO):]
     
     if 'Dlvl' not in attrstat:
-        raise Exception("Unexpected NH message: " + msg)
+        raise Exception("Unexpected NH message: " + str(msg))
     
     align_pos = attrstat.find("Dlvl")
     assert align_pos >= 0
@@ -28,127 +143,117 @@ def unpack_msg(msg, base_map, ignore_monsters=False, parse_ammo=True, update_bas
     uy, ux = posmsg.split('-')
     cur_pos = (int(ux), int(uy))
     back_glyph = int(attrstat[-6:-2])
-    
-    if 'laden with moisture' in topmsg or 'engulfs' in topmsg: # map obscured
+    obscured = 'laden with moisture' in topmsg or 'engulfs' in topmsg
+    return attmsg, sttmsg, topmsg, cur_pos, back_glyph, obscured
+
+def parse_msg(msg, base_map, parse_ammo=True, update_base=True, parse_monsters=True, field_counts=None, status=None):
+    # same as unpack_msg, but the positions of interest on the map are returned as a MapObservation, computed when first read.
+    # msg is a str, or a bytes frame (see conn.RawFrame): then only the status lines are decoded, and the character codes of the map are
+    # read from the frame directly, the map's characters being looked up from them.
+    # status is the result of parse_status(msg), if the caller already has it.
+    attmsg, sttmsg, topmsg, cur_pos, back_glyph, obscured = status if status is not None else parse_status(msg)
+    if obscured:
         update_base = False
     
-    full_map = to_matrix(list(msg[:(21*COLNO)]), COLNO) # 20x120
-    
-    ammo_positions = []
-    monster_positions = []
-    item_positions = set()
-    food_positions = set()
-    misc_positions = []
-    critical_positions = []
-    concrete_positions = set()
-    num_explored_squares = 0
-    for i, row in enumerate(full_map):
-        for j, col in enumerate(row):
-            if col != ' ':
-                num_explored_squares += 1
-            
-            if update_base and base_map is not None and col in TOPOGRAPHICAL_CHARS:
-                base_map[i][j] = full_map[i][j]
-            
-            if col in '+.': #|-
-                critical_positions.append((i, j))
-            elif col in '|-':
-                concrete_positions.add((i, j))
-            
-            #elif col in '`^<' and slim_charset:
-            #    base_map[i][j] = '.'
-            #    full_map[i][j] = '.'
-            
-            elif col == ')' and parse_ammo:
-                ammo_positions.append((i, j))
-            
-            elif col in MONS_CHARS and (i, j) != cur_pos:
-                monster_positions.append((i, j))
-            
-            if col in '$[(%?/=!"*):':
-                item_positions.add((i, j))
-                if not parse_monsters: # or slim_charset:
-                    if base_map is not None:
-                        base_map[i][j] = '.'
-                    full_map[i][j] = '.'
-                else:
-                    if update_base and base_map is not None and base_map[i][j] == ' ':
-                        base_map[i][j] = '^'
-                    full_map[i][j] = 'i'
-                
-                if col == '%':
-                    food_positions.add((i, j))
-            
-            elif col in '_{\}': # room features
-                misc_positions.append((i, j))
+    if isinstance(msg, bytes):
+        codes = np.frombuffer(msg, dtype=np.uint8, count=ROWNO*COLNO).reshape(ROWNO, COLNO)
+        full_map = array_to_map_rows(codes)
+    else:
+        map_str = msg[:(21*COLNO)]
+        codes = map_to_array(map_str)
+        full_map = to_matrix(list(map_str), COLNO) # 20x120
+    
+    not_player = np.ones((ROWNO, COLNO), dtype=bool)
+    if 0 <= cur_pos[0] < ROWNO and 0 <= cur_pos[1] < COLNO:
+        not_player[cur_pos] = False
+    
+    classes = classify(codes)
+    monsters = class_mask(classes, MONSTER) & not_player
+    items = class_mask(classes, MAP_ITEM)
+    room_features = class_mask(classes, ROOM_FEATURE)
+    others = ((codes == ord('`')) | monsters) & ~items # boulders and monsters
+    misc_positions = get_positions(room_features | (codes == ord('`')))
+    
+    if update_base and base_map is not None:
+        # copy the topographical squares that differ from the base map.
+        topo_positions = get_positions(class_mask(classes, TOPOGRAPHICAL) & (map_rows_to_array(base_map) != codes))
+        for i, j in topo_positions:
+            base_map[i][j] = full_map[i][j]
+    
+    for positions, full_char in [(get_positions(items), '.' if not parse_monsters else 'i'), (get_positions(others), '.' if not parse_monsters else None)]:
+        for i, j in positions:
+            if not parse_monsters: # or slim_charset:
                 if base_map is not None:
                     base_map[i][j] = '.'
-                full_map[i][j] = '.'
-            
-            elif col == '`' or (col in MONS_CHARS and (i, j) != cur_pos):
-                if col not in MONS_CHARS:
-                    misc_positions.append((i, j))
-                if not parse_monsters: # or slim_charset:
-                    if base_map is not None:
-                        base_map[i][j] = '.'
-                    full_map[i][j] = '.'
-                else:
-                    if update_base and base_map is not None and base_map[i][j] == ' ':
-                        base_map[i][j] = '^'
+            elif update_base and base_map is not None and base_map[i][j] == ' ':
+                base_map[i][j] = '^'
+            if full_char is not None:
+                full_map[i][j] = full_char
+    
+    for i, j in get_positions(room_features):
+        if base_map is not None:
+            base_map[i][j] = '.'
+        full_map[i][j] = '.'
     
     if update_base and base_map is None:
         base_map = deepcopy(full_map)
         base_map[cur_pos[0]][cur_pos[1]] = '.' # player always starts in room.
-        for ipos in list(item_positions) + misc_positions:
+        for ipos in get_positions(items) + misc_positions:
             base_map[ipos[0]][ipos[1]] = '.'
-        for ipos in monster_positions:
+        for ipos in get_positions(monsters):
             base_map[ipos[0]][ipos[1]] = '^'
-        
-    concrete_positions = set() #TODO
-    return base_map, full_map, attmsg, sttmsg, topmsg, cur_pos, monster_positions, ammo_positions, item_positions, food_positions, back_glyph, critical_positions, concrete_positions, num_explored_squares
+    
+    obs = MapObservation(codes, classes, monsters, items, parse_ammo, field_counts)
+    return base_map, full_map, attmsg, sttmsg, topmsg, cur_pos, back_glyph, obs
 
-def get_inventory(socket):
-    try:
-        send_msg(socket, CMD.INVENTORY)
-        raw = rcv_msg(socket)
-    except zmq.error.Again:
-        raise Exception("Error occurred communicating with NetHack to get inventory.")
+def get_inventory(socket, raw=None, rcv=None):
+    # rcv (no arguments) receives the listing once asked for, instead of rcv_msg(socket).
+    if raw is None:
+        try:
+            send_msg(socket, CMD.INVENTORY)
+            raw = rcv_msg(socket) if rcv is None else rcv()
+        except zmq.error.Again:
+            raise Exception("Error occurred communicating with NetHack to get inventory.")
+    if isinstance(raw, bytes):
+        raw = decode_msg(raw)
     
     items = raw.split("--")
     inventory = []
-    matched_names = []
     for item_str in items[1:-1]:
         if len(item_str.split(",")) != 2:
             print("Couldn't interpret:", item_str)
         item_name, item_char = item_str.split(",")
-        item_name = item_name.replace("-2", "-1").replace("+2", "+1").replace("-3", "-1").replace("+3", "+1").replace("+4", "+1").replace("-4", "-1").replace("thoroughly ", "").replace("very ", "")
-        
-        qty, stripped_name = get_stripped_itemname(item_name)
-        if stripped_name in IGNORED_ITEMS:
+        parsed = parse_inventory_name(item_name)
+        if parsed is None: # ignored item
             continue
-        
-        matched_item = None
-        for i, weap in enumerate(ALL_ITEMS):
-            if item_match(weap.full_name, stripped_name):
-                #if weap.full_name in matched_names:
-                #    print(weap.full_name, "already present in inven! :", inventory)
-                
-                matched_names.append(weap.full_name)
-                matched_item = weap
-                break
-    
+        item_name, stripped_name, matched_item, qty = parsed
         if matched_item is None:
             verboseprint("\nMatched item was none! Item_str:", item_str, "and stripped:", stripped_name)
             continue
         assert item_char is not None
         
-        if ':' in item_name:
-            ind = item_name.index(':')
-            qty = item_name[ind+1:ind+2]
-                
-        inventory.append((item_name, item_char, stripped_name, matched_item, 1 if len(qty) == 0 else int(qty)))
+        inventory.append((item_name, item_char, stripped_name, matched_item, qty))
     return inventory
 
+@lru_cache(maxsize=1024)
+def parse_inventory_name(item_name):
+    # returns (item name, stripped name, matched item, quantity) for the item name of an inventory line (the matched item and quantity are None
+    # if no item matches), or None if the item is ignored. Inventories change little from one step to the next, so the results are cached.
+    item_name = item_name.replace("-2", "-1").replace("+2", "+1").replace("-3", "-1").replace("+3", "+1").replace("+4", "+1").replace("-4", "-1").replace("thoroughly ", "").replace("very ", "")
+    
+    qty, stripped_name = get_stripped_itemname(item_name)
+    if stripped_name in IGNORED_ITEMS:
+        return None
+    
+    matched_item = match_item(stripped_name)
+    if matched_item is None:
+        return item_name, stripped_name, None, None
+    
+    if ':' in item_name:
+        ind = item_name.index(':')
+        qty = item_name[ind+1:ind+2]
+    return item_name, stripped_name, matched_item, 1 if len(qty) == 0 else int(qty)
+
 def get_stripped_itemname(inventory_name):
     # get rid of opening digits (quantities)
     qty = ""    
@@ -187,71 +292,34 @@ def get_stripped_itemname(inventory_name):
     
     return qty, inventory_name
 
-def item_match(item_name, inventory_name):
+def get_match_name(inventory_name):
+    # full name of the item with the given stripped inventory name.
     if 'cursed' not in inventory_name and 'blessed' not in inventory_name and 'holy water' not in inventory_name:
         inventory_name = 'uncursed ' + inventory_name # default to uncursed    
+    return inventory_name
+
+def item_match(item_name, inventory_name):
     #if VERBOSE:
     #    print("matching '", item_name, "' to '", inventory_name, "'")
-    return item_name == inventory_name
+    return item_name == get_match_name(inventory_name)
+
+def match_item(inventory_name):
+    # first item of ALL_ITEMS that matches the given stripped inventory name (see item_match()), or None.
+    return ITEMS_BY_FULL_NAME.get(get_match_name(inventory_name))
 
 def update_attrs(attr_line, attributes):
-    m = re.search(r'the (?P<role_title>'+NH_ROLE_TITLES_FLAT+')\s*'
-                    r'St:(?P<st>[/\d\*]+)\s*'
-                    r'Dx:(?P<dx>\d+)\s*'
-                    r'Co:(?P<co>\d+)\s*'
-                    r'In:(?P<in>\d+)\s*'
-                    r'Wi:(?P<wi>\d+)\s*'
-                    r'Ch:(?P<ch>\d+)\s*'
-                    r'S:(?P<sc>\d+)\s*'
-                    r'(I:(?P<inv>\d+)\s*)'
-                    r'(?P<align>\S+)', attr_line)
-    if m:
-        prev_attributes = deepcopy(attributes)
-        attributes = m.groupdict()
-        for k, v in attributes.items():
-            if v and v.isdigit():
-                attributes[k] = int(v)
-        
-        if '/' in str(attributes['st']):
-            strength = str(attributes['st']).split("/")
-            strength = [int(s) for s in strength]
-            assert strength[0] == 18
-            if 0 <= strength[1] <= 31:
-                strength = 19
-            elif 32 <= strength[1] <= 81:
-                strength = 20
-            elif 82 <= strength[1]:
-                strength = 21
-            attributes['st'] = strength
-        
-        return prev_attributes, attributes
-    else:
+    # returns the previous and new attribute records (see botl.py).
+    new_attributes = parse_attributes(attr_line)
+    if new_attributes is None:
         raise Exception("No attributes! Attr line was:\n" + attr_line)
+    return attributes, new_attributes
 
 def update_stats(stat_line, stats):
-    m = re.search(r'Dlvl:(?P<dlvl>\S+)\s*'
-                   r'\\\w+:(?P<money>\d+)\s*'
-                   r'HP:(?P<hp>\d+)\((?P<hp_max>\d+)\)\s*'
-                   r'Pw:(?P<pw>\d+)\((?P<pw_max>\d+)\)\s*'
-                   r'AC:(?P<ac>[+-]?\d+)\s*'
-                   r'R:(?P<rooms>\d+)\s*'
-                   r'SD:(?P<sdoor>\d+)\s*'
-                   r'Exp:(?P<exp>\d+)\s*'
-                   r'(?P<hunger>Satiated|Hungry|Weak|Fainting)?\s*'
-                   r'(?P<stun>Stun)?\s*'
-                   r'(?P<conf>Conf)?\s*'
-                   r'(?P<blind>Blind)?\s*'
-                   r'(?P<burden>Burdened|Stressed|Strained|Overtaxed|Overloaded)?\s*'
-                   r'(?P<hallu>Hallu)?\s*', stat_line)
-    if m:
-        prev_stats = deepcopy(stats)
-        stats = m.groupdict()
-        for k, v in stats.items():
-            if v and v.isdigit():
-                stats[k] = int(v)
-        return prev_stats, stats
-    else:
+    # returns the previous and new statistics records (see botl.py).
+    new_stats = parse_stats(stat_line)
+    if new_stats is None:
         raise Exception("No statistics! Stat line was: ", stat_line)
+    return stats, new_stats
 
 def assert_setup(starting_items, inventory, cur_monster, top_line, monster_positions, stats, start_ac):
     verboseprint("Asserting setup...")
@@ -290,10 +358,7 @@ def assert_setup(starting_items, inventory, cur_monster, top_line, monster_posit
     return True
 
 def save_nh_conf(proc_id, secret_rooms=False, character="Bar", race="Human", clvl=1, st=0, dx=0, mtype=None, create_mons=False, ac=999, inven=[], dlvl=1, lyc=None, stateffs=1, adj_mlvl=True, create_items=True, seed=-1):
-    if sys.platform == "win32":
-        sysconf_fname = nethack_dir + DIR_CHAR + "defaults.nh"
-    else:
-        sysconf_fname = nethack_dir + DIR_CHAR + "sysconf" + str(proc_id)
+    sysconf_fname = get_sysconf_fname(proc_id)
     verboseprint("Writing to sysconf file:", sysconf_fname)
     with open(sysconf_fname, 'w') as sysconf:
         sysconf.write("OPTIONS=!autopickup, !bones, pushweapon, pettype:none, time, disclose:-i -a -v -g -c -o, ")
@@ -362,7 +427,7 @@ class Room(object):
         for dx, dy in DIRS:
             cur_x, cur_y = self.nh.cur_pos
             d = 0
-            while self.nh.basemap_char(cur_x+dx, cur_y+dy) not in WALL_CHARS + DOOR_CHARS and self.nh.basemap_char(cur_x+dx, cur_y+dy) not in DOOR_CHARS and (cur_x+dx, cur_y+dy) not in self.nh.room_openings:
+            while self.nh.basemap_char(cur_x+dx, cur_y+dy) not in WALL_OR_DOOR_SET and (cur_x+dx, cur_y+dy) not in self.nh.room_openings:
                 # probably still in a room
 
                 adjacent_chars = self.nh.get_chars_adjacent_to(cur_x+dx, cur_y+dy)
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+# Bounded cache of pathfinding results. The keys include a version number of the grid searched (see NetHackInfo.grid_version),
+# so that paths found on an older grid are never returned; they are evicted like any other entry once unused.
+
+class PathCache(object):
+    """Least-recently-used cache of paths, with hit/miss statistics."""
+    def __init__(self, max_size=4096):
+        """Initialize the cache.
+
+        Args:
+            max_size: maximum number of paths kept (the least recently used one is evicted to make room for a new one)
+        """
+        self.max_size = max_size
+        self.paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """Return (True, path) if the key is cached, else (False, None)."""
+        if key in self.paths:
+            self.paths.move_to_end(key)
+            self.hits += 1
+            return True, self.paths[key]
+        self.misses += 1
+        return False, None
+
+    def store(self, key, path):
+        self.paths[key] = path
+        self.paths.move_to_end(key)
+        if len(self.paths) > self.max_size:
+            self.paths.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all paths (the statistics are kept)."""
+        self.paths.clear()
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.paths), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups > 0 else 0}
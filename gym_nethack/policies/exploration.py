@@ -11,9 +11,10 @@ import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 
 from gym_nethack.nhdata import *
+from gym_nethack.charclass import *
 from gym_nethack.nhutil import Passage
 from gym_nethack.policies.core import ParameterizedPolicy
-from gym_nethack.misc import verboseprint, dfs, is_straight_line_adjacent, get_maximal_rectangle, get_maximal_square, distance_pt
+from gym_nethack.misc import verboseprint, dfs, is_straight_line_adjacent, get_maximal_rectangle, get_maximal_square, pairwise_distances
 
 class MapExplorationPolicy(ParameterizedPolicy):
     """Template map exploration policy."""
@@ -155,7 +156,7 @@ class GreedyExplorationPolicy(MapExplorationPolicy):
         """
         if len(targets) == 0:
             return None
-        dists = [len(self.env.nh.pathfind_to(x, override_target_traversability=True)) for x in targets]
+        dists = [self.env.nh.get_path_length(x, override_target_traversability=True) for x in targets]
         smallest_dist = min(dists)
         smallest_positions = [i for i, j in enumerate(dists) if j == smallest_dist]
         smallest_positions.reverse()
@@ -498,7 +499,7 @@ class GreedyExplorationPolicy(MapExplorationPolicy):
                 # make a new passage for each exit
                 if not self.in_shop:
                     for exit in exits:
-                        self.env.nh.grid[exit[0]][exit[1]] = 0
+                        self.env.nh.set_traversable(exit)
                         if not self.graph.has_node(exit):
                             self.graph.add_node(exit, pos=(exit[1], -exit[0]), visited=True)
                         if self.new_passage_from_room_exit(room_centroid, exit):
@@ -576,7 +577,7 @@ class SecretGreedyExplorationPolicy(GreedyExplorationPolicy):
         total_num_rooms = self.env.total_num_rooms # this is taken from the NH bottom line (R: %d)
     
         non_secret_map_positions = dfs(start=self.env.nh.initial_player_pos,
-                                        passable_func=lambda x, y: self.secret_grid[x][y] == 0 and self.env.nh.basemap_char(x, y) in PASSABLE_CHARS,
+                                        passable_func=lambda x, y: self.secret_grid[x][y] == 0 and self.env.nh.basemap_char(x, y) in PASSABLE_SET,
                                         neighbor_func=lambda x, y, diag: self.env.nh.get_neighboring_positions(x, y, diag),
                                         min_neighbors=0, diag=True)
     
@@ -632,7 +633,7 @@ class SecretGreedyExplorationPolicy(GreedyExplorationPolicy):
         valid_search_targets = [(pos, count) for (pos, count) in self.cur_search_targets if count < self.NUM_SEARCHES_PER_WALL]
         verboseprint("Cur search targets:",valid_search_targets)
         if len(valid_search_targets) > 0: # something to search.
-            dists = [len(self.env.nh.pathfind_to(pos, override_target_traversability=True)) for (pos, count) in valid_search_targets]
+            dists = [self.env.nh.get_path_length(pos, override_target_traversability=True) for (pos, count) in valid_search_targets]
             smallest_dist = min(dists)
             smallest_positions = [i for i, j in enumerate(dists) if j == smallest_dist]
             smallest_positions.reverse()
@@ -642,7 +643,7 @@ class SecretGreedyExplorationPolicy(GreedyExplorationPolicy):
             
             # find adjacent open space to wall
             neighboring_positions = self.env.nh.get_neighboring_positions(*best_wall)
-            traversable_neighbors = [neighbor for neighbor in neighboring_positions if self.env.nh.basemap_char(*neighbor) in PASSABLE_CHARS and neighbor in self.visited_nodes]
+            traversable_neighbors = [neighbor for neighbor in neighboring_positions if self.env.nh.basemap_char(*neighbor) in PASSABLE_SET and neighbor in self.visited_nodes]
             
             # get traversable neighbor that touches highest amount of walls
             neighboring_wall_counts = []
@@ -669,7 +670,7 @@ class SecretGreedyExplorationPolicy(GreedyExplorationPolicy):
             for nx, ny in self.env.nh.get_neighboring_positions(*self.env.nh.cur_pos, diag=True):
                 walls = [wall for (wall, count) in self.cur_search_targets]
                 cur_char = self.env.nh.basemap_char(nx, ny)
-                if (cur_char in WALL_CHARS or cur_char == ' ') and (nx, ny) in walls:
+                if (cur_char in WALL_SET or cur_char == ' ') and (nx, ny) in walls:
                     wall, count = self.cur_search_targets[walls.index((nx, ny))]
                     self.cur_search_targets[walls.index((nx, ny))] = (wall, count+1)
                     verboseprint("      ****** Increasing count of", nx, ny, "(tile:",cur_char,") (count:",count+1,")")
@@ -755,7 +756,7 @@ class SecretGreedyExplorationPolicy(GreedyExplorationPolicy):
                 verboseprint("The exit",exit,"is not next to our visited nodes")
                 continue
             #input("NEW EXIT FOUND")
-            if self.env.nh.basemap_char(x, y) in DOOR_CHARS: #and self.new_passage_from_room_exit(room_centroid, exit):
+            if self.env.nh.basemap_char(x, y) in DOOR_SET: #and self.new_passage_from_room_exit(room_centroid, exit):
                 verboseprint("******",exit, self.env.nh.basemap_char(x, y))
                 self.secret_grid[x][y] = 1
                 
@@ -895,7 +896,7 @@ class OccupancyMapPolicy(GreedyExplorationPolicy):
         mxs, mys = [], []
         for i, row in enumerate(self.env.nh.map):
             for j, col in enumerate(row):
-                if col in MONS_CHARS and (i, j) != self.env.nh.cur_pos and (i, j) not in self.env.nh.item_positions:
+                if col in MONSTER_SET and (i, j) != self.env.nh.cur_pos and (i, j) not in self.env.nh.item_positions:
                     mxs.append(self.GRIDWIDTH-i)
                     mys.append(j)
         
@@ -1052,7 +1053,7 @@ class OccupancyMapPolicy(GreedyExplorationPolicy):
         cell_groupings = []
         for x in range(self.GRIDWIDTH):
             for y in range(self.GRIDHEIGHT):
-                if ((self.grid_probs[x][y] > dfs_threshold and self.env.nh.basemap_char(x, y) not in PASSABLE_CHARS) or ((x, y) in self.new_criticals)) and (x, y) not in visited_cells:
+                if ((self.grid_probs[x][y] > dfs_threshold and self.env.nh.basemap_char(x, y) not in PASSABLE_SET) or ((x, y) in self.new_criticals)) and (x, y) not in visited_cells:
                     connected_cells = self.dfs_threshold_prob((x, y), dfs_threshold)
                     visited_cells.update(connected_cells)
                     cell_groupings.append(connected_cells)
@@ -1097,14 +1098,27 @@ class OccupancyMapPolicy(GreedyExplorationPolicy):
             component: list of positions (tuples)
             position: tuple representing position"""
         
-        best_dist = self.MAX_MANHATTAN_DIST
-        best_cell = (-1, -1)
-        for cell in component:
-            dist = distance_pt(cell, position)
-            if dist < best_dist:
-                best_dist = dist
-                best_cell = cell
-        return best_dist, best_cell
+        return self.get_dists_to_component(component, [position])[0]
+    
+    def get_dists_to_component(self, component, positions):
+        """Get the Manhattan distance from each of the given positions to the closest cell of the given component (the first such cell in the component's order), computed for all positions at once. Returns a list of (distance, closest cell) tuples, (MAX_MANHATTAN_DIST, (-1, -1)) if there is no cell closer than MAX_MANHATTAN_DIST.
+        
+        Args:
+            component: list of positions (tuples)
+            positions: list of tuples representing positions"""
+        
+        cells = list(component)
+        if len(cells) == 0 or len(positions) == 0:
+            return [(self.MAX_MANHATTAN_DIST, (-1, -1))] * len(positions)
+        
+        dists = pairwise_distances(positions, cells)
+        closest = np.argmin(dists, axis=1) # first minimum
+        
+        results = []
+        for i, j in enumerate(closest):
+            dist = int(dists[i, j])
+            results.append((dist, cells[j]) if dist < self.MAX_MANHATTAN_DIST else (self.MAX_MANHATTAN_DIST, (-1, -1)))
+        return results
     
     def get_frontier_near_component(self, component, frontiers, frontier_dists_to_player):
         """Get the frontier closest to both the given component and to the player.
@@ -1121,8 +1135,9 @@ class OccupancyMapPolicy(GreedyExplorationPolicy):
         
         dists = []
         closest_cells = []
+        dists_to_component = self.get_dists_to_component(component, frontiers)
         for i, frontier in enumerate(frontiers):
-            dist_frontier_cell, closest_cell = self.get_dist_to_component(component, frontier)
+            dist_frontier_cell, closest_cell = dists_to_component[i]
             closest_cells.append(closest_cell)
             if any(cr in component for cr in self.new_criticals):
                 verboseprint("F", frontier, "cc", closest_cell, "CRIT. dist:", dist_frontier_cell)
@@ -1186,7 +1201,7 @@ class OccupancyMapPolicy(GreedyExplorationPolicy):
         Args:
             target: position (tuple)"""
         if target not in self.distances_to_player:
-            self.distances_to_player[target] = len(self.env.nh.pathfind_to(target, override_target_traversability=True))
+            self.distances_to_player[target] = self.env.nh.get_path_length(target, override_target_traversability=True)
         if self.env.parse_items and target in self.env.nh.item_positions:
             return (self.distances_to_player[target])/4
         return self.distances_to_player[target]
@@ -1481,7 +1496,7 @@ class OccupancyMapPolicy(GreedyExplorationPolicy):
                 # make a new passage for each exit
                 if not self.in_shop:
                     for exit in exits:
-                        self.env.nh.grid[exit[0]][exit[1]] = 0
+                        self.env.nh.set_traversable(exit)
                         if not self.graph.has_node(exit):
                             self.graph.add_node(exit, pos=(exit[1], -exit[0]), visited=True)
                         if self.new_passage_from_room_exit(room_centroid, exit):
@@ -1602,7 +1617,7 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
         total_num_rooms = self.env.total_num_rooms # this is taken from the NH bottom line (R: %d)
     
         non_secret_map_positions = dfs(start=self.env.nh.initial_player_pos,
-                                        passable_func=lambda x, y: self.secret_grid[x][y] == 0 and self.env.nh.basemap_char(x, y) in PASSABLE_CHARS,
+                                        passable_func=lambda x, y: self.secret_grid[x][y] == 0 and self.env.nh.basemap_char(x, y) in PASSABLE_SET,
                                         neighbor_func=lambda x, y, diag: self.env.nh.get_neighboring_positions(x, y, diag),
                                         min_neighbors=0, diag=True)
     
@@ -1718,7 +1733,7 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
             for walls in self.room_walls:
                 room_walls.extend(walls)
         room_walls.extend(self.dead_end_walls)
-        room_walls = list(set([pos for pos in room_walls if self.env.nh.basemap_char(*pos) in WALL_CHARS]))
+        room_walls = list(set([pos for pos in room_walls if self.env.nh.basemap_char(*pos) in WALL_SET]))
         assert all(isinstance(wall, tuple) for wall in room_walls)
         verboseprint("Walls considered for comp", len(component), ": ", room_walls)
         
@@ -1728,8 +1743,8 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
                 self.wall_counts.append(0)
                 
         closest_walls = []
-        for frontier in room_walls:
-            dist_frontier_cell, closest_cell = self.get_dist_to_component(component, frontier)
+        dists_to_component = self.get_dists_to_component(component, room_walls)
+        for frontier, (dist_frontier_cell, closest_cell) in zip(room_walls, dists_to_component):
             
             if dist_frontier_cell > self.MAX_WALL_DIST_TO_CELL:
                 #verboseprint("Wall", frontier, "too far away (", dist_frontier_cell, ")")
@@ -1802,7 +1817,7 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
         
         # now get room pos next to it.
         neighboring_positions = self.env.nh.get_neighboring_positions(*best_wall)
-        traversable_neighbors = [neighbor for neighbor in neighboring_positions if self.env.nh.basemap_char(*neighbor) in PASSABLE_CHARS]
+        traversable_neighbors = [neighbor for neighbor in neighboring_positions if self.env.nh.basemap_char(*neighbor) in PASSABLE_SET]
         verboseprint("Traversable neighbors of wall: ", traversable_neighbors, [self.env.nh.basemap_char(x, y) for x, y in traversable_neighbors])
         
         # get traversable neighbor that touches highest amount of walls
@@ -1829,7 +1844,7 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
             self.searching_action_count += 1
             
             for nx, ny in self.env.nh.get_neighboring_positions(*self.env.nh.cur_pos, diag=True):
-                if (self.env.nh.basemap_char(nx, ny) in WALL_CHARS and (nx, ny) in self.walls) or (self.env.nh.basemap_char(nx, ny) == ' ' and (nx, ny) in self.dead_end_walls):
+                if (self.env.nh.basemap_char(nx, ny) in WALL_SET and (nx, ny) in self.walls) or (self.env.nh.basemap_char(nx, ny) == ' ' and (nx, ny) in self.dead_end_walls):
                     self.wall_counts[self.walls.index((nx, ny))] += 1
                     verboseprint("      ****** Increasing count of", nx, ny, "(tile:",self.env.nh.basemap_char(nx, ny),") (count:",self.wall_counts[self.walls.index((nx, ny))],")")
             
@@ -1882,7 +1897,7 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
             if not any(neighbor == self.env.nh.cur_pos for neighbor in changed_wall_neighbors):
                 verboseprint("The exit",exit,"is not next to our visited nodes")
                 continue
-            if self.env.nh.basemap_char(x, y) in DOOR_CHARS:
+            if self.env.nh.basemap_char(x, y) in DOOR_SET:
                 verboseprint("******",exit, self.env.nh.basemap_char(x, y))
                 self.secret_grid[x][y] = 1
                 self.add_to_frontier_list(exit) # we found a new passage (or new exit)
@@ -1909,8 +1924,6 @@ class SecretOccupancyMapPolicy(OccupancyMapPolicy):
             self.normalize_and_diffuse(p_culled)
             self.update_needed = True
             self.grid_needs_updating = True
-            self.env.pathfind_distances = {}
-            self.pathfind2_distances = {}
         
         super().observe_action()
 
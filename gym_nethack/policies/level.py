@@ -1,6 +1,7 @@
 from collections import deque
 
 from gym_nethack.nhdata import CMD
+from gym_nethack.charclass import MONSTER_SET
 from gym_nethack.misc import verboseprint
 from gym_nethack.policies.core import Policy
 
@@ -58,7 +59,7 @@ class LevelPolicy(Policy):
             # add monster tiles to frontier
             for i, row in enumerate(self.env.nh.map):
                 for j, col in enumerate(row):
-                    if col in MONS_CHARS:
+                    if col in MONSTER_SET:
                         possibilities.append((i, j))
     
             # add masking dungeon features
@@ -69,8 +70,8 @@ class LevelPolicy(Policy):
             
             self.exploration_policy.frontier_list.extend(possibilities)
         
-            frontier_paths_to_player = [(self.env.nh.pathfind_to(frontier, override_target_traversability=True), frontier) for frontier in self.exploration_policy.frontier_list]
-            frontier_dists_to_player = [(len(path), frontier) for path, frontier in frontier_paths_to_player if len(path) > 0]
+            frontier_dists_to_player = [(self.env.nh.get_path_length(frontier, override_target_traversability=True), frontier) for frontier in self.exploration_policy.frontier_list]
+            frontier_dists_to_player = [(dist, frontier) for dist, frontier in frontier_dists_to_player if dist > 0]
             
             exit_pos = min(frontier_dists_to_player)[1]
         
@@ -11,33 +11,195 @@ from gym_nethack.misc import distance_pt as heuristic
 #def heuristic(a, b):
 #    return abs(b[0] - a[0]) + abs(b[1] - a[1]) # manhattan
 
-#todo: if current node is visible (i.e. 0) but not in explored_set, make it cheaper (or make others more expensive)
+NEIGHBORS_DIAG = [(0,1),(0,-1),(1,0),(-1,0),(1,1),(1,-1),(-1,1),(-1,-1)]
+NEIGHBORS = [(0,1),(0,-1),(1,0),(-1,0)]
+
+class SearchTables(object):
+    # per grid shape: coordinates and in-bounds neighbours of each cell (by flat index x*cols+y), and the scratch arrays of the searches.
+    # the scratch arrays are not cleared between searches: an entry is only valid if its stamp is the id of the current search.
+    def __init__(self, rows, cols, diag):
+        self.cols = cols
+        self.coords = [(x, y) for x in range(rows) for y in range(cols)]
+        self.xs = [x for x, y in self.coords]
+        self.ys = [y for x, y in self.coords]
+        self.neighbors = []
+        for x, y in self.coords:
+            cell_neighbors = []
+            for i, j in (NEIGHBORS_DIAG if diag else NEIGHBORS):
+                if 0 <= x + i < rows and 0 <= y + j < cols:
+                    diagonal = abs(i) == 1 and abs(j) == 1
+                    # (flat index, step cost, adjustment if the neighbor is not in explored_set)
+                    cell_neighbors.append(((x + i) * cols + (y + j), 2 if diagonal else 1, 0.5 if diagonal else -0.5))
+            self.neighbors.append(cell_neighbors)
+        self.gscore = [0] * (rows * cols)
+        self.came_from = [0] * (rows * cols)
+        self.stamp = [0] * (rows * cols) # id of the last search that reached the cell
+        self.search_id = 0
+        self.num_expanded = 0 # number of cells expanded by the last search
+
+search_tables = {}
+
+def get_search_tables(shape, diag):
+    key = (shape, diag)
+    if key not in search_tables:
+        search_tables[key] = SearchTables(shape[0], shape[1], diag)
+    return search_tables[key]
+
 def astar(array, start, goal, diag=True, explored_set=None):
+    # same search and result as astar_reference() (including the order in which equal-cost nodes are expanded, so the same path is
+    # returned), but with the scores and parents in flat arrays, and stale heap entries skipped when popped instead of the open set
+    # being scanned for every neighbor.
+    rows, cols = array.shape
+    tables = get_search_tables((rows, cols), diag)
+    tables.search_id += 1
+    search_id = tables.search_id
+    blocked = (numpy.asarray(array) == 1).ravel().tolist()
+    coords, xs, ys, neighbors = tables.coords, tables.xs, tables.ys, tables.neighbors
+    gscore, came_from, stamp = tables.gscore, tables.came_from, tables.stamp
+    
+    gx, gy = goal
+    start_idx = start[0] * cols + start[1]
+    goal_idx = gx * cols + gy
+    gscore[start_idx] = 0
+    stamp[start_idx] = search_id
+    open_heap = [(abs(gx - start[0]) + abs(gy - start[1]), start_idx)] # (fscore, flat index): ties are broken like (fscore, (x, y))
+    num_expanded = 0
+    
+    while open_heap:
+        fscore, current = heappop(open_heap)
+        current_g = gscore[current]
+        if fscore != current_g + abs(gx - xs[current]) + abs(gy - ys[current]):
+            continue # stale entry: the node was reached more cheaply after it was pushed (and already expanded with that cost)
+        num_expanded += 1
+        
+        if current == goal_idx:
+            tables.num_expanded = num_expanded
+            data = []
+            while current != start_idx: # reconstruct path
+                data.append(coords[current])
+                current = came_from[current]
+            return data
+        
+        for neighbor, cost, unexplored_adjustment in neighbors[current]:
+            if blocked[neighbor]:
+                continue
+            tentative_g_score = current_g + cost
+            if explored_set is not None and coords[neighbor] not in explored_set:
+                tentative_g_score += unexplored_adjustment
+            if stamp[neighbor] == search_id and tentative_g_score >= gscore[neighbor]:
+                continue # already reached at least as cheaply (whether still open or closed)
+            stamp[neighbor] = search_id
+            gscore[neighbor] = tentative_g_score
+            came_from[neighbor] = current
+            heappush(open_heap, (tentative_g_score + abs(gx - xs[neighbor]) + abs(gy - ys[neighbor]), neighbor))
+    
+    tables.num_expanded = num_expanded
+    return False # couldn't find a path
 
+MAX_STEPS = 1 << 16 # paths are compared on cost * MAX_STEPS + number of steps
+
+class DistanceField(object):
+    # cheapest paths from a start cell to every cell reachable from it (Dijkstra), with the step costs of astar() without explored_set:
+    # one search answers the path and distance queries to any number of targets. among the paths of least cost, the one with the fewest
+    # steps is kept (astar() returns any of them).
+    def __init__(self, array, start, diag=True):
+        rows, cols = array.shape
+        self.tables = get_search_tables((rows, cols), diag)
+        self.start_idx = start[0] * cols + start[1]
+        neighbors = self.tables.neighbors
+        self.blocked = blocked = (numpy.asarray(array) == 1).ravel().tolist()
+        self.key = key = [None] * (rows * cols) # cost * MAX_STEPS + steps of the best path found to each cell
+        self.came_from = came_from = [-1] * (rows * cols)
+        
+        key[self.start_idx] = 0
+        open_heap = [(0, self.start_idx)]
+        while open_heap:
+            current_key, current = heappop(open_heap)
+            if current_key != key[current]:
+                continue # stale entry
+            for neighbor, cost, _ in neighbors[current]:
+                if blocked[neighbor]:
+                    continue
+                tentative_key = current_key + cost * MAX_STEPS + 1
+                if key[neighbor] is None or tentative_key < key[neighbor]:
+                    key[neighbor] = tentative_key
+                    came_from[neighbor] = current
+                    heappush(open_heap, (tentative_key, neighbor))
+    
+    def get_last_step(self, goal_idx, override_goal):
+        # (key, previous cell) of the best path to the goal, or None if it cannot be reached. if override_goal, a goal marked as impassable
+        # is treated as passable (the path then ends with a step from its best reached neighbor).
+        if self.key[goal_idx] is not None:
+            return self.key[goal_idx], self.came_from[goal_idx]
+        if not override_goal or not self.blocked[goal_idx]:
+            return None
+        best = None
+        for neighbor, cost, _ in self.tables.neighbors[goal_idx]:
+            if self.key[neighbor] is not None:
+                candidate = (self.key[neighbor] + cost * MAX_STEPS + 1, neighbor)
+                if best is None or candidate < best:
+                    best = candidate
+        return best
+    
+    def get_path(self, goal, override_goal=False):
+        # path to the goal in the format of astar(): from the goal back to the first step (the start is not included), or False.
+        goal_idx = goal[0] * self.tables.cols + goal[1]
+        if goal_idx == self.start_idx:
+            return []
+        last_step = self.get_last_step(goal_idx, override_goal)
+        if last_step is None:
+            return False
+        data = [self.tables.coords[goal_idx]]
+        current = last_step[1]
+        while current != self.start_idx:
+            data.append(self.tables.coords[current])
+            current = self.came_from[current]
+        return data
+    
+    def get_num_steps(self, goal, override_goal=False):
+        # len(get_path(goal, override_goal)), without building the path; None if the goal cannot be reached.
+        goal_idx = goal[0] * self.tables.cols + goal[1]
+        if goal_idx == self.start_idx:
+            return 0
+        last_step = self.get_last_step(goal_idx, override_goal)
+        return None if last_step is None else last_step[0] % MAX_STEPS
+    
+    def get_cost(self, goal, override_goal=False):
+        # cost of the path to the goal (diagonal steps count 2), or None if it cannot be reached.
+        goal_idx = goal[0] * self.tables.cols + goal[1]
+        if goal_idx == self.start_idx:
+            return 0
+        last_step = self.get_last_step(goal_idx, override_goal)
+        return None if last_step is None else last_step[0] // MAX_STEPS
+
+#todo: if current node is visible (i.e. 0) but not in explored_set, make it cheaper (or make others more expensive)
+def astar_reference(array, start, goal, diag=True, explored_set=None):
+    # original implementation, with dicts of scores and a scan of the open heap for every neighbor. kept to check astar() against.
+    
     if diag:
         neighbors = [(0,1),(0,-1),(1,0),(-1,0),(1,1),(1,-1),(-1,1),(-1,-1)]
     else:
         neighbors = [(0,1),(0,-1),(1,0),(-1,0)]
-
+    
     closed_set = set() # set of nodes already evaluated
     came_from = {} # set of discovered nodes to be evaluated
     gscore = {start:0} # cost of going from start to start is 0
     fscore = {start:heuristic(start, goal)} # cost from start to goal starts at heuristic estimate
     open_heap = []
-
+    
     heappush(open_heap, (fscore[start], start)) # add start node to open set along with best guess
     
     while open_heap: # while there are still nodes on the open heap
-
+        
         current = heappop(open_heap)[1] # get the smallest node in the heap ([1]->node instead of fscore)
-
+        
         if current == goal: # if reached goal 
             data = []
             while current in came_from: # reconstruct path
                 data.append(current)
                 current = came_from[current]
             return data # finished
-
+        
         closed_set.add(current) # add current node to explored set
         for i, j in neighbors: # for each neighbor of the current node
             neighbor = current[0] + i, current[1] + j
@@ -55,17 +217,17 @@ def astar(array, start, goal, diag=True, explored_set=None):
                     continue
             else: # invalid cell (goes past x limits)
                 continue
-                
+            
             if neighbor in closed_set and tentative_g_score >= gscore.get(neighbor, 0):
                 continue # explored already and we reached it cheaper than current gscore
-                
+            
             if tentative_g_score < gscore.get(neighbor, 0) or neighbor not in [i[1] for i in open_heap]:
                 # we didn't discover this neighbor before or we can get to it cheaper than before
                 came_from[neighbor] = current # update the parent list
                 gscore[neighbor] = tentative_g_score
                 fscore[neighbor] = tentative_g_score + heuristic(neighbor, goal)
                 heappush(open_heap, (fscore[neighbor], neighbor)) # add neighbor to the open set
-                
+    
     return False # couldn't find a path
 
 '''Here is an example of using my algo with a numpy array,
@@ -84,6 +246,6 @@ nmap = numpy.array([
     [0,0,0,0,0,0,0,0,0,0,0,0,0,0],
     [1,1,1,1,1,1,1,1,1,1,1,1,0,1],
     [0,0,0,0,0,0,0,0,0,0,0,0,0,0]])
-    
+
 print(astar(nmap, (0,0), (10,13)))
 '''
\ No newline at end of file
@@ -115,10 +115,10 @@ if __name__ == '__main__':
     CONFIGNUM specifies the index into the configs.py config list. (e.g., 0, 1, 2, 3...)
     
     PROCID specifies the process number.
-    If none is specified, it is set to the same as CONFIGNUM (in that case, you would give the nhdaemon the confignum as procid argument).
+    If none is specified, it is set to the same as CONFIGNUM. Processes running at the same time must have different PROCIDs (they can share one nhdaemon).
     
     NUMPROCS specifies the total number of processes. It is set to 1 by default.
-    If set to 1, then after each nethack game ends and the process exits, we can clean up for better stability by killall'ing nethack and removing lock files (see base.py::NetHackEnv::reset() method).
+    (NetHack processes are killed and their lock files removed by the daemon that launched them, so several processes can share a machine; see nhdaemon.py::NetHackSupervisor.)
     """
     proc_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
     config_id = int(sys.argv[2]) if len(sys.argv) > 2 else proc_id 
@@ -0,0 +1,51 @@
+from gym_nethack.nhdata import message_changes_inventory
+from gym_nethack.envs.base import NetHackInfo
+
+ORDINARY_MESSAGES = [
+    "You hit the jackal.",
+    "The jackal bites!  You kill the jackal!",
+    "The grid bug misses.  You miss the grid bug.",
+    "The kobold throws a crude dagger!  You are hit by a crude dagger.",
+    "You see here a rusty dagger.",
+    "There are several objects here.",
+    "The door opens.",
+    "You hear some noises in the distance.",
+    "Welcome to experience level 2.",
+    "Your movements are slowed slightly because of your load.",
+    "The gas spore explodes!",
+    "The parrots squawk.  You feel a strange vibration under your feet.",
+    "",
+]
+
+INVENTORY_CHANGING_MESSAGES = [
+    "The nymph stole a +1 dagger.",
+    "The monkey snatches an apple!",
+    "Your long sword rusts!",
+    "Your cloak smoulders!",
+    "Your potion of healing boils and explodes!",
+    "Your scroll of identify catches fire and burns!",
+    "Your dagger slips from your hands.",
+    "Your purse feels lighter.",
+]
+
+def make_cached_info():
+    # an info object with a cached inventory, as after a step on which the inventory was asked for.
+    nh = NetHackInfo(parse_items=True)
+    nh.reset()
+    nh.set_inventory_caching(True)
+    nh.inventory = [('a', 'dagger')]
+    nh.inventory_stale = False
+    return nh
+
+def test_ordinary_messages_keep_the_cache():
+    for top_line in ORDINARY_MESSAGES:
+        assert not message_changes_inventory(top_line), top_line
+        nh = make_cached_info()
+        nh.top_line = top_line
+        nh.update_inventory(None) # asking NetHack for the inventory would fail without a socket
+        assert nh.steps_since_inventory == 1
+        assert nh.inventory == [('a', 'dagger')]
+
+def test_inventory_messages_invalidate_the_cache():
+    for top_line in INVENTORY_CHANGING_MESSAGES:
+        assert message_changes_inventory(top_line), top_line